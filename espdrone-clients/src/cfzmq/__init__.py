@@ -27,18 +27,50 @@
 
 """
 Server used to connect to a Espdrone using ZMQ.
+
+Log data and parameter updates are published as JSON by default. With the
+binary wire format they are published as multipart messages prefixed with a
+topic, so subscribers can filter on drone and log block in ZMQ without
+decoding anything:
+
+    [b"log/<uri>/<block name>", b"schema", <JSON schema>]
+    [b"log/<uri>/<block name>", b"data", <packed samples>]
+    [b"log/<uri>/<block name>", b"event", <JSON event>]
+    [b"param/<uri>/<group.name>", b"value", <little endian double>]
+
+The schema is published when a log block is created or started and can be
+requested with the log "schema" command. It holds the NumPy type of one
+sample, the data frames are one or more samples packed back to back:
+
+    dtype = numpy.dtype([tuple(f) for f in schema["fields"]])
+    samples = numpy.frombuffer(frames[2], dtype)
+
+Samples can be batched in frames of a number of samples and/or a time
+period, the last frame is published when the block is stopped or deleted.
+
+The command socket is a ROUTER socket, commands are handled asynchronously
+and replies are sent when the Espdrone has answered. Commands can carry an
+"id" that is copied to the reply and an "uri" that selects the Espdrone when
+the server is connected to more than one. Several parameters are set in one
+command with "values": {"group.name": value, ...}.
 """
 
 import sys
 import os
+import json
+import queue
 import logging
 import signal
+import struct
+import threading
 import zmq
-import queue
+from threading import Lock
 from threading import Thread
+import numpy
 import edlib.crtp
 from edlib.espdrone import Espdrone
 from edlib.espdrone.log import LogConfig
+from edlib.utils.scheduler import shared_scheduler
 
 import edclient
 
@@ -70,68 +102,171 @@ CONNECT_TIMEOUT = 5
 # Timeout before giving up adding/starting log config
 LOG_TIMEOUT = 10
 
-logger = logging.getLogger(__name__)
-
+# Wire formats for log data and parameter updates
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
 
-class _SrvThread(Thread):
+_PARAM_VALUE = struct.Struct("<d")
 
-    def __init__(self, socket, log_socket, param_socket, conn_socket, cf,
-                 *args):
-        super(_SrvThread, self).__init__(*args)
-        self._socket = socket
-        self._log_socket = log_socket
-        self._param_socket = param_socket
-        self._conn_socket = conn_socket
-        self._cf = cf
+logger = logging.getLogger(__name__)
 
-        self._cf.connected.add_callback(self._connected)
-        self._cf.connection_failed.add_callback(self._connection_failed)
-        self._cf.connection_lost.add_callback(self._connection_lost)
-        self._cf.disconnected.add_callback(self._disconnected)
-        self._cf.connection_requested.add_callback(self._connection_requested)
-        self._cf.param.all_updated.add_callback(self._tocs_updated)
-        self._cf.param.all_update_callback.add_callback(self._all_param_update)
 
-        self._conn_queue = queue.Queue(1)
-        self._param_queue = queue.Queue(1)
-        self._log_started_queue = queue.Queue(1)
-        self._log_added_queue = queue.Queue(1)
+class _LogPublisher():
+    """
+    Packs the samples of a log block in binary frames and publishes them,
+    batched on count and/or time. With a batch period the pending samples
+    are flushed from a timer, so they are published even if no more samples
+    arrive. Call close() when the publisher is no longer used.
+    """
 
-        self._logging_configs = {}
+    def __init__(self, socket, topic, conf, batch_count=1,
+                 batch_period=None):
+        self._socket = socket
+        self._topic = topic.encode("utf-8")
+        self._conf = conf
+        self._batch_count = max(1, batch_count)
+        self._batch_period = batch_period / 1000.0 if batch_period else None
+        self._lock = Lock()
+        self._dtype = None
+        self._samples = None
+        self._count = 0
+        self._timer = None
+        if self._batch_period is not None:
+            self._timer = shared_scheduler().call_periodic(
+                self._batch_period, self.flush)
+
+    def schema(self):
+        """The schema of the data frames as a dict"""
+        if self._dtype is None:
+            self._dtype = numpy.dtype(
+                [("timestamp", "<u8"), ("host_timestamp", "<f8")] +
+                self._conf.get_dtype().descr)
+        return {"version": 1, "name": self._conf.name,
+                "period": self._conf.period_in_ms,
+                "fields": self._dtype.descr}
+
+    def publish_schema(self):
+        self._socket.send_multipart(
+            [self._topic, b"schema",
+             json.dumps(self.schema()).encode("utf-8")])
+
+    def publish_event(self, event):
+        self._socket.send_multipart(
+            [self._topic, b"event", json.dumps(event).encode("utf-8")])
+
+    def add(self, ts, host_ts, data, conf):
+        """Add a sample, data is a tuple in variable order"""
+        with self._lock:
+            if self._samples is None:
+                self.schema()
+                self._samples = numpy.zeros(self._batch_count, self._dtype)
+            self._samples[self._count] = (
+                (ts, host_ts if host_ts is not None else numpy.nan) +
+                tuple(data))
+            self._count += 1
+            if self._count == self._batch_count:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Stop the batch timer and publish the pending samples"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self.flush()
+
+    def _flush(self):
+        if self._count:
+            self._socket.send_multipart(
+                [self._topic, b"data",
+                 self._samples[:self._count].tobytes()])
+            self._count = 0
+
+
+class _Request():
+    """A command waiting for its reply"""
+
+    def __init__(self, envelope, cmd):
+        self.envelope = envelope
+        self.id = cmd.get("id")
+        self.timer = None
+        self.done = False
+
+
+class _ParamBatch():
+    """Parameter writes that are replied to when all have been confirmed"""
+
+    def __init__(self, request, names, single):
+        self.request = request
+        self.remaining = set(names)
+        self.values = {}
+        self.single = single
+
+
+class _DroneSession():
+    """
+    An Espdrone served by the server and the commands waiting for it. The
+    session and its Espdrone are kept after a disconnect and reused when
+    connecting to the same URI again.
+    """
+
+    def __init__(self, srv, uri, cf):
+        self._srv = srv
+        self.uri = uri
+        self.cf = cf
+        self.is_open = False
+
+        self.logging_configs = {}
+        self.log_publishers = {}
+
+        # Requests waiting for the connection, log block events (keyed on
+        # block name and "added"/"started") and param writes (keyed on name)
+        self._lock = Lock()
+        self._pending_connect = []
+        self._pending_log = {}
+        self._pending_param = {}
+
+        cf.connected.add_callback(self._connected)
+        cf.connection_failed.add_callback(self._connection_failed)
+        cf.connection_lost.add_callback(self._connection_lost)
+        cf.disconnected.add_callback(self._disconnected)
+        cf.connection_requested.add_callback(self._connection_requested)
+        cf.param.all_updated.add_callback(self._tocs_updated)
+        cf.param.all_update_callback.add_callback(self._param_updated)
+
+    def _conn_event(self, event, **kwargs):
+        conn_ev = {"version": 1, "event": event, "uri": self.uri}
+        conn_ev.update(kwargs)
+        self._srv.publish_conn(conn_ev)
 
     def _connection_requested(self, uri):
-        conn_ev = {"version": 1, "event": "requested", "uri": uri}
-        self._conn_socket.send_json(conn_ev)
+        self._conn_event("requested")
 
     def _connected(self, uri):
-        conn_ev = {"version": 1, "event": "connected", "uri": uri}
-        self._conn_socket.send_json(conn_ev)
+        self._conn_event("connected")
 
     def _connection_failed(self, uri, msg):
         logger.info("Connection failed to {}: {}".format(uri, msg))
-        resp = {"version": 1, "status": 1, "msg": msg}
-        self._conn_queue.put_nowait(resp)
-        conn_ev = {"version": 1, "event": "failed", "uri": uri, "msg": msg}
-        self._conn_socket.send_json(conn_ev)
+        self._reply_connect({"version": 1, "status": 1, "msg": msg})
+        self._conn_event("failed", msg=msg)
 
     def _connection_lost(self, uri, msg):
-        conn_ev = {"version": 1, "event": "lost", "uri": uri, "msg": msg}
-        self._conn_socket.send_json(conn_ev)
+        self._conn_event("lost", msg=msg)
 
     def _disconnected(self, uri):
-        conn_ev = {"version": 1, "event": "disconnected", "uri": uri}
-        self._conn_socket.send_json(conn_ev)
+        self._conn_event("disconnected")
 
-    def _tocs_updated(self):
-        # First do the log
-        log_toc = self._cf.log.toc.toc
+    def tocs(self):
+        """The log and param TOCs with the param values"""
+        log_toc = self.cf.log.toc.toc
         log = {}
         for group in log_toc:
             log[group] = {}
             for name in log_toc[group]:
                 log[group][name] = {"type": log_toc[group][name].ctype}
-        # The the params
-        param_toc = self._cf.param.toc.toc
+        param_toc = self.cf.param.toc.toc
         param = {}
         for group in param_toc:
             param[group] = {}
@@ -140,207 +275,507 @@ class _SrvThread(Thread):
                     "type": param_toc[group][name].ctype,
                     "access": "RW" if param_toc[group][
                         name].access == 0 else "RO",
-                    "value": self._cf.param.values[group][name]}
-
-        resp = {"version": 1, "status": 0, "log": log, "param": param}
-        self._conn_queue.put_nowait(resp)
-
-    def _handle_scanning(self):
-        resp = {"version": 1}
-        interfaces = edlib.crtp.scan_interfaces()
-        resp["interfaces"] = []
-        for i in interfaces:
-            resp["interfaces"].append({"uri": i[0], "info": i[1]})
-        return resp
+                    "value": str(self.cf.param.values[group][name])}
+        return {"log": log, "param": param}
 
-    def _handle_connect(self, uri):
-        self._cf.open_link(uri)
-        return self._conn_queue.get(block=True)
+    def _tocs_updated(self):
+        resp = {"version": 1, "status": 0, "uri": self.uri}
+        resp.update(self.tocs())
+        self._reply_connect(resp)
+
+    def _reply_connect(self, resp):
+        with self._lock:
+            requests = self._pending_connect
+            self._pending_connect = []
+        for request in requests:
+            self._srv.reply(request, resp)
+
+    def connect(self, request):
+        if self.cf.is_connected() and self.cf.param.is_updated:
+            resp = {"version": 1, "status": 0, "uri": self.uri}
+            resp.update(self.tocs())
+            self._srv.reply(request, resp)
+            return
+        with self._lock:
+            self._pending_connect.append(request)
+            opening = len(self._pending_connect) > 1
+        self._srv.set_timeout(request, CONNECT_TIMEOUT, {
+            "version": 1, "status": 2,
+            "msg": "Timeout when connecting to {}".format(self.uri)})
+        if not opening:
+            self.cf.open_link(self.uri)
+
+    def close(self):
+        """Close the link, the log configurations are forgotten"""
+        self.cf.close_link()
+        self.logging_configs.clear()
+        for publisher in self.log_publishers.values():
+            publisher.close()
+        self.log_publishers.clear()
+
+    def _wait_log(self, request, name, kind, timeout_msg):
+        with self._lock:
+            self._pending_log.setdefault((name, kind), []).append(request)
+        self._srv.set_timeout(request, LOG_TIMEOUT, {
+            "version": 1, "status": 2, "msg": timeout_msg})
+
+    def _reply_log(self, name, kind, resp):
+        with self._lock:
+            requests = self._pending_log.pop((name, kind), [])
+        for request in requests:
+            self._srv.reply(request, resp)
 
     def _logging_started(self, conf, started):
-        out = {"version": 1, "name": conf.name}
+        out = {"version": 1, "name": conf.name, "uri": self.uri}
+        publisher = self.log_publishers.get(conf.name)
         if started:
             out["event"] = "started"
+            if publisher:
+                publisher.publish_schema()
         else:
             out["event"] = "stopped"
-        self._log_socket.send_json(out)
-        self._log_started_queue.put_nowait(started)
+            if publisher:
+                publisher.flush()
+        self._publish_log_event(conf, out)
+        self._reply_log(conf.name, "started", {"version": 1, "status": 0})
 
     def _logging_added(self, conf, added):
-        out = {"version": 1, "name": conf.name}
+        out = {"version": 1, "name": conf.name, "uri": self.uri}
+        publisher = self.log_publishers.get(conf.name)
         if added:
             out["event"] = "created"
+            if publisher:
+                publisher.publish_schema()
         else:
             out["event"] = "deleted"
-        self._log_socket.send_json(out)
-        self._log_added_queue.put_nowait(added)
+            if publisher:
+                publisher.close()
+            self.log_publishers.pop(conf.name, None)
+        self._publish_log_event(conf, out)
+        self._reply_log(conf.name, "added", {"version": 1, "status": 0})
+
+    def _logging_error(self, conf, msg):
+        resp = {"version": 1, "status": 3, "msg": msg}
+        self._reply_log(conf.name, "added", resp)
+        self._reply_log(conf.name, "started", resp)
+
+    def _publish_log_event(self, conf, out):
+        publisher = self.log_publishers.get(conf.name)
+        if publisher:
+            publisher.publish_event(out)
+        else:
+            self._srv.publish_log_json(out)
+
+    def _logdata_callback(self, ts, data, conf):
+        # The data dict is created for each packet, no need to copy it
+        out = {"version": 1, "name": conf.name, "event": "data",
+               "uri": self.uri, "timestamp": ts, "variables": data}
+        self._srv.publish_log_json(out)
 
-    def _handle_logging(self, data):
+    def handle_logging(self, request, data):
+        srv = self._srv
         resp = {"version": 1}
         if data["action"] == "create":
-            lg = LogConfig(data["name"], data["period"])
+            if srv.wire_format == FORMAT_BINARY:
+                lg = LogConfig(data["name"], data["period"],
+                               data_format=LogConfig.FORMAT_TUPLE)
+            else:
+                lg = LogConfig(data["name"], data["period"])
             for v in data["variables"]:
                 lg.add_variable(v)
             lg.started_cb.add_callback(self._logging_started)
             lg.added_cb.add_callback(self._logging_added)
+            lg.error_cb.add_callback(self._logging_error)
             try:
-                lg.data_received_cb.add_callback(self._logdata_callback)
-                self._logging_configs[data["name"]] = lg
-                self._cf.log.add_config(lg)
+                if srv.wire_format == FORMAT_BINARY:
+                    publisher = srv.create_log_publisher(
+                        "log/{}/{}".format(self.uri, data["name"]), lg,
+                        data.get("batch_count"), data.get("batch_period"))
+                    self.log_publishers[data["name"]] = publisher
+                    lg.sample_received_cb.add_callback(publisher.add)
+                else:
+                    lg.data_received_cb.add_callback(self._logdata_callback)
+                self.logging_configs[data["name"]] = lg
+                self.cf.log.add_config(lg)
+                self._wait_log(request, data["name"], "added",
+                               "Log configuration did not start")
                 lg.create()
-                self._log_added_queue.get(block=True, timeout=LOG_TIMEOUT)
-                resp["status"] = 0
+                return
             except KeyError as e:
                 resp["status"] = 1
                 resp["msg"] = str(e)
             except AttributeError as e:
                 resp["status"] = 2
                 resp["msg"] = str(e)
-            except queue.Empty:
-                resp["status"] = 3
-                resp["msg"] = "Log configuration did not start"
-        if data["action"] == "start":
-            try:
-                self._logging_configs[data["name"]].start()
-                self._log_started_queue.get(block=True, timeout=LOG_TIMEOUT)
-                resp["status"] = 0
-            except KeyError as e:
-                resp["status"] = 1
-                resp["msg"] = "{} config not found".format(str(e))
-            except queue.Empty:
-                resp["status"] = 2
-                resp["msg"] = "Log configuration did not stop"
-        if data["action"] == "stop":
+            self.logging_configs.pop(data["name"], None)
+            publisher = self.log_publishers.pop(data["name"], None)
+            if publisher:
+                publisher.close()
+        elif data["action"] in ("start", "stop", "delete"):
             try:
-                self._logging_configs[data["name"]].stop()
-                self._log_started_queue.get(block=True, timeout=LOG_TIMEOUT)
-                resp["status"] = 0
+                lg = self.logging_configs[data["name"]]
             except KeyError as e:
                 resp["status"] = 1
                 resp["msg"] = "{} config not found".format(str(e))
-            except queue.Empty:
-                resp["status"] = 2
-                resp["msg"] = "Log configuration did not stop"
-        if data["action"] == "delete":
+            else:
+                if data["action"] == "delete":
+                    self._wait_log(request, data["name"], "added",
+                                   "Log configuration did not stop")
+                    del self.logging_configs[data["name"]]
+                    lg.delete()
+                else:
+                    self._wait_log(request, data["name"], "started",
+                                   "Log configuration did not stop")
+                    if data["action"] == "start":
+                        lg.start()
+                    else:
+                        lg.stop()
+                return
+        elif data["action"] == "schema":
             try:
-                self._logging_configs[data["name"]].delete()
-                self._log_added_queue.get(block=True, timeout=LOG_TIMEOUT)
+                resp["schema"] = self.log_publishers[data["name"]].schema()
                 resp["status"] = 0
             except KeyError as e:
                 resp["status"] = 1
                 resp["msg"] = "{} config not found".format(str(e))
-            except queue.Empty:
-                resp["status"] = 2
-                resp["msg"] = "Log configuration did not stop"
-
-        return resp
-
-    def _handle_param(self, data):
-        resp = {"version": 1}
-        group = data["name"].split(".")[0]
-        name = data["name"].split(".")[1]
-        self._cf.param.add_update_callback(group=group, name=name,
-                                           cb=self._param_callback)
+        else:
+            resp["status"] = 0xFF
+            resp["msg"] = "Unknown action {}".format(data["action"])
+        srv.reply(request, resp)
+
+    def handle_param(self, request, data):
+        """Set one parameter (name/value) or several (values)"""
+        single = "values" not in data
+        if single:
+            values = {data["name"]: data["value"]}
+        else:
+            values = data["values"]
+        batch = _ParamBatch(request, values.keys(), single)
+        with self._lock:
+            for name in values:
+                self._pending_param.setdefault(name, []).append(batch)
         try:
-            self._cf.param.set_value(data["name"], str(data["value"]))
-            answer = self._param_queue.get(block=True, timeout=PARAM_TIMEOUT)
-            resp["name"] = answer["name"]
-            resp["value"] = answer["value"]
-            resp["status"] = 0
+            # All the values are checked before anything is sent
+            self.cf.param.set_values(values)
         except KeyError as e:
-            resp["status"] = 1
-            resp["msg"] = str(e)
-        except AttributeError as e:
-            resp["status"] = 2
-            resp["msg"] = str(e)
-        except queue.Empty:
-            resp["status"] = 3
-            resp["msg"] = "Timeout when setting parameter" \
-                          "{}".format(data["name"])
+            self._remove_param_batch(batch)
+            self._srv.reply(request, {"version": 1, "status": 1,
+                                      "msg": str(e)})
+            return
+        except (AttributeError, TypeError, ValueError) as e:
+            self._remove_param_batch(batch)
+            self._srv.reply(request, {"version": 1, "status": 2,
+                                      "msg": str(e)})
+            return
+        self._srv.set_timeout(request, PARAM_TIMEOUT,
+                              lambda: self._param_timeout(batch))
+
+    def _remove_param_batch(self, batch):
+        with self._lock:
+            for name in list(batch.remaining):
+                waiting = self._pending_param.get(name, [])
+                if batch in waiting:
+                    waiting.remove(batch)
+                if not waiting:
+                    self._pending_param.pop(name, None)
+
+    def _param_timeout(self, batch):
+        self._remove_param_batch(batch)
+        resp = {"version": 1, "status": 3,
+                "msg": "Timeout when setting parameter {}".format(
+                    ", ".join(sorted(batch.remaining)))}
+        if not batch.single:
+            resp["values"] = batch.values
         return resp
 
-    def _all_param_update(self, name, value):
-        resp = {"version": 1, "name": name, "value": value}
-        self._param_socket.send_json(resp)
+    def _param_updated(self, name, value):
+        self._srv.publish_param(self.uri, name, value, self.cf.param)
+        with self._lock:
+            batches = self._pending_param.pop(name, [])
+            done = []
+            for batch in batches:
+                batch.remaining.discard(name)
+                batch.values[name] = value
+                if not batch.remaining:
+                    done.append(batch)
+        for batch in done:
+            if batch.single:
+                resp = {"version": 1, "status": 0, "name": name,
+                        "value": value}
+            else:
+                resp = {"version": 1, "status": 0, "values": batch.values}
+            self._srv.reply(batch.request, resp)
 
-    def _param_callback(self, name, value):
-        group = name.split(".")[0]
-        name_short = name.split(".")[1]
-        self._cf.param.remove_update_callback(group=group, name=name_short)
-        self._param_queue.put_nowait({"name": name, "value": value})
 
-    def _logdata_callback(self, ts, data, conf):
-        out = {"version": 1, "name": conf.name, "event": "data",
-               "timestamp": ts, "variables": {}}
-        for d in data:
-            out["variables"][d] = data[d]
-        self._log_socket.send_json(out)
+class _SrvThread(Thread):
+    """
+    Handles the commands from the ROUTER socket. Commands are dispatched
+    without waiting for the Espdrone, the replies are sent when the
+    Espdrone has answered or the command has timed out, so several
+    commands can be in flight for several Espdrones at the same time.
+
+    A reply contains the "id" of the command if it had one, which lets
+    DEALER clients correlate replies that arrive out of order. REQ clients
+    keep working as before.
+    """
+
+    def __init__(self, context, socket, log_socket, param_socket, conn_socket,
+                 create_espdrone, *args, wire_format=FORMAT_JSON,
+                 batch_count=1, batch_period=None):
+        super(_SrvThread, self).__init__(*args)
+        self.daemon = True
+        self._context = context
+        self._socket = socket
+        self._log_socket = log_socket
+        self._param_socket = param_socket
+        self._conn_socket = conn_socket
+        self._create_espdrone = create_espdrone
+
+        self.wire_format = wire_format
+        self._batch_count = batch_count
+        self._batch_period = batch_period
+
+        self._sessions = {}
+        self._sessions_lock = Lock()
+        # Replies from other threads are queued and sent by this thread,
+        # ZMQ sockets can only be used by one thread. A message on the
+        # inproc wakeup socket tells this thread that there are replies.
+        self._replies = queue.Queue()
+        wakeup_address = "inproc://cfzmq-wakeup-{}".format(id(self))
+        self._wakeup_socket = context.socket(zmq.PULL)
+        self._wakeup_socket.bind(wakeup_address)
+        wakeup = context.socket(zmq.PUSH)
+        wakeup.connect(wakeup_address)
+        self._wakeup = _LockedSocket(wakeup, Lock())
+        self._reply_lock = Lock()
+        # The PUB sockets are used from the callback threads
+        self._pub_lock = Lock()
+
+    def get_session(self, uri=None):
+        """The session for uri, or the only session if uri is None"""
+        with self._sessions_lock:
+            if uri is not None:
+                session = self._sessions.get(uri)
+                return session if session and session.is_open else None
+            sessions = [s for s in self._sessions.values() if s.is_open]
+            if len(sessions) == 1:
+                return sessions[0]
+        return None
+
+    def _open_session(self, uri):
+        with self._sessions_lock:
+            session = self._sessions.get(uri)
+            if session is None:
+                session = _DroneSession(self, uri, self._create_espdrone())
+                self._sessions[uri] = session
+            session.is_open = True
+        return session
+
+    def _close_session(self, session):
+        with self._sessions_lock:
+            session.is_open = False
+        session.close()
+
+    def create_log_publisher(self, topic, conf, batch_count, batch_period):
+        return _LogPublisher(
+            _LockedSocket(self._log_socket, self._pub_lock), topic, conf,
+            batch_count if batch_count is not None else self._batch_count,
+            batch_period if batch_period is not None
+            else self._batch_period)
+
+    def publish_conn(self, conn_ev):
+        with self._pub_lock:
+            self._conn_socket.send_json(conn_ev)
+
+    def publish_log_json(self, out):
+        with self._pub_lock:
+            self._log_socket.send_json(out)
+
+    def publish_param(self, uri, name, value, param):
+        with self._pub_lock:
+            if self.wire_format == FORMAT_BINARY:
+                topic = "param/{}/{}".format(uri, name).encode("utf-8")
+                self._param_socket.send_multipart(
+                    [topic, b"value",
+                     _PARAM_VALUE.pack(param.get_value(name))])
+            else:
+                resp = {"version": 1, "name": name, "value": value,
+                        "uri": uri}
+                self._param_socket.send_json(resp)
+
+    def reply(self, request, resp):
+        """Send the reply to a request, from any thread. Only the first
+        reply to a request is sent."""
+        with self._reply_lock:
+            if request.done:
+                return
+            request.done = True
+        if request.timer is not None:
+            request.timer.cancel()
+        if request.id is not None:
+            resp["id"] = request.id
+        frames = request.envelope + [json.dumps(resp).encode("utf-8")]
+        if threading.current_thread() is self:
+            self._socket.send_multipart(frames)
+        else:
+            self._replies.put(frames)
+            self._wakeup.send_multipart([b""])
+
+    def _send_queued_replies(self):
+        while True:
+            try:
+                frames = self._replies.get_nowait()
+            except queue.Empty:
+                return
+            self._socket.send_multipart(frames)
+
+    def set_timeout(self, request, timeout, resp):
+        """Reply with resp, or the result of calling resp, unless the
+        request has been replied to within timeout seconds"""
+        def expired():
+            if not request.done:
+                self.reply(request, resp() if callable(resp) else resp)
+
+        request.timer = shared_scheduler().call_later(timeout, expired)
+
+    def _handle_scanning(self, request):
+        def scan():
+            resp = {"version": 1}
+            interfaces = edlib.crtp.scan_interfaces()
+            resp["interfaces"] = []
+            for i in interfaces:
+                resp["interfaces"].append({"uri": i[0], "info": i[1]})
+            self.reply(request, resp)
+
+        # Scanning takes a while, don't block other commands meanwhile
+        Thread(target=scan, daemon=True).start()
+
+    def _dispatch(self, envelope, payload):
+        try:
+            cmd = json.loads(payload.decode("utf-8"))
+        except ValueError as e:
+            self.reply(_Request(envelope, {}), {
+                "version": 1, "status": 0xFF, "msg": str(e)})
+            return
+        logger.info("Got command {}".format(cmd))
+        request = _Request(envelope, cmd)
+        response = {"version": 1}
+        if cmd["cmd"] == "scan":
+            self._handle_scanning(request)
+            return
+        if cmd["cmd"] == "connect":
+            self._open_session(cmd["uri"]).connect(request)
+            return
+        session = self.get_session(cmd.get("uri"))
+        if cmd["cmd"] not in ("disconnect", "log", "param"):
+            response["status"] = 0xFF
+            response["msg"] = "Unknown command {}".format(cmd["cmd"])
+        elif session is None:
+            response["status"] = 0xFE
+            response["msg"] = "Not connected to {}".format(
+                cmd.get("uri", "an Espdrone"))
+        elif cmd["cmd"] == "disconnect":
+            self._close_session(session)
+            response["status"] = 0
+        elif cmd["cmd"] == "log":
+            session.handle_logging(request, cmd)
+            return
+        elif cmd["cmd"] == "param":
+            session.handle_param(request, cmd)
+            return
+        self.reply(request, response)
 
     def run(self):
         logger.info("Starting server thread")
+        poller = zmq.Poller()
+        poller.register(self._socket, zmq.POLLIN)
+        poller.register(self._wakeup_socket, zmq.POLLIN)
         while True:
-            # Wait for the command
-            cmd = self._socket.recv_json()
-            response = {"version": 1}
-            logger.info("Got command {}".format(cmd))
-            if cmd["cmd"] == "scan":
-                response = self._handle_scanning()
-            elif cmd["cmd"] == "connect":
-                response = self._handle_connect(cmd["uri"])
-            elif cmd["cmd"] == "disconnect":
-                self._cf.close_link()
-                response["status"] = 0
-            elif cmd["cmd"] == "log":
-                response = self._handle_logging(cmd)
-            elif cmd["cmd"] == "param":
-                response = self._handle_param(cmd)
-            else:
-                response["status"] = 0xFF
-                response["msg"] = "Unknown command {}".format(cmd["cmd"])
-            self._socket.send_json(response)
+            for socket, _ in poller.poll():
+                if socket is self._wakeup_socket:
+                    self._wakeup_socket.recv_multipart()
+                    self._send_queued_replies()
+                else:
+                    # Identity, the empty delimiter of REQ clients and the
+                    # command
+                    frames = self._socket.recv_multipart()
+                    try:
+                        self._dispatch(frames[:-1], frames[-1])
+                    except Exception as e:
+                        logger.exception("Error when handling command")
+                        self.reply(_Request(frames[:-1], {}), {
+                            "version": 1, "status": 0xFF, "msg": str(e)})
+
+
+class _LockedSocket():
+    """Serializes the sends of several threads to a socket"""
+
+    def __init__(self, socket, lock):
+        self._socket = socket
+        self._lock = lock
+
+    def send_multipart(self, frames):
+        with self._lock:
+            self._socket.send_multipart(frames)
 
 
 class _CtrlThread(Thread):
 
-    def __init__(self, socket, cf, *args):
+    def __init__(self, socket, srv, *args):
         super(_CtrlThread, self).__init__(*args)
+        self.daemon = True
         self._socket = socket
-        self._cf = cf
+        self._srv = srv
 
     def run(self):
         while True:
             cmd = self._socket.recv_json()
-            self._cf.commander.send_setpoint(cmd["roll"], cmd["pitch"],
-                                             cmd["yaw"], cmd["thrust"])
+            session = self._srv.get_session(cmd.get("uri"))
+            if session is None:
+                continue
+            session.cf.commander.send_setpoint(cmd["roll"], cmd["pitch"],
+                                               cmd["yaw"], cmd["thrust"])
 
 
 class ZMQServer():
     """Espdrone ZMQ server"""
 
-    def __init__(self, base_url):
-        """Start threads and bind ports"""
+    def __init__(self, base_url, wire_format=FORMAT_JSON, batch_count=1,
+                 batch_period=None):
+        """Start threads and bind ports
+
+        wire_format selects how log data and parameter updates are
+        published, log samples are published in frames of batch_count
+        samples or batch_period ms in the binary format.
+        """
         edlib.crtp.init_drivers(enable_debug_driver=True)
-        self._cf = Espdrone(ro_cache=None,
-                             rw_cache=edclient.config_path + "/cache")
 
         signal.signal(signal.SIGINT, signal.SIG_DFL)
 
         self._base_url = base_url
         self._context = zmq.Context()
 
-        cmd_srv = self._bind_zmq_socket(zmq.REP, "cmd", ZMQ_SRV_PORT)
+        cmd_srv = self._bind_zmq_socket(zmq.ROUTER, "cmd", ZMQ_SRV_PORT)
         log_srv = self._bind_zmq_socket(zmq.PUB, "log", ZMQ_LOG_PORT)
         param_srv = self._bind_zmq_socket(zmq.PUB, "param", ZMQ_PARAM_PORT)
         ctrl_srv = self._bind_zmq_socket(zmq.PULL, "ctrl", ZMQ_CTRL_PORT)
         conn_srv = self._bind_zmq_socket(zmq.PUB, "conn", ZMQ_CONN_PORT)
 
-        self._scan_thread = _SrvThread(cmd_srv, log_srv, param_srv, conn_srv,
-                                       self._cf)
+        self._scan_thread = _SrvThread(self._context, cmd_srv, log_srv,
+                                       param_srv, conn_srv,
+                                       self._create_espdrone,
+                                       wire_format=wire_format,
+                                       batch_count=batch_count,
+                                       batch_period=batch_period)
         self._scan_thread.start()
 
-        self._ctrl_thread = _CtrlThread(ctrl_srv, self._cf)
+        self._ctrl_thread = _CtrlThread(ctrl_srv, self._scan_thread)
         self._ctrl_thread.start()
 
+    def _create_espdrone(self):
+        return Espdrone(ro_cache=None,
+                        rw_cache=edclient.config_path + "/cache")
+
     def _bind_zmq_socket(self, pattern, name, port):
         srv = self._context.socket(pattern)
         srv_addr = "{}:{}".format(self._base_url, port)
@@ -360,6 +795,17 @@ def main():
                         help="URL where ZMQ will accept connections")
     parser.add_argument("-d", "--debug", action="store_true", dest="debug",
                         help="Enable debug output")
+    parser.add_argument("-f", "--format", action="store", dest="format",
+                        choices=[FORMAT_JSON, FORMAT_BINARY],
+                        default=FORMAT_JSON,
+                        help="Wire format of log data and parameter updates")
+    parser.add_argument("--batch-count", action="store", dest="batch_count",
+                        type=int, default=1,
+                        help="Log samples per frame in the binary format")
+    parser.add_argument("--batch-period", action="store",
+                        dest="batch_period", type=int, default=None,
+                        help="Max time in ms to batch log samples in the "
+                             "binary format")
     (args, unused) = parser.parse_known_args()
 
     if args.debug:
@@ -367,7 +813,7 @@ def main():
     else:
         logging.basicConfig(level=logging.INFO)
 
-    ZMQServer(args.url)
+    ZMQServer(args.url, args.format, args.batch_count, args.batch_period)
 
     # CRTL-C to exit
 
@@ -248,18 +248,18 @@ class MainUI(QtWidgets.QMainWindow, main_window_class):
 
         self.joystickReader.input_updated.add_callback(
             lambda *args: self._disable_input or
-            self.cf.commander.send_setpoint(*args))
+            self.cf.commander.streamer.set_setpoint(*args))
 
         self.joystickReader.assisted_input_updated.add_callback(
             lambda *args: self._disable_input or
-            self.cf.commander.send_velocity_world_setpoint(*args))
+            self.cf.commander.streamer.set_velocity_world_setpoint(*args))
 
         self.joystickReader.heighthold_input_updated.add_callback(
             lambda *args: self._disable_input or
-            self.cf.commander.send_zdistance_setpoint(*args))
+            self.cf.commander.streamer.set_zdistance_setpoint(*args))
 
         self.joystickReader.hover_input_updated.add_callback(
-            self.cf.commander.send_hover_setpoint)
+            self.cf.commander.streamer.set_hover_setpoint)
 
         # Connection callbacks and signal wrappers for UI protection
         self.cf.connected.add_callback(self.connectionDoneSignal.emit)
@@ -572,6 +572,10 @@ class MainUI(QtWidgets.QMainWindow, main_window_class):
         self.uiState = UIState.CONNECTED
         self._update_ui_state()
 
+        # Setpoints from the input devices and the tabs are streamed at a
+        # fixed rate, the streamer is stopped by edlib on disconnect
+        self.cf.commander.streamer.start()
+
         Config().set("link_uri", str(self._selected_interface))
 
         lg = LogConfig("Battery", 1000)
@@ -745,7 +745,11 @@ class QualisysTab(Tab, qualisys_tab_class):
                     self.switch_flight_mode(FlightModeStates.PATH)
 
     def set_kill_engine(self):
-        self.send_setpoint(Position(0, 0, 0))
+        if self._cf is not None:
+            self._cf.commander.streamer.stop()
+            self._cf.commander.send_stop_setpoint()
+            # Nothing is streamed again until a new setpoint is set
+            self._cf.commander.streamer.start()
         self.switch_flight_mode(FlightModeStates.GROUNDED)
         logger.info('Stop button pressed, kill engines')
 
@@ -1415,7 +1419,8 @@ class QualisysTab(Tab, qualisys_tab_class):
     def send_setpoint(self, pos):
         # Wraps the send command to the espdrone
         if self._cf is not None:
-            self._cf.commander.send_position_setpoint(pos.x, pos.y, pos.z, 0.0)
+            self._cf.commander.streamer.set_position_setpoint(
+                pos.x, pos.y, pos.z, 0.0)
 
 
 class Position:
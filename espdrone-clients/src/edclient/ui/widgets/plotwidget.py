@@ -34,11 +34,10 @@ For more advanced plotting save the data and use an external application.
 
 from PyQt5 import QtWidgets, uic
 
-from time import time
-
 import logging
 
 from PyQt5.QtWidgets import QButtonGroup
+from PyQt5.QtCore import QTimer
 from PyQt5.QtCore import *  # noqa
 from PyQt5.QtWidgets import *  # noqa
 from PyQt5.Qt import *  # noqa
@@ -59,6 +58,8 @@ try:
     from pyqtgraph import ViewBox
     import pyqtgraph.console  # noqa
     import numpy as np  # noqa
+    from edclient.utils.plotbuffer import PlotBuffer
+    from edclient.utils.plotbuffer import decimate_min_max
 
     _pyqtgraph_found = True
 except Exception:
@@ -79,14 +80,17 @@ except Exception:
     pass
 
 
+# Number of samples kept for each curve if nothing else is specified
+DEFAULT_HISTORY = 100000
+
+
 class PlotItemWrapper:
-    """Wrapper for PlotDataItem to handle what data is shown"""
+    """Wrapper for PlotDataItem to handle what data is shown."""
 
-    def __init__(self, curve):
+    def __init__(self, curve, max_history=DEFAULT_HISTORY):
         """Initialize"""
-        self.data = []
-        self.ts = []
         self.curve = curve
+        self._buffer = PlotBuffer(max_history)
 
     def add_point(self, p, ts):
         """
@@ -95,30 +99,35 @@ class PlotItemWrapper:
         p - point
         ts - timestamp in ms
         """
-        self.data.append(p)
-        self.ts.append(ts)
+        self._buffer.add_point(p, ts)
 
-    def show_data(self, start, stop):
+    def show_data(self, start, stop, max_points=None):
         """
-        Set what data should be shown from the curve. This is done to keep
-        performance when many points have been added.
+        Set what data should be shown from the curve. start and stop are
+        sample numbers, samples that are no longer in the history are
+        skipped. If max_points is set the data is decimated to keep the
+        min and max values of max_points / 2 buckets.
         """
-        limit = min(stop, len(self.data))
-        self.curve.setData(y=self.data[start:limit], x=self.ts[start:limit])
-        return [self.ts[start], self.ts[limit - 1]]
+        ts, data = self._buffer.get(start, stop)
+        if len(data) == 0:
+            self.curve.setData(y=[], x=[])
+            return None
+
+        x_range = [ts[0], ts[-1]]
+        if max_points and len(data) > max_points:
+            ts, data = decimate_min_max(ts, data, max_points // 2)
+        self.curve.setData(y=data, x=ts)
+        return x_range
 
 
 class PlotWidget(QtWidgets.QWidget, plot_widget_class):
     """Wrapper widget for PyQtGraph adding some extra buttons"""
 
-    def __init__(self, parent=None, fps=100, title="", *args):
+    def __init__(self, parent=None, fps=100, title="", *args,
+                 max_history=DEFAULT_HISTORY):
         super(PlotWidget, self).__init__(*args)
         self.setupUi(self)
 
-        # Limit the plot update to 10Hz
-        self._ts = time()
-        self._delay = 0.1
-
         # Check if we could import PyQtGraph, if not then stop here
         if not _pyqtgraph_found:
             self.can_enable = False
@@ -128,6 +137,9 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
 
         self._items = {}
         self._last_item = 0
+        self._max_history = max_history
+        # Set when data has been added since the last redraw
+        self._dirty = False
 
         self.setSizePolicy(QtWidgets.QSizePolicy(
             QtWidgets.QSizePolicy.MinimumExpanding,
@@ -183,6 +195,11 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
         self._draw_graph = True
         self._auto_redraw.stateChanged.connect(self._auto_redraw_change)
 
+        # Redraw at the frame rate instead of for every new sample
+        self._redraw_timer = QTimer(self)
+        self._redraw_timer.timeout.connect(self._redraw)
+        self._redraw_timer.start(int(1000 / fps))
+
     def _auto_redraw_change(self, state):
         """Callback from the auto redraw checkbox"""
         if state == 0:
@@ -257,11 +274,11 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
         pen - color of curve (using r for red and so on..)
         """
         self._items[title] = PlotItemWrapper(
-            self._plot_widget.plot(name=title, pen=pen))
+            self._plot_widget.plot(name=title, pen=pen), self._max_history)
 
     def add_data(self, data, ts):
         """
-        Add new data to the plot.
+        Add new data to the plot. The plot is redrawn by a timer.
 
         data - dictionary sent from logging layer containing variable/value
                pairs
@@ -269,29 +286,42 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
         """
         if not self._last_ts:
             self._last_ts = ts
-        elif not self._last_ts:
+        elif not self._dtime:
             self._dtime = ts - self._last_ts
             self._last_ts = ts
 
-        x_min_limit = 0
-        x_max_limit = 0
-        # We are adding new datasets, calculate what we should show.
+        for name in self._items:
+            self._items[name].add_point(data[name], ts)
+
+        self._last_item = self._last_item + 1
+        self._dirty = True
+
+    def _redraw(self):
+        """Show the new data, called by the redraw timer"""
+        if not self._dirty or not self._draw_graph:
+            return
+        self._dirty = False
+
+        # Calculate what we should show
         if self._enable_samples_x.isChecked():
             x_min_limit = max(0, self._last_item - self._nbr_samples)
             x_max_limit = max(self._last_item, self._nbr_samples)
+        else:
+            x_min_limit = 0
+            x_max_limit = self._last_item
 
+        # Two points (min and max) per pixel is all that can be seen
+        max_points = 2 * max(1, int(self._plot_widget.width()))
         for name in self._items:
-            self._items[name].add_point(data[name], ts)
-            if self._draw_graph and time() > self._ts + self._delay:
-                [self._x_min, self._x_max] = self._items[name].show_data(
-                    x_min_limit, x_max_limit)
-        if time() > self._ts + self._delay:
-            self._ts = time()
+            x_range = self._items[name].show_data(x_min_limit, x_max_limit,
+                                                  max_points)
+            if x_range:
+                [self._x_min, self._x_max] = x_range
+
         if (self._enable_samples_x.isChecked() and self._dtime and
                 self._last_item < self._nbr_samples):
             self._x_max = self._x_min + self._nbr_samples * self._dtime
 
-        self._last_item = self._last_item + 1
         self._plot_widget.getViewBox().setRange(
             xRange=(self._x_min, self._x_max))
 
@@ -306,6 +336,7 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
         self._last_item = 0
         self._last_ts = None
         self._dtime = None
+        self._dirty = False
         self._plot_widget.clear()
 
     def _clear_legend(self):
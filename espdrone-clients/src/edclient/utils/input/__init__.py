@@ -41,9 +41,13 @@ configuration file.
 import os
 import re
 import glob
+import select
+import time
 import traceback
 import logging
 import shutil
+from threading import Lock
+from threading import Thread
 
 from . import inputreaders as readers
 from . import inputinterfaces as interfaces
@@ -69,6 +73,103 @@ MAX_TARGET_HEIGHT = 1.0
 MIN_TARGET_HEIGHT = 0.03
 MIN_HOVER_HEIGHT = 0.20
 INPUT_READ_PERIOD = 0.01
+# Setpoints that don't change are resent at this period so that the
+# Espdrone doesn't time out
+KEEP_ALIVE_PERIOD = 0.1
+
+
+class _InputLoop():
+    """
+    Calls the callback when the input devices have new events. The devices
+    are waited on with select, while the setpoints keep changing (for
+    instance when the thrust is slew rate limited) or when a device can't
+    be waited on the callback is called every INPUT_READ_PERIOD. Otherwise
+    it's called every KEEP_ALIVE_PERIOD.
+    """
+
+    def __init__(self, callback, filenos, changing):
+        self._callback = callback
+        self._filenos = filenos
+        self._changing = changing
+        self._thread = None
+
+    def start(self):
+        """Start the loop"""
+        if self._thread:
+            logger.warning("Input loop already started, not restarting")
+            return
+        self._thread = _InputLoopThread(self._callback, self._filenos,
+                                        self._changing)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the loop"""
+        if self._thread:
+            self._thread.stop()
+            self._thread = None
+
+
+class _InputLoopThread(Thread):
+
+    def __init__(self, callback, filenos, changing):
+        super(_InputLoopThread, self).__init__(name="InputLoop")
+        self.daemon = True
+        self._callback = callback
+        self._filenos = filenos
+        self._changing = changing
+        self._stop_requested = False
+        # Written to when stopping, to wake up the thread
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        # Guards the pipe, it's closed by the thread when it exits
+        self._pipe_lock = Lock()
+        self._pipe_closed = False
+
+    def stop(self):
+        self._stop_requested = True
+        with self._pipe_lock:
+            if not self._pipe_closed:
+                os.write(self._wakeup_w, b"x")
+
+    def _get_filenos(self):
+        try:
+            return self._filenos()
+        except Exception:
+            # The device was most likely unplugged, poll until the
+            # devices are updated
+            logger.warning("Could not get the input device file "
+                           "descriptors: %s", traceback.format_exc())
+            return None
+
+    def run(self):
+        try:
+            while not self._stop_requested:
+                fds = self._get_filenos()
+                if fds is None or self._changing():
+                    timeout = INPUT_READ_PERIOD
+                else:
+                    timeout = KEEP_ALIVE_PERIOD
+                if fds is None:
+                    fds = []
+                try:
+                    select.select([self._wakeup_r] + fds, [], [], timeout)
+                except (OSError, ValueError):
+                    # A device was closed while waiting for it, poll
+                    # until the devices are updated
+                    time.sleep(INPUT_READ_PERIOD)
+                if self._stop_requested:
+                    break
+                try:
+                    self._callback()
+                except Exception:
+                    # Keep the loop alive so that the setpoints keep
+                    # being sent
+                    logger.warning("Exception in the input loop: %s",
+                                   traceback.format_exc())
+        finally:
+            with self._pipe_lock:
+                self._pipe_closed = True
+                os.close(self._wakeup_r)
+                os.close(self._wakeup_w)
 
 
 class JoystickReader(object):
@@ -143,8 +244,16 @@ class JoystickReader(object):
 
         self._available_devices = {}
 
-        # TODO: The polling interval should be set from config file
-        self._read_timer = PeriodicTimer(INPUT_READ_PERIOD, self.read_input)
+        # The setpoints are only sent when they change or to keep the
+        # connection alive
+        self._last_setpoint = None
+        self._last_setpoint_time = 0
+        self._setpoint_changed = False
+        self._last_read_time = None
+
+        self._read_timer = _InputLoop(self.read_input,
+                                      self._input_filenos,
+                                      lambda: self._setpoint_changed)
 
         if do_device_discovery:
             self._discovery_timer = PeriodicTimer(1.0,
@@ -350,6 +459,21 @@ class JoystickReader(object):
         self._read_timer.stop()
         self._selected_mux.pause()
 
+    def _input_filenos(self):
+        return self._selected_mux.filenos()
+
+    def _send_setpoint(self, caller, *setpoint):
+        """Call caller with the setpoint if it has changed, unchanged
+        setpoints are only sent to keep the connection alive"""
+        now = time.monotonic()
+        if (caller, setpoint) != self._last_setpoint:
+            self._setpoint_changed = True
+        elif now - self._last_setpoint_time < KEEP_ALIVE_PERIOD / 2:
+            return
+        self._last_setpoint = (caller, setpoint)
+        self._last_setpoint_time = now
+        caller.call(*setpoint)
+
     def _set_thrust_slew_rate(self, rate):
         self._thrust_slew_rate = rate
         if rate > 0:
@@ -362,6 +486,14 @@ class JoystickReader(object):
 
     def read_input(self):
         """Read input data from the selected device"""
+        # Time since the last read, used to integrate velocity setpoints
+        now = time.monotonic()
+        if self._last_read_time is None:
+            dt = INPUT_READ_PERIOD
+        else:
+            dt = min(now - self._last_read_time, KEEP_ALIVE_PERIOD)
+        self._last_read_time = now
+        self._setpoint_changed = False
         try:
             data = self._selected_mux.read()
 
@@ -450,7 +582,8 @@ class JoystickReader(object):
                     yawrate = data.yaw
                     # The odd use of vx and vy is to map forward on the
                     # physical joystick to positiv X-axis
-                    self.assisted_input_updated.call(vy, -vx, vz, yawrate)
+                    self._send_setpoint(self.assisted_input_updated,
+                                        vy, -vx, vz, yawrate)
                 elif self._assisted_control == \
                         JoystickReader.ASSISTED_CONTROL_HOVER \
                         and data.assistedControl:
@@ -460,7 +593,7 @@ class JoystickReader(object):
                     # Scale thrust to a value between -1.0 to 1.0
                     vz = (data.thrust - 32767) / 32767.0
                     # Integrate velosity setpoint
-                    self._target_height += vz * INPUT_READ_PERIOD
+                    self._target_height += vz * dt
                     # Cap target height
                     if self._target_height > self._hover_max_height:
                         self._target_height = self._hover_max_height
@@ -470,8 +603,9 @@ class JoystickReader(object):
                     yawrate = data.yaw
                     # The odd use of vx and vy is to map forward on the
                     # physical joystick to positiv X-axis
-                    self.hover_input_updated.call(vy, -vx, yawrate,
-                                                  self._target_height)
+                    self._send_setpoint(self.hover_input_updated,
+                                        vy, -vx, yawrate,
+                                        self._target_height)
                 else:
                     # Update the user roll/pitch trim from device
                     if data.toggled.pitchNeg and data.pitchNeg:
@@ -497,15 +631,15 @@ class JoystickReader(object):
                         # Scale thrust to a value between -1.0 to 1.0
                         vz = (data.thrust - 32767) / 32767.0
                         # Integrate velosity setpoint
-                        self._target_height += vz * INPUT_READ_PERIOD
+                        self._target_height += vz * dt
                         # Cap target height
                         if self._target_height > self._hover_max_height:
                             self._target_height = self._hover_max_height
                         if self._target_height < MIN_TARGET_HEIGHT:
                             self._target_height = MIN_TARGET_HEIGHT
-                        self.heighthold_input_updated.call(roll, -pitch,
-                                                           yawrate,
-                                                           self._target_height)
+                        self._send_setpoint(self.heighthold_input_updated,
+                                            roll, -pitch, yawrate,
+                                            self._target_height)
                     else:
                         # Using alt hold the data is not in a percentage
                         if not data.assistedControl:
@@ -518,11 +652,12 @@ class JoystickReader(object):
                         if data.thrust > 0xFFFF:
                             data.thrust = 0xFFFF
 
-                        self.input_updated.call(data.roll + self.trim_roll,
-                                                data.pitch + self.trim_pitch,
-                                                data.yaw, data.thrust)
+                        self._send_setpoint(self.input_updated,
+                                            data.roll + self.trim_roll,
+                                            data.pitch + self.trim_pitch,
+                                            data.yaw, data.thrust)
             else:
-                self.input_updated.call(0, 0, 0, 0)
+                self._send_setpoint(self.input_updated, 0, 0, 0, 0)
         except Exception:
             logger.warning("Exception while reading inputdevice: %s",
                            traceback.format_exc())
@@ -143,6 +143,11 @@ class InputReaderInterface(object):
     def close(self):
         return
 
+    def fileno(self):
+        """A file descriptor that is readable when there is new input, or
+        None if the device has to be polled"""
+        return None
+
     @staticmethod
     def devices():
         """List all the available devices."""
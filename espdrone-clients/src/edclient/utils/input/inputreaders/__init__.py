@@ -101,6 +101,11 @@ class InputDevice(InputReaderInterface):
     def close(self):
         self._reader.close(self.id)
 
+    def fileno(self):
+        if hasattr(self._reader, "fileno"):
+            return self._reader.fileno(self.id)
+        return None
+
     def set_dead_band(self, db):
         self.db = db
 
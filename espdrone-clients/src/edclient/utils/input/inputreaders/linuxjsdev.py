@@ -29,6 +29,7 @@ to be mounted on /sys and /dev/input/js* to be readable.
 This module is very linux specific but should work on any CPU platform
 """
 import ctypes
+import errno
 import glob
 import logging
 import os
@@ -49,6 +50,9 @@ __all__ = ['Joystick']
 logger = logging.getLogger(__name__)
 
 JS_EVENT_FMT = "@IhBB"
+JS_EVENT_SIZE = struct.calcsize(JS_EVENT_FMT)
+# Number of events read with one read() call
+JS_EVENT_BULK = 64
 JE_TIME = 0
 JE_VALUE = 1
 JE_TYPE = 2
@@ -135,17 +139,15 @@ class _JS():
 
     def __initvalues(self):
         """Read the buttons and axes initial values from the js device"""
-        for _ in range(len(self.axes) + len(self.buttons)):
-            data = self._f.read(struct.calcsize(JS_EVENT_FMT))
-            jsdata = struct.unpack(JS_EVENT_FMT, data)
-            self.__updatestate(jsdata)
+        # The initial values are queued as events when the device is opened
+        self._read_all_events()
 
-    def __updatestate(self, jsdata):
-        """Update the internal absolute state of buttons and axes"""
-        if jsdata[JE_TYPE] & JS_EVENT_AXIS != 0:
-            self.axes[jsdata[JE_NUMBER]] = jsdata[JE_VALUE] / 32768.0
-        elif jsdata[JE_TYPE] & JS_EVENT_BUTTON != 0:
-            self.buttons[jsdata[JE_NUMBER]] = jsdata[JE_VALUE]
+    def fileno(self):
+        """The file descriptor of the device, readable when there are
+        events, None if the device isn't opened"""
+        if not self._f:
+            return None
+        return self._f.fileno()
 
     def __decode_event(self, jsdata):
         """ Decode a jsdev event into a dict """
@@ -161,19 +163,28 @@ class _JS():
 
     def _read_all_events(self):
         """Consume all the events queued up in the JS device"""
+        axes = self.axes
+        buttons = self.buttons
         try:
+            fd = self._f.fileno()
             while True:
-                data = self._f.read(struct.calcsize(JS_EVENT_FMT))
-                jsdata = struct.unpack(JS_EVENT_FMT, data)
-                self.__updatestate(jsdata)
-        except IOError as e:
-            if e.errno != 11:
+                # Read many events at once, the device only returns whole
+                # events
+                data = os.read(fd, JS_EVENT_SIZE * JS_EVENT_BULK)
+                for _, value, evt_type, number in struct.iter_unpack(
+                        JS_EVENT_FMT, data):
+                    if evt_type & JS_EVENT_AXIS != 0:
+                        axes[number] = value / 32768.0
+                    elif evt_type & JS_EVENT_BUTTON != 0:
+                        buttons[number] = value
+                if len(data) < JS_EVENT_SIZE * JS_EVENT_BULK:
+                    break
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EBADF):
                 logger.info(str(e))
                 self._f.close()
                 self._f = None
                 raise IOError("Device has been disconnected")
-        except TypeError:
-            pass
         except ValueError:
             # This will happen if I/O operations are done on a closed device,
             # which is the case when you first close and then open the device
@@ -234,3 +245,12 @@ class Joystick():
     def read(self, device_id):
         """ Returns a list of all joystick event since the last call """
         return self._js[device_id].read()
+
+    def fileno(self, device_id):
+        """
+        Returns a file descriptor that is readable when the device has new
+        events, None if the device isn't opened
+        """
+        if device_id not in self._js:
+            return None
+        return self._js[device_id].fileno()
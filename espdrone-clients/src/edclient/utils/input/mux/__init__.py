@@ -79,6 +79,19 @@ class InputMux(object):
                 devs += (self._devs[d], )
         return devs
 
+    def filenos(self):
+        """
+        The file descriptors to wait on for new input from the devices, or
+        None if any of the devices has to be polled
+        """
+        fds = []
+        for dev in self.devices():
+            fd = dev.fileno()
+            if fd is None:
+                return None
+            fds.append(fd)
+        return fds
+
     def resume(self):
         for d in [key for key in list(self._devs.keys()) if self._devs[key]]:
             self._devs[d].open()
@@ -28,29 +28,122 @@
 
 """
 Used to write log data to files.
+
+Log blocks are recorded either as CSV or in a binary columnar format. The
+binary recording is an append-only file starting with a header that holds a
+JSON table of contents (block name, variables and their types) followed by
+chunks of samples. Each chunk stores the timestamps and then one column per
+variable, optionally zlib compressed. The samples are collected in NumPy
+arrays on the receive thread and encoded and written by a background thread.
+
+A recording is read back with LogRecording, which memory-maps the file, and
+can be converted to CSV, NumPy (.npz) or Parquet with convert_recording():
+
+    python -m edclient.utils.logdatawriter flight.edlog flight.csv
 """
 
 import os
 import datetime
+import json
+import mmap
+import struct
+import sys
+import threading
+import time
+import zlib
 
 import logging
 
+import numpy
+
 import edclient
 
+if sys.version_info < (3,):
+    from Queue import Queue
+else:
+    from queue import Queue
+
 __author__ = 'Bitcraze AB'
-__all__ = ['LogWriter']
+__all__ = ['LogWriter', 'LogRecording', 'convert_recording']
 
 logger = logging.getLogger(__name__)
 
+FORMAT_CSV = "csv"
+FORMAT_BINARY = "binary"
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+# Samples are written in chunks of at most CHUNK_SAMPLES samples, a chunk is
+# also written when it's older than CHUNK_PERIOD seconds to limit what is
+# lost if the client crashes
+CHUNK_SAMPLES = 1024
+CHUNK_PERIOD = 1.0
+
+_MAGIC = b"EDLG"
+_VERSION = 1
+# Magic, version and length of the JSON table of contents
+_FILE_HEADER = struct.Struct("<4sBI")
+_CHUNK_MAGIC = b"CHNK"
+# Magic, compression, number of samples and size of the chunk data
+_CHUNK_HEADER = struct.Struct("<4sBII")
+_TIMESTAMP_TYPE = "<u8"
+
+
+class _RecordingWriter(threading.Thread):
+    """Encodes and writes chunks of samples to a recording file"""
+
+    def __init__(self, file, compression):
+        threading.Thread.__init__(self, name="LogRecordingWriter")
+        self.daemon = True
+        self._file = file
+        self._compression = compression
+        self._queue = Queue()
+
+    def write(self, timestamps, samples):
+        self._queue.put((timestamps, samples))
+
+    def close(self):
+        """Write the queued chunks and close the file"""
+        self._queue.put(None)
+        self.join()
+
+    def run(self):
+        try:
+            while True:
+                chunk = self._queue.get()
+                if chunk is None:
+                    break
+                self._write_chunk(*chunk)
+        except Exception:
+            logger.exception("Error when writing log recording")
+        finally:
+            self._file.close()
+
+    def _write_chunk(self, timestamps, samples):
+        columns = [timestamps.tobytes()]
+        for name in samples.dtype.names:
+            columns.append(numpy.ascontiguousarray(samples[name]).tobytes())
+        data = b"".join(columns)
+        if self._compression == COMPRESSION_ZLIB:
+            data = zlib.compress(data, 1)
+        self._file.write(_CHUNK_HEADER.pack(_CHUNK_MAGIC, self._compression,
+                                            len(timestamps), len(data)))
+        self._file.write(data)
+        self._file.flush()
+
 
 class LogWriter():
     """Create a writer for a specific log block"""
 
-    def __init__(self, logblock, connected_ts=None, directory=None):
+    def __init__(self, logblock, connected_ts=None, directory=None,
+                 file_format=FORMAT_BINARY, compression=COMPRESSION_ZLIB):
         """Initialize the writer"""
         self._block = logblock
         self._dir = directory
         self._connected_ts = connected_ts
+        self._file_format = file_format
+        self._compression = compression
 
         self._dir = os.path.join(edclient.config_path, "logdata",
                                  connected_ts.strftime("%Y%m%dT%H-%M-%S"))
@@ -59,6 +152,14 @@ class LogWriter():
         self._header_values = []
         self._filename = None
 
+        # Chunk being filled in binary format
+        self._writer = None
+        self._timestamps = None
+        self._samples = None
+        self._nbr_of_samples = 0
+        self._chunk_started = 0
+        self._lock = threading.Lock()
+
     def _write_header(self):
         """Write the header to the file"""
         if not self._header_written:
@@ -70,22 +171,74 @@ class LogWriter():
             self._file.write(s)
             self._header_written = True
 
+    def _write_binary_header(self):
+        """Write the header with the table of contents of the recording"""
+        dtype = self._block.get_dtype()
+        toc = {
+            "name": self._block.name,
+            "period_ms": self._block.period_in_ms,
+            "created": datetime.datetime.now().isoformat(),
+            "variables": [[name, dtype[name].str] for name in dtype.names],
+        }
+        toc = json.dumps(toc).encode("utf-8")
+        self._file.write(_FILE_HEADER.pack(_MAGIC, _VERSION, len(toc)))
+        self._file.write(toc)
+        self._new_chunk()
+
+    def _new_chunk(self):
+        self._timestamps = numpy.zeros(CHUNK_SAMPLES, _TIMESTAMP_TYPE)
+        self._samples = numpy.zeros(CHUNK_SAMPLES, self._block.get_dtype())
+        self._nbr_of_samples = 0
+        self._chunk_started = time.monotonic()
+
+    def _flush_chunk(self):
+        if self._nbr_of_samples:
+            self._writer.write(self._timestamps[:self._nbr_of_samples],
+                               self._samples[:self._nbr_of_samples])
+            self._new_chunk()
+
     def _new_data(self, timestamp, data, logconf):
         """Callback when new data arrives from the Espdrone"""
         if self._file:
-            s = "%d" % timestamp
-            for col in self._header_values:
-                s += "," + str(data[col])
-            s += '\n'
-            self._file.write(s)
+            s = ",".join(["%d" % timestamp] +
+                         [str(data[col]) for col in self._header_values])
+            self._file.write(s + '\n')
+
+    def _new_binary_data(self, timestamp, data, logconf):
+        """Callback when new data arrives from the Espdrone"""
+        with self._lock:
+            if not self._writer:
+                return
+            if isinstance(data, dict):
+                data = tuple([data[name]
+                              for name in self._samples.dtype.names])
+            elif not isinstance(data, numpy.void):
+                data = tuple(data)
+            index = self._nbr_of_samples
+            self._samples[index] = data
+            self._timestamps[index] = timestamp
+            self._nbr_of_samples = index + 1
+            if (self._nbr_of_samples == CHUNK_SAMPLES or
+                    time.monotonic() - self._chunk_started > CHUNK_PERIOD):
+                self._flush_chunk()
 
     def writing(self):
         """Return True if the file is open and we are using it,
         otherwise false"""
-        return True if self._file else False
+        return True if self._file or self._writer else False
 
     def stop(self):
         """Stop the logging to file"""
+        if self._writer:
+            self._block.data_received_cb.remove_callback(
+                self._new_binary_data)
+            with self._lock:
+                self._flush_chunk()
+                writer = self._writer
+                self._writer = None
+            writer.close()
+            logger.info("Stopped logging of block [%s] to file [%s]",
+                        self._block.name, self._filename)
         if self._file:
             self._file.close()
             self._file = None
@@ -104,14 +257,156 @@ class LogWriter():
         except OSError:
             logger.debug("logdata directory already exists")
 
-        if not self._file:
+        if not self._file and not self._writer:
             time_now = datetime.datetime.now()
-            name = "{0}-{1}.csv".format(self._block.name,
+            extension = "edlog" if self._file_format == FORMAT_BINARY \
+                else "csv"
+            name = "{0}-{1}.{2}".format(self._block.name,
                                         time_now.strftime(
-                                            "%Y%m%dT%H-%M-%S"))
+                                            "%Y%m%dT%H-%M-%S"),
+                                        extension)
             self._filename = os.path.join(self._dir, name)
-            self._file = open(self._filename, 'w')
-            self._write_header()
-            self._block.data_received_cb.add_callback(self._new_data)
+            if self._file_format == FORMAT_BINARY:
+                self._file = open(self._filename, 'wb')
+                self._write_binary_header()
+                self._writer = _RecordingWriter(self._file,
+                                                self._compression)
+                self._file = None
+                self._writer.start()
+                self._block.data_received_cb.add_callback(
+                    self._new_binary_data)
+            else:
+                self._file = open(self._filename, 'w')
+                self._write_header()
+                self._block.data_received_cb.add_callback(self._new_data)
             logger.info("Started logging of block [%s] to file [%s]",
                         self._block.name, self._filename)
+
+
+class LogRecording():
+    """
+    A binary log recording read back from file. The file is memory-mapped,
+    the columns of uncompressed chunks are used without copying.
+    """
+
+    def __init__(self, filename):
+        self._filename = filename
+        with open(filename, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, toc_size = _FILE_HEADER.unpack_from(self._map)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("{} is not a log recording".format(filename))
+        offset = _FILE_HEADER.size
+        toc = json.loads(bytes(self._map[offset:offset + toc_size])
+                         .decode("utf-8"))
+        offset += toc_size
+
+        self.name = toc["name"]
+        self.period_ms = toc["period_ms"]
+        self.created = toc["created"]
+        self.dtype = numpy.dtype([tuple(v) for v in toc["variables"]])
+        self.variables = list(self.dtype.names)
+
+        # (compression, samples, data offset, data size) for each chunk, a
+        # chunk that was cut short by a crash is ignored
+        self._chunks = []
+        while offset + _CHUNK_HEADER.size <= len(self._map):
+            magic, compression, samples, size = _CHUNK_HEADER.unpack_from(
+                self._map, offset)
+            offset += _CHUNK_HEADER.size
+            if magic != _CHUNK_MAGIC or offset + size > len(self._map):
+                logger.warning("Ignoring truncated chunk in %s", filename)
+                break
+            self._chunks.append((compression, samples, offset, size))
+            offset += size
+
+    def __len__(self):
+        return sum(chunk[1] for chunk in self._chunks)
+
+    def iter_chunks(self):
+        """Yield the timestamps and a dict with the columns of each chunk"""
+        for compression, samples, offset, size in self._chunks:
+            data = memoryview(self._map)[offset:offset + size]
+            if compression == COMPRESSION_ZLIB:
+                data = zlib.decompress(data)
+            timestamps = numpy.frombuffer(data, _TIMESTAMP_TYPE, samples)
+            pos = timestamps.nbytes
+            columns = {}
+            for name in self.variables:
+                column = numpy.frombuffer(data, self.dtype[name], samples,
+                                          pos)
+                columns[name] = column
+                pos += column.nbytes
+            yield timestamps, columns
+
+    def columns(self):
+        """Return the timestamps and a dict with one array per variable"""
+        chunks = list(self.iter_chunks())
+        if not chunks:
+            return (numpy.zeros(0, _TIMESTAMP_TYPE),
+                    {name: numpy.zeros(0, self.dtype[name])
+                     for name in self.variables})
+        if len(chunks) == 1:
+            return chunks[0]
+        timestamps = numpy.concatenate([c[0] for c in chunks])
+        columns = {name: numpy.concatenate([c[1][name] for c in chunks])
+                   for name in self.variables}
+        return timestamps, columns
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # Arrays still use the mapping, it's closed when they are freed
+            pass
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def convert_recording(filename, destination):
+    """
+    Convert a binary recording to CSV, NumPy (.npz) or Parquet depending on
+    the extension of destination. Parquet requires pyarrow.
+    """
+    extension = os.path.splitext(destination)[1].lower()
+    with LogRecording(filename) as recording:
+        if extension == ".csv":
+            with open(destination, "w") as f:
+                f.write(",".join(["Timestamp"] + recording.variables) + "\n")
+                for timestamps, columns in recording.iter_chunks():
+                    rows = zip(timestamps.tolist(),
+                               *[columns[name].tolist()
+                                 for name in recording.variables])
+                    f.writelines(",".join(map(str, row)) + "\n"
+                                 for row in rows)
+        elif extension == ".npz":
+            timestamps, columns = recording.columns()
+            numpy.savez(destination, Timestamp=timestamps, **columns)
+        elif extension == ".parquet":
+            import pyarrow
+            import pyarrow.parquet
+            timestamps, columns = recording.columns()
+            table = pyarrow.table(
+                dict([("Timestamp", timestamps)] +
+                     [(name, columns[name]) for name in recording.variables]))
+            pyarrow.parquet.write_table(table, destination)
+        else:
+            raise ValueError("Unknown file type {}".format(extension))
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.stderr.write("Usage: {} <recording.edlog> "
+                         "<output.csv|.npz|.parquet>\n".format(sys.argv[0]))
+        sys.exit(1)
+    convert_recording(sys.argv[1], sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
@@ -28,59 +28,55 @@
 """
 Implementation of a periodic timer that will call a callback every time
 the timer expires once started.
+
+All timers share one scheduler thread and are run on absolute monotonic
+deadlines, so they do not drift by the time spent running the callbacks.
 """
 
 import logging
-from threading import Thread
 from edlib.utils.callbacks import Caller
-import time
+from edlib.utils.scheduler import Scheduler
+from edlib.utils.scheduler import TimerStats
 
 __author__ = 'Bitcraze AB'
 __all__ = ['PeriodicTimer']
 
 logger = logging.getLogger(__name__)
 
+# The client timers get their own thread so that slow UI and device
+# callbacks do not delay the timers on the edlib schedulers
+_scheduler = Scheduler("PeriodicTimers")
+
 
 class PeriodicTimer:
     """Create a periodic timer that will periodically call a callback"""
 
-    def __init__(self, period, callback):
+    def __init__(self, period, callback, scheduler=None):
         self._callbacks = Caller()
         self._callbacks.add_callback(callback)
-        self._started = False
         self._period = period
-        self._thread = None
+        self._scheduler = scheduler if scheduler else _scheduler
+        self._call = None
 
     def start(self):
         """Start the timer"""
-        if self._thread:
+        if self._call:
             logger.warning("Timer already started, not restarting")
             return
-        self._thread = _PeriodicTimerThread(self._period, self._callbacks)
-        self._thread.setDaemon(True)
-        self._thread.start()
+        self._call = self._scheduler.call_periodic(self._period,
+                                                   self._callbacks.call)
 
     def stop(self):
         """Stop the timer"""
-        if self._thread:
-            self._thread.stop()
-            self._thread = None
-
-
-class _PeriodicTimerThread(Thread):
-
-    def __init__(self, period, caller):
-        super(_PeriodicTimerThread, self).__init__()
-        self._period = period
-        self._callbacks = caller
-        self._stop = False
-
-    def stop(self):
-        self._stop = True
+        if self._call:
+            self._call.cancel()
+            self._call = None
 
-    def run(self):
-        while not self._stop:
-            time.sleep(self._period)
-            if self._stop:
-                break
-            self._callbacks.call()
+    def get_stats(self):
+        """
+        Return TimerStats with the number of calls, missed deadlines and the
+        jitter of the running timer
+        """
+        if self._call:
+            return self._call.get_stats()
+        return TimerStats(0, 0, 0.0, 0.0, 0.0)
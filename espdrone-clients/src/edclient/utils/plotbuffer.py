@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2021 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License along with
+#  this program; if not, write to the Free Software Foundation, Inc., 51
+#  Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Buffers and decimation for the plotted log data, kept free of Qt so they can
+be used and tested without a display.
+"""
+
+import numpy as np
+
+__author__ = 'Bitcraze AB'
+__all__ = ['PlotBuffer', 'decimate_min_max']
+
+
+class PlotBuffer:
+    """
+    Preallocated ring buffers holding the last max_history samples of a
+    curve. Every sample is stored twice, max_history elements apart, so any
+    range of samples is available as a contiguous view.
+    """
+
+    def __init__(self, max_history):
+        """Initialize"""
+        self._max_history = max_history
+        self._data = np.zeros(2 * max_history)
+        self._ts = np.zeros(2 * max_history)
+        # Total number of points added
+        self.count = 0
+
+    def add_point(self, p, ts):
+        """
+        Add a point to the buffer.
+
+        p - point
+        ts - timestamp in ms
+        """
+        i = self.count % self._max_history
+        self._data[i] = self._data[i + self._max_history] = p
+        self._ts[i] = self._ts[i + self._max_history] = ts
+        self.count += 1
+
+    def get(self, start, stop):
+        """
+        Return the timestamps and points of the samples from start up to
+        stop as views into the buffers. start and stop are sample numbers,
+        samples that are no longer in the history are skipped.
+        """
+        start = max(start, self.count - self._max_history, 0)
+        limit = max(min(stop, self.count), start)
+        offset = start % self._max_history
+        return (self._ts[offset:offset + limit - start],
+                self._data[offset:offset + limit - start])
+
+
+def decimate_min_max(ts, data, buckets):
+    """
+    Reduce the points to the min and max values of each of buckets equally
+    sized groups, keeping the order of the points. Points that do not fill
+    up a whole bucket at the end are kept as they are. NaN points are only
+    kept for groups that contain nothing else.
+    """
+    size = len(data) // buckets
+    if size == 0:
+        return ts, data
+    end = size * buckets
+    groups = data[:end].reshape(buckets, size)
+    nans = np.isnan(groups)
+    first = np.arange(0, end, size)
+    mins = first + np.where(nans, np.inf, groups).argmin(axis=1)
+    maxs = first + np.where(nans, -np.inf, groups).argmax(axis=1)
+    indexes = np.concatenate((np.sort(np.stack((mins, maxs), axis=1),
+                                      axis=1).ravel(),
+                              np.arange(end, len(data))))
+    return ts[indexes], data[indexes]
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2021 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import sys
+import threading
+import unittest
+
+from edclient.utils import input
+from edclient.utils.input import _InputLoopThread
+from edclient.utils.input import JoystickReader
+from edclient.utils.input import KEEP_ALIVE_PERIOD
+from edclient.utils.input.inputreaders.linuxjsdev import _JS
+
+if sys.version_info < (3, 3):
+    from mock import MagicMock, patch
+else:
+    from unittest.mock import MagicMock, patch
+
+
+class InputLoopThreadTest(unittest.TestCase):
+
+    def _start(self, filenos, callback):
+        sut = _InputLoopThread(callback, filenos, lambda: False)
+        sut.start()
+        self.addCleanup(sut.join, 1.0)
+        self.addCleanup(sut.stop)
+        return sut
+
+    def _wait_for_calls(self, count):
+        done = threading.Event()
+        calls = []
+
+        def callback():
+            calls.append(1)
+            if len(calls) >= count:
+                done.set()
+
+        return callback, done
+
+    def test_that_the_loop_keeps_polling_when_the_device_is_unplugged(self):
+        # Fixture
+        filenos = MagicMock(side_effect=Exception("Device not opened"))
+        callback, done = self._wait_for_calls(3)
+
+        # Test
+        sut = self._start(filenos, callback)
+
+        # Assert
+        self.assertTrue(done.wait(1.0))
+        self.assertTrue(sut.is_alive())
+
+    def test_that_the_loop_survives_callback_exceptions(self):
+        # Fixture
+        calls = []
+        done = threading.Event()
+
+        def callback():
+            calls.append(1)
+            if len(calls) >= 2:
+                done.set()
+            raise Exception("Error reading from input device")
+
+        # Test
+        sut = self._start(lambda: None, callback)
+
+        # Assert
+        self.assertTrue(done.wait(1.0))
+        self.assertTrue(sut.is_alive())
+
+    def test_that_stop_is_safe_after_the_loop_has_exited(self):
+        # Fixture
+        callback, done = self._wait_for_calls(1)
+        sut = self._start(lambda: None, callback)
+        self.assertTrue(done.wait(1.0))
+        sut.stop()
+        sut.join(1.0)
+
+        # Test
+        sut.stop()
+
+        # Assert
+        self.assertFalse(sut.is_alive())
+
+    def test_that_an_unopened_joystick_has_no_fileno(self):
+        # Fixture
+        sut = _JS(0, "js0")
+
+        # Test
+        actual = sut.fileno()
+
+        # Assert
+        self.assertIsNone(actual)
+
+
+class SendSetpointTest(unittest.TestCase):
+
+    def setUp(self):
+        # The reader is not constructed to avoid the device discovery and
+        # configuration
+        self.sut = JoystickReader.__new__(JoystickReader)
+        self.sut._last_setpoint = None
+        self.sut._last_setpoint_time = 0
+        self.sut._setpoint_changed = False
+        self.caller = MagicMock()
+
+        patcher = patch.object(input.time, "monotonic")
+        self.monotonic = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _send(self, now, *setpoint):
+        self.monotonic.return_value = now
+        self.sut._send_setpoint(self.caller, *setpoint)
+
+    def test_that_a_changed_setpoint_is_sent(self):
+        # Fixture
+        self._send(10.0, 0, 0, 0, 1000)
+
+        # Test
+        self._send(10.001, 0, 0, 0, 2000)
+
+        # Assert
+        self.assertEqual(2, self.caller.call.call_count)
+        self.caller.call.assert_called_with(0, 0, 0, 2000)
+        self.assertTrue(self.sut._setpoint_changed)
+
+    def test_that_an_unchanged_setpoint_is_not_resent_right_away(self):
+        # Fixture
+        self._send(10.0, 0, 0, 0, 1000)
+
+        # Test
+        self._send(10.0 + KEEP_ALIVE_PERIOD / 4, 0, 0, 0, 1000)
+
+        # Assert
+        self.assertEqual(1, self.caller.call.call_count)
+
+    def test_that_an_unchanged_setpoint_is_resent_to_keep_alive(self):
+        # Fixture
+        self._send(10.0, 0, 0, 0, 1000)
+        self.sut._setpoint_changed = False
+
+        # Test
+        self._send(10.0 + KEEP_ALIVE_PERIOD, 0, 0, 0, 1000)
+
+        # Assert
+        self.assertEqual(2, self.caller.call.call_count)
+        self.assertFalse(self.sut._setpoint_changed)
+
+    def test_that_the_keep_alive_period_restarts_when_resent(self):
+        # Fixture
+        self._send(10.0, 0, 0, 0, 1000)
+        self._send(10.0 + KEEP_ALIVE_PERIOD, 0, 0, 0, 1000)
+
+        # Test
+        self._send(10.0 + KEEP_ALIVE_PERIOD * 1.25, 0, 0, 0, 1000)
+
+        # Assert
+        self.assertEqual(2, self.caller.call.call_count)
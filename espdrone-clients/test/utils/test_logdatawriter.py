@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2021 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import csv
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy
+
+import edclient
+from edclient.utils import logdatawriter
+from edclient.utils.logdatawriter import COMPRESSION_NONE
+from edclient.utils.logdatawriter import convert_recording
+from edclient.utils.logdatawriter import FORMAT_CSV
+from edclient.utils.logdatawriter import LogRecording
+from edclient.utils.logdatawriter import LogWriter
+from edlib.espdrone.log import LogConfig
+
+if sys.version_info < (3, 3):
+    from mock import patch
+else:
+    from unittest.mock import patch
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+SAMPLES = [
+    (1000, {"stabilizer.roll": 0.5, "pm.state": 1}),
+    (1010, {"stabilizer.roll": -1.25, "pm.state": 2}),
+    (1020, {"stabilizer.roll": 3.0, "pm.state": -3}),
+]
+
+
+class LogDataWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        patcher = patch.object(edclient, "config_path", self.dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.logconf = LogConfig("block", 10)
+        self.logconf.add_variable("stabilizer.roll", "float")
+        self.logconf.add_variable("pm.state", "int8_t")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_that_recording_is_read_back(self):
+        # Fixture
+
+        # Test
+        filename = self._record(SAMPLES)
+
+        # Assert
+        with LogRecording(filename) as recording:
+            self.assertEqual("block", recording.name)
+            self.assertEqual(10, recording.period_ms)
+            self.assertEqual(["stabilizer.roll", "pm.state"],
+                             recording.variables)
+            self.assertEqual(3, len(recording))
+            timestamps, columns = recording.columns()
+            self._assert_samples(SAMPLES, timestamps, columns)
+
+    @patch.object(logdatawriter, "CHUNK_SAMPLES", 2)
+    def test_that_uncompressed_chunks_are_read_back(self):
+        # Fixture
+
+        # Test
+        filename = self._record(SAMPLES, compression=COMPRESSION_NONE)
+
+        # Assert
+        with LogRecording(filename) as recording:
+            chunks = list(recording.iter_chunks())
+            self.assertEqual([2, 1], [len(c[0]) for c in chunks])
+            timestamps, columns = recording.columns()
+            self._assert_samples(SAMPLES, timestamps, columns)
+
+    def test_that_tuple_samples_are_recorded(self):
+        # Fixture
+        samples = [(ts, tuple(data.values())) for ts, data in SAMPLES]
+
+        # Test
+        filename = self._record(samples)
+
+        # Assert
+        with LogRecording(filename) as recording:
+            timestamps, columns = recording.columns()
+            self._assert_samples(SAMPLES, timestamps, columns)
+
+    def test_that_empty_recording_has_empty_columns(self):
+        # Fixture
+
+        # Test
+        filename = self._record([])
+
+        # Assert
+        with LogRecording(filename) as recording:
+            timestamps, columns = recording.columns()
+            self.assertEqual(0, len(recording))
+            self.assertEqual(0, len(timestamps))
+            self.assertEqual(0, len(columns["pm.state"]))
+
+    def test_that_truncated_chunk_is_ignored(self):
+        # Fixture
+        filename = self._record(SAMPLES)
+        with open(filename, "ab") as f:
+            f.write(b"CHNK\x01")
+
+        # Test
+        with LogRecording(filename) as recording:
+            # Assert
+            self.assertEqual(3, len(recording))
+
+    def test_that_other_files_are_rejected(self):
+        # Fixture
+        filename = os.path.join(self.dir, "other.edlog")
+        with open(filename, "wb") as f:
+            f.write(b"Timestamp,stabilizer.roll\n")
+
+        # Test
+        # Assert
+        with self.assertRaises(ValueError):
+            LogRecording(filename)
+
+    def test_that_recording_is_converted_to_csv(self):
+        # Fixture
+        filename = self._record(SAMPLES)
+        destination = os.path.join(self.dir, "block.csv")
+
+        # Test
+        convert_recording(filename, destination)
+
+        # Assert
+        with open(destination) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(["Timestamp", "stabilizer.roll", "pm.state"],
+                         rows[0])
+        self.assertEqual(
+            [[str(ts), str(data["stabilizer.roll"]), str(data["pm.state"])]
+             for ts, data in SAMPLES], rows[1:])
+
+    def test_that_recording_is_converted_to_npz(self):
+        # Fixture
+        filename = self._record(SAMPLES)
+        destination = os.path.join(self.dir, "block.npz")
+
+        # Test
+        convert_recording(filename, destination)
+
+        # Assert
+        with numpy.load(destination) as npz:
+            self._assert_samples(SAMPLES, npz["Timestamp"], npz)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_that_recording_is_converted_to_parquet(self):
+        # Fixture
+        filename = self._record(SAMPLES)
+        destination = os.path.join(self.dir, "block.parquet")
+
+        # Test
+        convert_recording(filename, destination)
+
+        # Assert
+        table = pyarrow.parquet.read_table(destination).to_pydict()
+        self._assert_samples(SAMPLES, table["Timestamp"], table)
+
+    def test_that_unknown_destination_type_raises(self):
+        # Fixture
+        filename = self._record(SAMPLES)
+
+        # Test
+        # Assert
+        with self.assertRaises(ValueError):
+            convert_recording(filename, os.path.join(self.dir, "block.txt"))
+
+    def test_that_csv_format_is_still_written(self):
+        # Fixture
+
+        # Test
+        filename = self._record(SAMPLES, file_format=FORMAT_CSV)
+
+        # Assert
+        with open(filename) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(["Timestamp", "stabilizer.roll", "pm.state"],
+                         rows[0])
+        self.assertEqual(["1010", "-1.25", "2"], rows[2])
+
+    def _record(self, samples, **kwargs):
+        sut = LogWriter(self.logconf, datetime.datetime.now(), **kwargs)
+        sut.start()
+        for timestamp, data in samples:
+            self.logconf.data_received_cb.call(timestamp, data, self.logconf)
+        sut.stop()
+        self.assertFalse(sut.writing())
+        return sut._filename
+
+    def _assert_samples(self, expected, timestamps, columns):
+        self.assertEqual([ts for ts, _ in expected], list(timestamps))
+        for name in ("stabilizer.roll", "pm.state"):
+            self.assertEqual([data[name] for _, data in expected],
+                             list(columns[name]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2021 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import unittest
+
+import numpy
+
+from edclient.utils.plotbuffer import decimate_min_max
+from edclient.utils.plotbuffer import PlotBuffer
+
+
+class PlotBufferTest(unittest.TestCase):
+
+    def test_that_all_points_are_returned_before_wraparound(self):
+        # Fixture
+        sut = PlotBuffer(5)
+        for i in range(3):
+            sut.add_point(i * 2, i * 10)
+
+        # Test
+        ts, data = sut.get(0, 10)
+
+        # Assert
+        self.assertEqual([0, 10, 20], list(ts))
+        self.assertEqual([0, 2, 4], list(data))
+
+    def test_that_only_the_history_is_returned_after_wraparound(self):
+        # Fixture
+        sut = PlotBuffer(5)
+        for i in range(12):
+            sut.add_point(i, i * 10)
+
+        # Test
+        ts, data = sut.get(0, 12)
+
+        # Assert
+        self.assertEqual([7, 8, 9, 10, 11], list(data))
+        self.assertEqual([70, 80, 90, 100, 110], list(ts))
+
+    def test_that_a_range_crossing_the_buffer_end_is_contiguous(self):
+        # Fixture
+        sut = PlotBuffer(5)
+        for i in range(12):
+            sut.add_point(i, i * 10)
+
+        # Test
+        ts, data = sut.get(9, 11)
+
+        # Assert
+        self.assertEqual([9, 10], list(data))
+        self.assertEqual([90, 100], list(ts))
+
+    def test_that_a_range_outside_the_history_is_empty(self):
+        # Fixture
+        sut = PlotBuffer(5)
+        for i in range(12):
+            sut.add_point(i, i * 10)
+
+        # Test
+        ts, data = sut.get(0, 5)
+
+        # Assert
+        self.assertEqual(0, len(ts))
+        self.assertEqual(0, len(data))
+
+
+class DecimateMinMaxTest(unittest.TestCase):
+
+    def test_that_min_and_max_of_each_bucket_are_kept_in_order(self):
+        # Fixture
+        ts = numpy.arange(8.0)
+        data = numpy.array([3.0, 1.0, 4.0, 2.0, 5.0, 9.0, 0.0, 6.0])
+
+        # Test
+        actual_ts, actual_data = decimate_min_max(ts, data, 2)
+
+        # Assert
+        self.assertEqual([1.0, 2.0, 5.0, 6.0], list(actual_ts))
+        self.assertEqual([1.0, 4.0, 9.0, 0.0], list(actual_data))
+
+    def test_that_trailing_points_are_kept(self):
+        # Fixture
+        ts = numpy.arange(7.0)
+        data = numpy.array([3.0, 1.0, 4.0, 2.0, 5.0, 0.0, 7.0])
+
+        # Test
+        actual_ts, actual_data = decimate_min_max(ts, data, 2)
+
+        # Assert
+        self.assertEqual([1.0, 2.0, 4.0, 5.0, 6.0], list(actual_ts))
+        self.assertEqual([1.0, 4.0, 5.0, 0.0, 7.0], list(actual_data))
+
+    def test_that_fewer_points_than_buckets_are_returned_as_is(self):
+        # Fixture
+        ts = numpy.arange(3.0)
+        data = numpy.array([3.0, 1.0, 4.0])
+
+        # Test
+        actual_ts, actual_data = decimate_min_max(ts, data, 10)
+
+        # Assert
+        self.assertEqual([0.0, 1.0, 2.0], list(actual_ts))
+        self.assertEqual([3.0, 1.0, 4.0], list(actual_data))
+
+    def test_that_nan_does_not_hide_the_min_and_max(self):
+        # Fixture
+        ts = numpy.arange(4.0)
+        data = numpy.array([2.0, numpy.nan, 5.0, -1.0])
+
+        # Test
+        actual_ts, actual_data = decimate_min_max(ts, data, 1)
+
+        # Assert
+        self.assertEqual([2.0, 3.0], list(actual_ts))
+        self.assertEqual([5.0, -1.0], list(actual_data))
+
+    def test_that_an_all_nan_bucket_is_kept_as_nan(self):
+        # Fixture
+        ts = numpy.arange(4.0)
+        data = numpy.array([numpy.nan, numpy.nan, 1.0, 2.0])
+
+        # Test
+        actual_ts, actual_data = decimate_min_max(ts, data, 2)
+
+        # Assert
+        self.assertEqual([0.0, 0.0, 2.0, 3.0], list(actual_ts))
+        self.assertTrue(numpy.isnan(actual_data[:2]).all())
+        self.assertEqual([1.0, 2.0], list(actual_data[2:]))
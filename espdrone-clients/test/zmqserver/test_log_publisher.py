@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2021 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import json
+import sys
+import unittest
+
+import numpy
+import zmq
+
+from cfzmq import _LogPublisher
+from edlib.espdrone.log import LogConfig
+
+if sys.version_info < (3, 3):
+    from mock import MagicMock
+else:
+    from unittest.mock import MagicMock
+
+
+class LogPublisherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = zmq.Context()
+        address = "inproc://test-log-publisher"
+        self.pull = self.context.socket(zmq.PULL)
+        self.pull.bind(address)
+        self.push = self.context.socket(zmq.PUSH)
+        self.push.connect(address)
+
+        self.conf = MagicMock(spec=LogConfig)
+        self.conf.name = "block"
+        self.conf.period_in_ms = 10
+        self.conf.get_dtype.return_value = numpy.dtype(
+            [("stabilizer.roll", "<f4"), ("pm.state", "<i1")])
+
+    def tearDown(self):
+        self.push.close(linger=0)
+        self.pull.close(linger=0)
+        self.context.term()
+
+    def test_that_schema_describes_timestamps_and_variables(self):
+        # Fixture
+        sut = _LogPublisher(self.push, "log/uri/block", self.conf)
+
+        # Test
+        sut.publish_schema()
+
+        # Assert
+        topic, kind, payload = self._recv()
+        self.assertEqual(b"log/uri/block", topic)
+        self.assertEqual(b"schema", kind)
+        schema = json.loads(payload.decode("utf-8"))
+        self.assertEqual("block", schema["name"])
+        self.assertEqual(10, schema["period"])
+        dtype = numpy.dtype([tuple(f) for f in schema["fields"]])
+        self.assertEqual(("timestamp", "host_timestamp", "stabilizer.roll",
+                          "pm.state"), dtype.names)
+
+    def test_that_each_sample_is_published_without_batching(self):
+        # Fixture
+        sut = _LogPublisher(self.push, "log/uri/block", self.conf)
+
+        # Test
+        sut.add(1, 100.5, (0.5, 2), self.conf)
+        sut.add(2, 100.5, (1.5, 3), self.conf)
+
+        # Assert
+        self.assertEqual([(1, 100.5, 0.5, 2)], self._recv_samples(sut))
+        self.assertEqual([(2, 100.5, 1.5, 3)], self._recv_samples(sut))
+
+    def test_that_samples_are_batched_on_count(self):
+        # Fixture
+        sut = _LogPublisher(self.push, "log/uri/block", self.conf,
+                            batch_count=3)
+
+        # Test
+        for ts in range(1, 4):
+            sut.add(ts, 100.5, (0.5, ts), self.conf)
+
+        # Assert
+        self.assertEqual([(1, 100.5, 0.5, 1), (2, 100.5, 0.5, 2),
+                          (3, 100.5, 0.5, 3)], self._recv_samples(sut))
+
+    def test_that_samples_are_batched_on_period(self):
+        # Fixture
+        sut = _LogPublisher(self.push, "log/uri/block", self.conf,
+                            batch_count=100, batch_period=50)
+        self.addCleanup(sut.close)
+
+        # Test
+        sut.add(1, 100.5, (0.5, 1), self.conf)
+        sut.add(2, 100.5, (0.5, 2), self.conf)
+
+        # Assert
+        self.assertEqual([(1, 100.5, 0.5, 1), (2, 100.5, 0.5, 2)],
+                         self._recv_samples(sut))
+
+    def test_that_pending_samples_are_flushed_without_new_samples(self):
+        # Fixture
+        sut = _LogPublisher(self.push, "log/uri/block", self.conf,
+                            batch_count=100, batch_period=10)
+        self.addCleanup(sut.close)
+
+        # Test
+        sut.add(1, 100.5, (0.5, 1), self.conf)
+
+        # Assert
+        self.assertEqual([(1, 100.5, 0.5, 1)], self._recv_samples(sut))
+
+    def test_that_close_publishes_pending_samples_and_stops_timer(self):
+        # Fixture
+        sut = _LogPublisher(self.push, "log/uri/block", self.conf,
+                            batch_count=100, batch_period=10000)
+        sut.add(1, 100.5, (0.5, 1), self.conf)
+
+        # Test
+        sut.close()
+
+        # Assert
+        self.assertEqual([(1, 100.5, 0.5, 1)], self._recv_samples(sut))
+        self.assertTrue(sut._timer.cancelled)
+
+    def test_that_flush_publishes_partial_batch_once(self):
+        # Fixture
+        sut = _LogPublisher(self.push, "log/uri/block", self.conf,
+                            batch_count=10)
+        sut.add(1, 100.5, (0.5, 1), self.conf)
+
+        # Test
+        sut.flush()
+        sut.flush()
+
+        # Assert
+        self.assertEqual([(1, 100.5, 0.5, 1)], self._recv_samples(sut))
+        self.assertFalse(self.pull.poll(20))
+
+    def test_that_missing_host_timestamp_is_nan(self):
+        # Fixture
+        sut = _LogPublisher(self.push, "log/uri/block", self.conf)
+
+        # Test
+        sut.add(1, None, (0.5, 1), self.conf)
+
+        # Assert
+        self.assertTrue(numpy.isnan(self._recv_samples(sut)[0][1]))
+
+    def test_that_event_is_published_as_json(self):
+        # Fixture
+        sut = _LogPublisher(self.push, "log/uri/block", self.conf)
+
+        # Test
+        sut.publish_event({"event": "started"})
+
+        # Assert
+        topic, kind, payload = self._recv()
+        self.assertEqual(b"event", kind)
+        self.assertEqual({"event": "started"},
+                         json.loads(payload.decode("utf-8")))
+
+    def _recv(self):
+        if not self.pull.poll(1000):
+            self.fail("Nothing was published")
+        return self.pull.recv_multipart()
+
+    def _recv_samples(self, sut):
+        topic, kind, payload = self._recv()
+        self.assertEqual(b"data", kind)
+        dtype = numpy.dtype([tuple(f) for f in sut.schema()["fields"]])
+        return numpy.frombuffer(payload, dtype).tolist()
+
+
+if __name__ == "__main__":
+    unittest.main()
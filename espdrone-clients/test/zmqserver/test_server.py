@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2021 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import json
+import sys
+import threading
+import unittest
+
+import numpy
+import zmq
+
+import cfzmq
+from cfzmq import _SrvThread
+from edlib.espdrone import Espdrone
+from edlib.espdrone.log import Log
+from edlib.espdrone.log import LogConfig
+from edlib.espdrone.param import Param
+from edlib.espdrone.param import ParamTocElement
+from edlib.espdrone.toc import Toc
+from edlib.utils.callbacks import Caller
+
+if sys.version_info < (3, 3):
+    from mock import MagicMock, patch
+else:
+    from unittest.mock import MagicMock, patch
+
+URI = "udp://192.168.43.42"
+
+
+class SrvThreadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.espdrones = []
+        self.open_link = None
+        self.context = zmq.Context()
+        self.sockets = []
+        name = "inproc://test-srv-{}".format(id(self))
+
+        router = self._socket(zmq.ROUTER)
+        router.bind(name + "-cmd")
+        self.log = self._socket(zmq.PUB)
+        self.log.bind(name + "-log")
+        param = self._socket(zmq.PUB)
+        param.bind(name + "-param")
+        conn = self._socket(zmq.PUB)
+        conn.bind(name + "-conn")
+
+        self.client = self._socket(zmq.DEALER)
+        self.client.connect(name + "-cmd")
+        self.log_sub = self._socket(zmq.SUB)
+        self.log_sub.setsockopt(zmq.SUBSCRIBE, b"")
+        self.log_sub.connect(name + "-log")
+
+        self.sut = _SrvThread(self.context, router, self.log, param, conn,
+                              self._create_espdrone,
+                              wire_format=cfzmq.FORMAT_BINARY)
+        self.sut.start()
+
+    def tearDown(self):
+        # The server thread is a daemon blocked on its poller, the context
+        # is left to be collected with it
+        for socket in self.sockets:
+            socket.setsockopt(zmq.LINGER, 0)
+
+    def test_that_connect_replies_when_tocs_are_updated(self):
+        # Fixture
+        self._open_link_connects()
+
+        # Test
+        self._send({"cmd": "connect", "uri": URI, "id": 1})
+
+        # Assert
+        resp = self._recv()
+        self.assertEqual({"version": 1, "status": 0, "uri": URI, "log": {},
+                          "param": {}, "id": 1}, resp)
+        self.espdrones[0].open_link.assert_called_once_with(URI)
+
+    def test_that_connect_replies_param_values_as_strings(self):
+        # Fixture
+        def open_link(ed, uri):
+            ed.param.toc.add_element(
+                ParamTocElement(0, b"\x08ring\x00effect\x00"))
+            ed.param.values = {"ring": {"effect": 3}}
+            _later(ed.param.all_updated.call)
+
+        self.open_link = open_link
+
+        # Test
+        self._send({"cmd": "connect", "uri": URI})
+
+        # Assert
+        resp = self._recv()
+        self.assertEqual({"ring": {"effect": {"type": "uint8_t",
+                                              "access": "RW",
+                                              "value": "3"}}},
+                         resp["param"])
+
+    @patch("cfzmq.CONNECT_TIMEOUT", 0.05)
+    def test_that_connect_times_out(self):
+        # Fixture
+
+        # Test
+        self._send({"cmd": "connect", "uri": URI})
+
+        # Assert
+        resp = self._recv()
+        self.assertEqual(2, resp["status"])
+
+    def test_that_failed_connection_is_replied(self):
+        # Fixture
+        self.open_link = lambda ed, uri: _later(
+            ed.connection_failed.call, uri, "No answer")
+
+        # Test
+        self._send({"cmd": "connect", "uri": URI})
+
+        # Assert
+        resp = self._recv()
+        self.assertEqual({"version": 1, "status": 1, "msg": "No answer"},
+                         resp)
+
+    def test_that_espdrone_is_reused_after_disconnect(self):
+        # Fixture
+        self._open_link_connects()
+        self._send({"cmd": "connect", "uri": URI})
+        self._recv()
+        self._send({"cmd": "disconnect", "uri": URI})
+        self.assertEqual(0, self._recv()["status"])
+
+        # Test
+        self._send({"cmd": "connect", "uri": URI})
+
+        # Assert
+        self.assertEqual(0, self._recv()["status"])
+        self.assertEqual(1, len(self.espdrones))
+        ed = self.espdrones[0]
+        ed.close_link.assert_called_once_with()
+        self.assertEqual(2, ed.open_link.call_count)
+
+    def test_that_commands_need_a_connection(self):
+        # Fixture
+
+        # Test
+        self._send({"cmd": "param", "name": "a.b", "value": 1, "id": 3})
+
+        # Assert
+        resp = self._recv()
+        self.assertEqual(0xFE, resp["status"])
+        self.assertEqual(3, resp["id"])
+
+    def test_that_disconnected_session_does_not_take_commands(self):
+        # Fixture
+        self._connect()
+        self._send({"cmd": "disconnect"})
+        self._recv()
+
+        # Test
+        self._send({"cmd": "param", "name": "a.b", "value": 1})
+
+        # Assert
+        self.assertEqual(0xFE, self._recv()["status"])
+
+    def test_that_unknown_command_is_replied(self):
+        # Fixture
+
+        # Test
+        self._send({"cmd": "jump"})
+
+        # Assert
+        self.assertEqual(0xFF, self._recv()["status"])
+
+    def test_that_invalid_json_is_replied(self):
+        # Fixture
+
+        # Test
+        self.client.send(b"{not json")
+
+        # Assert
+        self.assertEqual(0xFF, self._recv()["status"])
+
+    @patch("edlib.crtp.scan_interfaces")
+    def test_that_scans_are_replied_from_their_threads(self, scan):
+        # Fixture
+        scan.return_value = [["192.168.43.42", ""]]
+
+        # Test
+        for i in range(3):
+            self._send({"cmd": "scan", "id": i})
+
+        # Assert
+        replies = [self._recv() for _ in range(3)]
+        self.assertEqual([0, 1, 2], sorted(r["id"] for r in replies))
+        self.assertEqual([{"uri": "192.168.43.42", "info": ""}],
+                         replies[0]["interfaces"])
+        self.assertTrue(self.sut._replies.empty())
+
+    def test_that_replies_are_sent_when_the_espdrone_answers(self):
+        # Fixture
+        ed = self._connect()
+        written = self._count_set_values(ed, 2)
+
+        # Test
+        self._send({"cmd": "param", "name": "a.x", "value": 1, "id": 1})
+        self._send({"cmd": "param", "name": "a.y", "value": 2, "id": 2})
+        self.assertTrue(written.wait(1))
+        ed.param.all_update_callback.call("a.y", "2")
+        ed.param.all_update_callback.call("a.x", "1")
+
+        # Assert
+        self.assertEqual({"version": 1, "status": 0, "name": "a.y",
+                          "value": "2", "id": 2}, self._recv())
+        self.assertEqual({"version": 1, "status": 0, "name": "a.x",
+                          "value": "1", "id": 1}, self._recv())
+
+    def test_that_param_batch_is_replied_when_all_are_confirmed(self):
+        # Fixture
+        ed = self._connect()
+        written = self._count_set_values(ed, 1)
+
+        # Test
+        self._send({"cmd": "param", "values": {"a.x": 1, "a.y": 2}})
+        self.assertTrue(written.wait(1))
+        ed.param.all_update_callback.call("a.x", "1")
+        self.assertFalse(self.client.poll(50))
+        ed.param.all_update_callback.call("a.y", "2")
+
+        # Assert
+        self.assertEqual({"version": 1, "status": 0,
+                          "values": {"a.x": "1", "a.y": "2"}}, self._recv())
+
+    @patch("cfzmq.PARAM_TIMEOUT", 0.05)
+    def test_that_param_batch_times_out_with_the_missing_names(self):
+        # Fixture
+        ed = self._connect()
+        written = self._count_set_values(ed, 1)
+
+        # Test
+        self._send({"cmd": "param", "values": {"a.x": 1, "a.y": 2}})
+        self.assertTrue(written.wait(1))
+        ed.param.all_update_callback.call("a.x", "1")
+
+        # Assert
+        resp = self._recv()
+        self.assertEqual(3, resp["status"])
+        self.assertIn("a.y", resp["msg"])
+        self.assertEqual({"a.x": "1"}, resp["values"])
+
+    def test_that_unknown_param_is_replied(self):
+        # Fixture
+        ed = self._connect()
+        ed.param.set_values.side_effect = KeyError("a.z")
+
+        # Test
+        self._send({"cmd": "param", "name": "a.z", "value": 1})
+
+        # Assert
+        self.assertEqual(1, self._recv()["status"])
+        ed.param.all_update_callback.call("a.z", "1")
+        self.assertFalse(self.client.poll(50))
+
+    @patch.object(LogConfig, "create")
+    @patch.object(LogConfig, "get_dtype",
+                  return_value=numpy.dtype([("a.x", "<f4")]))
+    def test_that_log_block_is_created_with_schema(self, *mocks):
+        # Fixture
+        ed = self._connect()
+        added = threading.Event()
+        ed.log.add_config.side_effect = lambda conf: added.set()
+
+        # Test
+        self._send({"cmd": "log", "action": "create", "name": "block",
+                    "period": 10, "variables": ["a.x"], "id": 4})
+        self.assertTrue(added.wait(1))
+        conf = ed.log.add_config.call_args[0][0]
+        conf.added_cb.call(conf, True)
+
+        # Assert
+        self.assertEqual({"version": 1, "status": 0, "id": 4}, self._recv())
+        topic, kind, payload = self._recv_log()
+        self.assertEqual("log/{}/block".format(URI).encode("utf-8"), topic)
+        self.assertEqual(b"schema", kind)
+        self._send({"cmd": "log", "action": "schema", "name": "block"})
+        resp = self._recv()
+        self.assertEqual(["timestamp", "host_timestamp", "a.x"],
+                         [f[0] for f in resp["schema"]["fields"]])
+
+    @patch.object(LogConfig, "create")
+    @patch.object(LogConfig, "delete")
+    @patch.object(LogConfig, "get_dtype",
+                  return_value=numpy.dtype([("a.x", "<f4")]))
+    def test_that_pending_log_batch_is_published_on_delete(self, get_dtype,
+                                                           delete, create):
+        # Fixture
+        ed = self._connect()
+        added = threading.Event()
+        ed.log.add_config.side_effect = lambda conf: added.set()
+        deleted = threading.Event()
+        delete.side_effect = deleted.set
+        self._send({"cmd": "log", "action": "create", "name": "block",
+                    "period": 10, "variables": ["a.x"], "batch_count": 10})
+        self.assertTrue(added.wait(1))
+        conf = ed.log.add_config.call_args[0][0]
+        conf.added_cb.call(conf, True)
+        self._recv()
+        self._recv_log()
+        self._recv_log()
+        conf.sample_received_cb.call(1, 100.5, (0.5,), conf)
+
+        # Test
+        self._send({"cmd": "log", "action": "delete", "name": "block"})
+        self.assertTrue(deleted.wait(1))
+        conf.added_cb.call(conf, False)
+
+        # Assert
+        topic, kind, payload = self._recv_log()
+        self.assertEqual(b"data", kind)
+        self.assertEqual(
+            [(1, 100.5, 0.5)],
+            numpy.frombuffer(payload, [("timestamp", "<u8"),
+                                       ("host_timestamp", "<f8"),
+                                       ("a.x", "<f4")]).tolist())
+
+    def test_that_unknown_log_block_is_replied(self):
+        # Fixture
+        self._connect()
+
+        # Test
+        self._send({"cmd": "log", "action": "start", "name": "missing"})
+
+        # Assert
+        self.assertEqual(1, self._recv()["status"])
+
+    def _socket(self, kind):
+        socket = self.context.socket(kind)
+        self.sockets.append(socket)
+        return socket
+
+    def _create_espdrone(self):
+        ed = MagicMock(spec=Espdrone)
+        ed.connected = Caller()
+        ed.connection_failed = Caller()
+        ed.connection_lost = Caller()
+        ed.disconnected = Caller()
+        ed.connection_requested = Caller()
+        ed.is_connected.return_value = False
+        ed.param = MagicMock(spec=Param)
+        ed.param.all_updated = Caller()
+        ed.param.all_update_callback = Caller()
+        ed.param.toc = Toc()
+        ed.param.values = {}
+        ed.param.is_updated = False
+        ed.log = MagicMock(spec=Log)
+        ed.log.toc = Toc()
+        ed.open_link.side_effect = lambda uri: self.open_link and \
+            self.open_link(ed, uri)
+        self.espdrones.append(ed)
+        return ed
+
+    def _open_link_connects(self):
+        self.open_link = lambda ed, uri: _later(ed.param.all_updated.call)
+
+    def _connect(self):
+        self._open_link_connects()
+        self._send({"cmd": "connect", "uri": URI})
+        self.assertEqual(0, self._recv()["status"])
+        return self.espdrones[0]
+
+    def _count_set_values(self, ed, count):
+        written = threading.Event()
+        calls = []
+
+        def set_values(values):
+            calls.append(values)
+            if len(calls) == count:
+                written.set()
+
+        ed.param.set_values.side_effect = set_values
+        return written
+
+    def _send(self, cmd):
+        self.client.send(json.dumps(cmd).encode("utf-8"))
+
+    def _recv(self):
+        if not self.client.poll(1000):
+            self.fail("No reply")
+        return json.loads(self.client.recv().decode("utf-8"))
+
+    def _recv_log(self):
+        if not self.log_sub.poll(1000):
+            self.fail("Nothing was published")
+        return self.log_sub.recv_multipart()
+
+
+def _later(function, *args):
+    timer = threading.Timer(0.01, function, args)
+    timer.daemon = True
+    timer.start()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+"""
+Asyncio version of the Espdrone API. The callbacks of the Espdrone API
+are turned into awaitables and async iterators, so one event loop can drive
+many Espdrones:
+
+    async with AsyncEspdrone('192.168.43.42') as aed:
+        await aed.param.set('ring.effect', 7)
+        async for timestamp, data, logconf in aed.log.stream(logconf):
+            ...
+
+The link is an AsyncUdpDriver that receives the packets on the loop, and
+the resends of unanswered requests are timers of the loop. The TOC, param,
+log and mem state machines of the Espdrone are therefore driven from the
+loop, without any thread per Espdrone. The Espdrone of an AsyncEspdrone
+must only be used from the loop, except for sending packets (the setpoint
+streamer for instance sends from a thread of its own).
+"""
+import asyncio
+
+from edlib.aio.udpdriver import AsyncUdpDriver
+from edlib.espdrone import Espdrone
+
+__author__ = 'Bitcraze AB'
+__all__ = ['AsyncEspdrone', 'AsyncLog', 'AsyncMemory', 'AsyncParam',
+           'AsyncUdpDriver']
+
+
+def _resolve(loop, future, result=None, exception=None):
+    """Set the result of future from any thread"""
+    def set_result():
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    loop.call_soon_threadsafe(set_result)
+
+
+def _remove_callback(container, callback):
+    try:
+        container.remove_callback(callback)
+    except ValueError:
+        pass
+
+
+class _LoopScheduler:
+    """Runs the timers of an Espdrone on the loop of an AsyncEspdrone"""
+
+    def __init__(self, aed):
+        self._aed = aed
+
+    def call_later(self, delay, callback, *args):
+        return self._aed._link_loop.call_later(delay, callback, *args)
+
+
+class AsyncEspdrone:
+    """Asyncio version of SyncEspdrone"""
+
+    def __init__(self, link_uri, ed=None, loop=None):
+        """ Create an asynchronous Espdrone instance with the specified
+        link_uri """
+        self.ed = ed if ed else Espdrone(scheduler=_LoopScheduler(self))
+        self._link_uri = link_uri
+        self._loop = loop
+        # The loop the link runs on while it is open
+        self._link_loop = None
+        self._is_link_open = False
+
+        self.param = AsyncParam(self)
+        self.log = AsyncLog(self)
+        self.mem = AsyncMemory(self)
+
+    @property
+    def loop(self):
+        """The event loop, only valid when called from a coroutine"""
+        if self._loop is not None:
+            return self._loop
+        return asyncio.get_running_loop()
+
+    async def connect(self):
+        """
+        Open the link and wait until the TOCs have been downloaded. Raises
+        an exception if the connection fails.
+        """
+        if self._is_link_open:
+            raise Exception('Link already open')
+
+        loop = self.loop
+        future = loop.create_future()
+
+        def connected(link_uri):
+            _resolve(loop, future)
+
+        def connection_failed(link_uri, msg):
+            _resolve(loop, future, exception=Exception(msg))
+
+        self.ed.connected.add_callback(connected)
+        self.ed.connection_failed.add_callback(connection_failed)
+        self._link_loop = loop
+        try:
+            self.ed.open_link(self._link_uri, link=AsyncUdpDriver(
+                loop, self.ed.incoming.dispatch))
+            await future
+        except BaseException:
+            self._link_loop = None
+            raise
+        finally:
+            _remove_callback(self.ed.connected, connected)
+            _remove_callback(self.ed.connection_failed, connection_failed)
+            # open_link can report the failure and then raise, the future
+            # is abandoned and its exception must not be reported as lost
+            if not future.done():
+                future.cancel()
+            elif not future.cancelled():
+                future.exception()
+        self._is_link_open = True
+
+    async def disconnect(self):
+        """Close the link"""
+        self.ed.close_link()
+        self._link_loop = None
+        self._is_link_open = False
+
+    def is_link_open(self):
+        return self._is_link_open
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.disconnect()
+
+
+class AsyncParam:
+    """Awaitable access to the parameters of an Espdrone"""
+
+    def __init__(self, aed):
+        self._aed = aed
+
+    async def _wait_for_update(self, complete_name, request, timeout):
+        """
+        Call request and wait for the next value of the parameter. Raises
+        asyncio.TimeoutError if it does not arrive within timeout seconds
+        (None waits forever).
+        """
+        param = self._aed.ed.param
+        loop = self._aed.loop
+        future = loop.create_future()
+        [group, name] = complete_name.split('.')
+
+        def updated(updated_name, value):
+            _resolve(loop, future, param.get_value(updated_name))
+
+        param.add_update_callback(group=group, name=name, cb=updated)
+        try:
+            request()
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            param.remove_update_callback(group=group, name=name, cb=updated)
+
+    async def get(self, complete_name, timeout=None):
+        """
+        Read the value of a parameter from the Espdrone. Raises
+        asyncio.TimeoutError if no value arrives within timeout seconds.
+        """
+        param = self._aed.ed.param
+        return await self._wait_for_update(
+            complete_name,
+            lambda: param.request_param_update(complete_name), timeout)
+
+    async def set(self, complete_name, value, timeout=None):
+        """
+        Set the value of a parameter and wait until the Espdrone has
+        confirmed it. Returns the value reported back, raises
+        asyncio.TimeoutError if it is not confirmed within timeout seconds.
+        """
+        param = self._aed.ed.param
+        return await self._wait_for_update(
+            complete_name, lambda: param.set_value(complete_name, value),
+            timeout)
+
+    @property
+    def values(self):
+        """The last known values, {group: {name: value}}"""
+        return self._aed.ed.param.values
+
+
+class AsyncLog:
+    """Log data from an Espdrone as async iterators"""
+
+    # Max number of log packets waiting to be consumed, the oldest are
+    # dropped when the consumer is too slow
+    QUEUE_SIZE = 100
+
+    def __init__(self, aed):
+        self._aed = aed
+
+    async def stream(self, logconf, queue_size=QUEUE_SIZE):
+        """
+        Add and start a log configuration and yield (timestamp, data,
+        logconf) tuples for each log packet. The configuration is deleted
+        when the iteration stops.
+        """
+        aed = self._aed
+        loop = aed.loop
+        queue = asyncio.Queue(queue_size)
+
+        def put(item):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(item)
+
+        def data_received(timestamp, data, conf):
+            loop.call_soon_threadsafe(put, (timestamp, data, conf))
+
+        aed.ed.log.add_config(logconf)
+        logconf.data_received_cb.add_callback(data_received)
+        try:
+            logconf.start()
+            while True:
+                yield await queue.get()
+        finally:
+            _remove_callback(logconf.data_received_cb, data_received)
+            logconf.delete()
+
+
+class AsyncMemory:
+    """Awaitable reads and writes of the memories of an Espdrone"""
+
+    def __init__(self, aed):
+        self._aed = aed
+
+    def get_mems(self, type):
+        """Fetch all the memories of the supplied type"""
+        return self._aed.ed.mem.get_mems(type)
+
+    async def read(self, memory, addr, length, timeout=None):
+        """
+        Read length bytes at addr from memory. Raises asyncio.TimeoutError
+        if the read is not done within timeout seconds (None waits forever).
+        """
+        mem = self._aed.ed.mem
+        loop = self._aed.loop
+        future = loop.create_future()
+
+        def read_done(read_mem, read_addr, data):
+            if read_mem.id == memory.id and read_addr == addr:
+                _resolve(loop, future, bytes(data))
+
+        mem.mem_read_cb.add_callback(read_done)
+        try:
+            if not mem.read(memory, addr, length):
+                raise Exception('There is already a read operation ongoing '
+                                'for memory id {}'.format(memory.id))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            _remove_callback(mem.mem_read_cb, read_done)
+
+    async def write(self, memory, addr, data, timeout=None):
+        """
+        Write data at addr to memory. Raises asyncio.TimeoutError if the
+        write is not done within timeout seconds (None waits forever).
+        """
+        mem = self._aed.ed.mem
+        loop = self._aed.loop
+        future = loop.create_future()
+
+        def write_done(write_mem, write_addr):
+            if write_mem.id == memory.id and write_addr == addr:
+                _resolve(loop, future)
+
+        mem.mem_write_cb.add_callback(write_done)
+        try:
+            mem.write(memory, addr, data)
+            await asyncio.wait_for(future, timeout)
+        finally:
+            _remove_callback(mem.mem_write_cb, write_done)
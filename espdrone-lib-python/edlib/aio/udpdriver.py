@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+"""
+CRTP UDP driver running on an asyncio event loop.
+
+The datagrams are received by a DatagramProtocol and the packets are handed
+to a callback on the loop, so the driver needs no thread and is never
+polled with receive_packet(). The Espdrone state machines (TOC, param, log
+and mem) then run on the loop too, see AsyncEspdrone.
+"""
+import asyncio
+import ipaddress
+import logging
+import time
+
+from edlib.crtp.crtpdriver import CRTPDriver
+from edlib.crtp.crtpstack import CRTPPacket
+from edlib.crtp.exceptions import WrongUriType
+from edlib.crtp.udpdriver import _bind_socket
+from edlib.crtp.udpdriver import _KEEP_ALIVE
+from edlib.crtp.udpdriver import _UdpDriverThread
+from edlib.crtp.udpdriver import RxStats
+from edlib.crtp.udpdriver import UDP_PORT
+
+__author__ = 'Bitcraze AB'
+__all__ = ['AsyncUdpDriver']
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncUdpDriver(CRTPDriver):
+    """
+    UDP link driver for an event loop. Received packets are handed to
+    packet_callback on the loop. Packets can be sent from any thread, the
+    packets sent from other threads (such as the setpoint streamer) are
+    passed to the loop with call_soon_threadsafe.
+    """
+
+    # Max time between checks for a link that timed out
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, loop, packet_callback, port=UDP_PORT):
+        """
+        loop -- The event loop to run on
+        packet_callback -- Called on the loop with each received packet
+        port -- UDP port of the Espdrone
+        """
+        CRTPDriver.__init__(self)
+        self._loop = loop
+        self._packet_callback = packet_callback
+        self._port = port
+        self.addr = None
+        self.connected = False
+        self.link_error_callback = None
+        self.link_quality_callback = None
+        self._transport = None
+        # Datagrams sent before the transport was created
+        self._unsent = []
+        self._timeout_call = None
+        self._last_rx = 0
+        self.link_keep_alive = 0
+        self.received = 0
+        self.bad_checksum = 0
+
+    def connect(self, uri, link_quality_callback, link_error_callback):
+        """
+        Connect to the Espdrone at the IP address uri. The transport is
+        created on the loop, packets sent before that are sent once it is
+        ready. The link error callback is called on the loop if nothing is
+        received for a while.
+        """
+        try:
+            ipaddress.ip_address(uri)
+        except ValueError:
+            raise WrongUriType('Not an IP URI')
+
+        self.addr = (uri, self._port)
+        self.link_quality_callback = link_quality_callback
+        self.link_error_callback = link_error_callback
+
+        sock = _bind_socket()
+        sock.connect(self.addr)
+        self.connected = True
+        # Add this to the server clients list
+        self._unsent.append(_KEEP_ALIVE)
+        self._loop.call_soon_threadsafe(self._create_endpoint, sock)
+
+    def _create_endpoint(self, sock):
+        task = self._loop.create_task(self._loop.create_datagram_endpoint(
+            lambda: _UdpProtocol(self), sock=sock))
+        task.add_done_callback(
+            lambda task: self._endpoint_created(task, sock))
+
+    def _endpoint_created(self, task, sock):
+        if task.cancelled() or task.exception() is not None:
+            sock.close()
+            if self.connected:
+                self._link_error('Could not open the UDP link: {}'.format(
+                    task.exception() if not task.cancelled() else
+                    'cancelled'))
+            return
+        transport, _ = task.result()
+        if not self.connected:
+            transport.close()
+            return
+        self._transport = transport
+        for datagram in self._unsent:
+            transport.sendto(datagram)
+        self._unsent = []
+        self._last_rx = self._loop.time()
+        self._timeout_call = self._loop.call_later(self.POLL_INTERVAL,
+                                                   self._check_timeout)
+
+    def _check_timeout(self):
+        """Report the link as lost if nothing was received for a while"""
+        now = self._loop.time()
+        if now - self._last_rx > _UdpDriverThread.RX_TIMEOUT:
+            self._last_rx = now
+            self._link_error('Connection timeout!')
+        if self.connected:
+            self._timeout_call = self._loop.call_later(self.POLL_INTERVAL,
+                                                       self._check_timeout)
+
+    def _link_error(self, message):
+        if self.link_error_callback:
+            self.link_error_callback(message)
+
+    def datagram_received(self, data, rx_time):
+        """Called on the loop for each datagram, rx_time is the host time
+        when it was received"""
+        self._last_rx = self._loop.time()
+        size = len(data)
+        if size <= 1:
+            return
+        self.link_keep_alive += 1
+        self.received += 1
+        # The last byte is a checksum of the header and data
+        if sum(data[:size - 1]) & 0xFF != data[size - 1]:
+            self.bad_checksum += 1
+            return
+        if self.link_keep_alive > _UdpDriverThread.KEEP_ALIVE_MAX_COUNT:
+            self._send(_KEEP_ALIVE)
+        self._packet_callback(
+            CRTPPacket.from_buffer(data[0], data[1:size - 1], rx_time))
+
+    def send_packet(self, pk):
+        """ Send the packet pk through the link """
+        datagram = bytearray((pk.header,))
+        datagram += pk.data
+        datagram.append(sum(datagram) & 0xFF)
+        if self._on_loop():
+            self._send(datagram)
+        else:
+            self._loop.call_soon_threadsafe(self._send, datagram)
+
+    def _on_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _send(self, datagram):
+        if not self.connected:
+            return
+        if self._transport is None:
+            self._unsent.append(datagram)
+            return
+        self._transport.sendto(datagram)
+        self.link_keep_alive = 0
+
+    def receive_packet(self, wait=0):
+        """The packets are handed to packet_callback instead"""
+        return None
+
+    def close(self):
+        if self._on_loop():
+            self._close()
+        else:
+            self._loop.call_soon_threadsafe(self._close)
+
+    def _close(self):
+        if not self.connected:
+            return
+        self._send(_KEEP_ALIVE)
+        self.connected = False
+        self._unsent = []
+        if self._timeout_call is not None:
+            self._timeout_call.cancel()
+            self._timeout_call = None
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        # Clear callbacks
+        self.link_error_callback = None
+        self.link_quality_callback = None
+
+    def get_name(self):
+        return 'udp'
+
+    def get_rx_stats(self):
+        """
+        Return the receive statistics of the link as a RxStats tuple, the
+        packets are never queued or dropped
+        """
+        return RxStats(self.received, 0, self.bad_checksum, 0)
+
+    def scan_interface(self, address):
+        return [[address, '']]
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    """Hands the datagrams received on the loop to an AsyncUdpDriver"""
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def datagram_received(self, data, addr):
+        self._driver.datagram_received(data, time.time())
+
+    def error_received(self, exc):
+        # For instance port unreachable while the Espdrone is starting up
+        logger.warning('UDP link error: %s', exc)
@@ -57,39 +57,63 @@ class CRTPPort:
 class CRTPPacket(object):
     """
     A packet that can be sent via the CRTP.
+
+    The port and channel are stored in the header byte and decoded when
+    accessed. Packets are created for every packet sent or received, so the
+    class uses slots to keep instances small.
+
+    rx_time is the host time (time.time()) when a received packet was read
+    by the link driver, or None if the driver does not record it.
     """
 
+    __slots__ = ('size', 'header', '_data', '_datat', 'rx_time')
+
     def __init__(self, header=0, data=None):
         """
         Create an empty packet with default values.
         """
         self.size = 0
         self._data = bytearray()
+        self._datat = None
+        self.rx_time = None
         # The two bits in position 3 and 4 needs to be set for legacy
         # support of the bootloader
         self.header = header | 0x3 << 2
-        self._port = (header & 0xF0) >> 4
-        self._channel = header & 0x03
         if data:
             self._set_data(data)
 
+    @classmethod
+    def from_buffer(cls, header, data, rx_time=None):
+        """
+        Create a packet that uses data as payload without copying it.
+
+        data must be a bytes object, or a bytearray that is not modified
+        after the packet has been created. This is used by the link drivers
+        for received packets.
+        """
+        pk = cls.__new__(cls)
+        pk.size = 0
+        pk.header = header | 0x3 << 2
+        pk._data = data
+        pk._datat = None
+        pk.rx_time = rx_time
+        return pk
+
     def _get_channel(self):
         """Get the packet channel"""
-        return self._channel
+        return self.header & 0x03
 
     def _set_channel(self, channel):
         """Set the packet channel"""
-        self._channel = channel
-        self._update_header()
+        self.header = (self.header & 0xF0) | 0x3 << 2 | (channel & 0x03)
 
     def _get_port(self):
         """Get the packet port"""
-        return self._port
+        return self.header >> 4
 
     def _set_port(self, port):
         """Set the packet port"""
-        self._port = port
-        self._update_header()
+        self.header = (port & 0x0f) << 4 | 0x3 << 2 | (self.header & 0x03)
 
     def get_header(self):
         """Get the header"""
@@ -100,16 +124,13 @@ class CRTPPacket(object):
         """
         Set the port and channel for this packet.
         """
-        self._port = port
-        self.channel = channel
-        self._update_header()
+        self.header = (port & 0x0f) << 4 | 0x3 << 2 | (channel & 0x03)
 
     def _update_header(self):
         """Update the header with the port/channel values"""
         # The two bits in position 3 and 4 needs to be set for legacy
         # support of the bootloader
-        self.header = ((self._port & 0x0f) << 4 | 3 << 2 |
-                       (self.channel & 0x03))
+        self.header |= 0x3 << 2
 
     # Some python madness to access different format of the data
     def _get_data(self):
@@ -118,6 +139,7 @@ class CRTPPacket(object):
 
     def _set_data(self, data):
         """Set the packet data"""
+        self._datat = None
         if type(data) == bytearray:
             self._data = data
         elif type(data) == str:
@@ -139,11 +161,18 @@ class CRTPPacket(object):
 
     def _get_data_t(self):
         """Get the data in the packet as a tuple"""
-        return tuple(self._data)
+        datat = self._datat
+        if datat is None:
+            datat = tuple(self._data)
+            # A bytearray may be modified in place, only immutable data can
+            # be cached
+            if type(self._data) is bytes:
+                self._datat = datat
+        return datat
 
     def __str__(self):
         """Get a string representation of the packet"""
-        return '{}:{} {}'.format(self._port, self.channel, self.datat)
+        return '{}:{} {}'.format(self.port, self.channel, self.datat)
 
     data = property(_get_data, _set_data)
     datal = property(_get_data_l, _set_data)
@@ -25,11 +25,16 @@
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #  MA  02110-1301, USA.
 """ CRTP UDP Driver. Work either with the UDP server or with an UDP device
-See udpserver.py for the protocol"""
+See udpserver.py for the protocol
 
+By default all UDP links share one socket and one receiver thread, see
+_UdpTransport, so the cost of receiving scales with the traffic rather than
+with the number of connected Espdrones."""
+
+import collections
 import logging
 import ipaddress
-from queue import Queue
+import selectors
 import sys
 from socket import *
 import threading
@@ -37,6 +42,7 @@ import time
 
 from .crtpdriver import CRTPDriver
 from .crtpstack import CRTPPacket
+from .crtpstack import CRTPPort
 from .exceptions import WrongUriType
 if sys.version_info < (3,):
     import Queue as queue
@@ -48,16 +54,67 @@ __all__ = ['UdpDriver']
 
 logger = logging.getLogger(__name__)
 
+# Channel used for log data on the logging port
+_LOG_DATA_CHANNEL = 2
+
+# UDP port of the Espdrones, the local port is the first free one from here
+UDP_PORT = 2390
+
+_KEEP_ALIVE = b'\xFF\x01\x01\x01'
+
+# Flag used to drain the socket without blocking, not available on Windows
+try:
+    _MSG_DONTWAIT = MSG_DONTWAIT
+except NameError:
+    _MSG_DONTWAIT = 0
+
+RxStats = collections.namedtuple(
+    'RxStats', 'received dropped bad_checksum queue_depth')
+
 class UdpDriver(CRTPDriver):
     """ Esp UDP link driver"""
-    def __init__(self):
-        """ Create the link driver """
+
+    # Max number of droppable packets waiting to be handled
+    RX_QUEUE_SIZE = 512
+
+    # Packets that may be dropped when the receive queue is full, as
+    # (port, channel) tuples
+    DROPPABLE = ((CRTPPort.LOGGING, _LOG_DATA_CHANNEL),)
+
+    # Size of the buffer used to encode outgoing packets
+    TX_BUFFER_SIZE = 64
+
+    # Use the socket and receiver thread shared by all links
+    SHARED_TRANSPORT = True
+
+    def __init__(self, rx_queue_size=RX_QUEUE_SIZE, droppable=DROPPABLE,
+                 shared_transport=SHARED_TRANSPORT):
+        """ Create the link driver
+
+        rx_queue_size -- Max number of droppable packets that are queued
+        droppable -- (port, channel) of the packets that can be dropped
+                     (oldest first) when the queue is full. Other packets,
+                     such as TOC and param replies, are never dropped.
+        shared_transport -- Use the socket and thread shared by all links
+                            instead of one socket and thread for this link
+        """
         CRTPDriver.__init__(self)
         self.link_error_callback = None
         self.link_quality_callback = None
         self.in_queue = None
         self.out_queue = None
         self._thread = None
+        self._rx_queue_size = rx_queue_size
+        # Reused when encoding packets to send, large enough for any CRTP
+        # packet with header and checksum
+        self._tx_buffer = bytearray(self.TX_BUFFER_SIZE)
+        self._tx_view = memoryview(self._tx_buffer)
+        self._tx_lock = threading.Lock()
+        self._droppable = frozenset(
+            (port & 0x0F) << 4 | (channel & 0x03)
+            for port, channel in droppable)
+        self._shared_transport = shared_transport
+        self._transport = None
 
     def connect(self, uri, link_quality_callback, link_error_callback):
         """
@@ -74,28 +131,33 @@ class UdpDriver(CRTPDriver):
             raise WrongUriType('Not an IP URI')
         
         self.queue = queue.Queue()
-        self.socket = socket(AF_INET, SOCK_DGRAM)
-        self.addr = (uri, 2390)
-        allocated_port = False
-        i = 0
-        while not allocated_port:
-            try:
-                self.socket.bind(('', 2390 + i))
-                allocated_port = True
-            except OSError as e: # Unable to allocate port, try a different one
-                i += 1
+        self.addr = (uri, UDP_PORT)
+
+        # Prepare the inter-thread communication queue
+        self.in_queue = _PacketQueue(self._rx_queue_size)
+
+        self.link_quality_callback = link_quality_callback
+        if self._shared_transport:
+            self._transport = _UdpTransport.acquire()
+            self._thread = _UdpLink(self._transport, self.addr,
+                                    self.in_queue, link_quality_callback,
+                                    link_error_callback, self._droppable)
+            self._transport.register(self._thread)
+            self.connected = True
+            self.link_error_callback = link_error_callback
+            return
+
+        self.socket = _bind_socket()
         self.socket.connect(self.addr)
         self.connected = True
 
-        # Prepare the inter-thread communication queue
-        self.in_queue = queue.Queue()
-        
         #Launch the comm thread
         self._thread = _UdpDriverThread(self.socket,
                                         self.addr,
                                         self.in_queue,
                                         link_quality_callback,
-                                        link_error_callback)
+                                        link_error_callback,
+                                        self._droppable)
 
         self._thread.start()
         
@@ -114,16 +176,24 @@ class UdpDriver(CRTPDriver):
 
     def send_packet(self, pk: CRTPPacket):
         """ Send the packet pk through the link """
-        raw = (pk.header,) + pk.datat
-        cksum = 0
-        for i in raw:
-            cksum += i
-        cksum %= 256
-        raw = raw + (cksum,)
-        data = ''.join(chr(v) for v in raw )
-        if self.connected:
-            self.socket.sendto(data.encode('latin'), self.addr)
-            self._thread.link_keep_alive = 0
+        data = pk.data
+        size = len(data) + 2
+        with self._tx_lock:
+            if size > len(self._tx_buffer):
+                self._tx_buffer = bytearray(size)
+                self._tx_view = memoryview(self._tx_buffer)
+            buffer = self._tx_buffer
+            view = self._tx_view
+            # Header, data and checksum of header and data
+            buffer[0] = pk.header
+            view[1:size - 1] = data
+            buffer[size - 1] = sum(view[:size - 1]) & 0xFF
+            if self.connected:
+                if self._transport is not None:
+                    self._transport.sendto(view[:size], self.addr)
+                else:
+                    self.socket.send(view[:size])
+                self._thread.link_keep_alive = 0
 
     def pause(self):
         self._thread.stop()
@@ -132,19 +202,32 @@ class UdpDriver(CRTPDriver):
     def restart(self):
         if self._thread:
             return
+        if self._transport is not None:
+            self._thread = _UdpLink(self._transport, self.addr,
+                                    self.in_queue,
+                                    self.link_quality_callback,
+                                    self.link_error_callback,
+                                    self._droppable)
+            self._transport.register(self._thread)
+            return
         self.socket.connect(self.addr)
         self._thread = _UdpDriverThread(self.socket,
                                 self.addr,
                                 self.in_queue,
                                 self.link_quality_callback,
-                                self.link_error_callback)
+                                self.link_error_callback,
+                                self._droppable)
         
 
 
     def close(self):
         self.connected = False
         # Stop the comm thread
-        self._thread.stop()
+        if self._thread:
+            self._thread.stop()
+        if self._transport is not None:
+            self._transport.release()
+            self._transport = None
         # Clear callbacks
         self.link_error_callback = None
         self.link_quality_callback = None
@@ -153,9 +236,102 @@ class UdpDriver(CRTPDriver):
     def get_name(self):
         return 'udp'
 
+    def get_rx_stats(self):
+        """
+        Return the receive statistics of the link as a RxStats tuple:
+        packets received, packets dropped since the queue was full, packets
+        discarded due to bad checksum and current depth of the queue.
+        """
+        if self.in_queue is None:
+            return RxStats(0, 0, 0, 0)
+        thread = self._thread
+        received = thread.received if thread else 0
+        bad_checksum = thread.bad_checksum if thread else 0
+        return RxStats(received, self.in_queue.dropped, bad_checksum,
+                       self.in_queue.qsize())
+
     def scan_interface(self, address):
         return [[address, ""]]
 
+def _bind_socket():
+    """Create a UDP socket bound to the first free port from UDP_PORT"""
+    sock = socket(AF_INET, SOCK_DGRAM)
+    i = 0
+    while True:
+        try:
+            sock.bind(('', UDP_PORT + i))
+            return sock
+        except OSError:  # Unable to allocate port, try a different one
+            i += 1
+
+
+def _queue_datagram(receiver, buffer, view, size, rx_time):
+    """
+    Check the checksum of a datagram in buffer and queue it as a packet in
+    the in queue of receiver, which also keeps the receive counters. rx_time
+    is the host time when the datagram was read.
+    """
+    if size > 1:
+        receiver.link_keep_alive += 1
+        receiver.received += 1
+        # The last byte is a checksum of the header and data
+        if sum(view[:size - 1]) & 0xFF != buffer[size - 1]:
+            receiver.bad_checksum += 1
+        else:
+            header = buffer[0]
+            receiver._in_queue.put(
+                CRTPPacket.from_buffer(header, bytes(view[1:size - 1]),
+                                       rx_time),
+                (header & 0xF3) in receiver._droppable)
+
+
+class _PacketQueue:
+    """
+    Queue of received packets, bounded for the packets that may be dropped.
+
+    Droppable packets are kept in a ring of at most maxsize packets where the
+    oldest packet is dropped when a new one arrives and the ring is full.
+    Other packets are never dropped and are handed out before any pending
+    droppable packet so that replies are not delayed by a backlog of log
+    data.
+    """
+
+    def __init__(self, maxsize):
+        self._reliable = collections.deque()
+        self._droppable = collections.deque(maxlen=maxsize)
+        self._not_empty = threading.Condition(threading.Lock())
+        self.dropped = 0
+
+    def qsize(self):
+        """Return the number of packets in the queue"""
+        return len(self._reliable) + len(self._droppable)
+
+    def put(self, pk, droppable=False):
+        """Add a packet to the queue"""
+        with self._not_empty:
+            if droppable:
+                if len(self._droppable) == self._droppable.maxlen:
+                    self.dropped += 1
+                self._droppable.append(pk)
+            else:
+                self._reliable.append(pk)
+            self._not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        """
+        Remove and return a packet from the queue, raises queue.Empty if no
+        packet is available within timeout
+        """
+        with self._not_empty:
+            if block:
+                self._not_empty.wait_for(self.qsize, timeout)
+            if self._reliable:
+                return self._reliable.popleft()
+            if self._droppable:
+                return self._droppable.popleft()
+            raise queue.Empty
+
+
 # Transmit/receive udp thread
 
 class _UdpDriverThread(threading.Thread):
@@ -165,49 +341,248 @@ class _UdpDriverThread(threading.Thread):
 
     KEEP_ALIVE_MAX_COUNT = 20
 
-    def __init__(self, socket: socket, addr, in_queue: Queue,
-                 link_quality_callback, link_error_callback):
+    # Time without any received data before the link is reported as lost
+    RX_TIMEOUT = 5
+
+    # Size of the preallocated receive buffer, larger than any CRTP datagram
+    RX_BUFFER_SIZE = 1024
+
+    def __init__(self, socket: socket, addr, in_queue: _PacketQueue,
+                 link_quality_callback, link_error_callback,
+                 droppable=frozenset()):
         """ Create the object """
         threading.Thread.__init__(self)
         self._socket = socket
         self._addr = addr
         self._in_queue = in_queue
+        self._droppable = droppable
         self._sp = False
         self._link_error_callback = link_error_callback
         self._link_quality_callback = link_quality_callback
         self._keep_alive_bytearray = b'\xFF\x01\x01\x01'
         self.link_keep_alive = 0 #keep alive when no input device
+        self.received = 0
+        self.bad_checksum = 0
         # Add this to the server clients list
         self._socket.sendto(self._keep_alive_bytearray,self._addr)
-        self._socket.settimeout(5)
+        # The socket is blocking and waited on with a selector, which makes
+        # it possible to drain it with non-blocking reads
+        self._socket.settimeout(None)
         self._timeout_counter = 0
         self.daemon = True
-        
+
 
     def stop(self):
         """ Stop the thread """
         self._sp = True
         self._socket.sendto(self._keep_alive_bytearray, self._addr)
-        self._socket.close()
+        try:
+            # Wakes up the selector in the receiver thread
+            self._socket.shutdown(SHUT_RD)
+        except OSError:
+            pass
         try:
             self.join()
         except Exception as e:
             pass
-    
+        self._socket.close()
+
     def run(self):
         """ Run the receiver thread """
+        buffer = bytearray(self.RX_BUFFER_SIZE)
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(self._socket, selectors.EVENT_READ)
+        except (OSError, ValueError):
+            return  # The socket was closed before the thread started
         while not self._sp:
             try:
-                data = self._socket.recv(1024)
-                if data:
-                    self.link_keep_alive +=1
-                    pk = CRTPPacket(data[0], list(data[1:(len(data)-1)]))
-                    self._in_queue.put(pk)
-                    if (self.link_keep_alive > self.KEEP_ALIVE_MAX_COUNT) and not self._sp:
-                        self._socket.sendto(self._keep_alive_bytearray, self._addr)
-            except timeout:
-                self._link_error_callback(
-                    'Connection timeout!'
-                )
-            except OSError:
+                if not selector.select(self.RX_TIMEOUT):
+                    self._link_error_callback(
+                        'Connection timeout!'
+                    )
+                    continue
+                self._receive_all(buffer)
+                if (self.link_keep_alive > self.KEEP_ALIVE_MAX_COUNT) and not self._sp:
+                    self._socket.sendto(self._keep_alive_bytearray, self._addr)
+            except (OSError, ValueError):
                 pass # When socket has been closed, it causes bad file descriptor.
+        selector.close()
+
+    def _receive_all(self, buffer):
+        """
+        Read all the datagrams waiting in the socket into the receive buffer
+        and queue them as packets
+        """
+        view = memoryview(buffer)
+        flags = 0
+        while True:
+            try:
+                size = self._socket.recv_into(buffer, 0, flags)
+            except BlockingIOError:
+                return
+            if size == 0:
+                return  # The socket has been shut down
+            _queue_datagram(self, buffer, view, size, time.time())
+            if not _MSG_DONTWAIT:
+                return
+            flags = _MSG_DONTWAIT
+
+
+class _UdpLink:
+    """
+    One Espdrone connected through the shared _UdpTransport. It has the
+    same counters and stop() as _UdpDriverThread.
+    """
+
+    def __init__(self, transport, addr, in_queue, link_quality_callback,
+                 link_error_callback, droppable=frozenset()):
+        self._transport = transport
+        self.addr = addr
+        self._in_queue = in_queue
+        self._droppable = droppable
+        self._link_error_callback = link_error_callback
+        self._link_quality_callback = link_quality_callback
+        self.link_keep_alive = 0
+        self.received = 0
+        self.bad_checksum = 0
+        self.last_rx = time.monotonic()
+
+    def handle_datagram(self, buffer, view, size, rx_time):
+        """Called by the transport thread for datagrams from addr, rx_time
+        is the host time when the datagram was read"""
+        self.last_rx = time.monotonic()
+        _queue_datagram(self, buffer, view, size, rx_time)
+        if self.link_keep_alive > _UdpDriverThread.KEEP_ALIVE_MAX_COUNT:
+            self._transport.sendto(_KEEP_ALIVE, self.addr)
+
+    def check_timeout(self, now):
+        """Report the link as lost if nothing was received for a while"""
+        if now - self.last_rx > _UdpDriverThread.RX_TIMEOUT:
+            self.last_rx = now
+            if self._link_error_callback:
+                self._link_error_callback('Connection timeout!')
+
+    def stop(self):
+        """Stop receiving packets for this link"""
+        self._transport.sendto(_KEEP_ALIVE, self.addr)
+        self._transport.unregister(self)
+
+
+class _UdpTransport(threading.Thread):
+    """
+    A UDP socket shared by all links, with a thread that waits for
+    datagrams using a selector and hands them to the _UdpLink registered
+    for the source address. The transport is created by the first link
+    that acquires it and stopped when the last one releases it.
+    """
+
+    # Max time between checks for links that timed out
+    POLL_INTERVAL = 0.5
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def acquire(cls):
+        """Return the shared transport, started if needed"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                cls._instance.start()
+            cls._instance._users += 1
+            return cls._instance
+
+    def release(self):
+        """Release the transport, it is stopped when no one is using it"""
+        with _UdpTransport._instance_lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            if _UdpTransport._instance is self:
+                _UdpTransport._instance = None
+        self.stop()
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='UdpTransport')
+        self.daemon = True
+        self._socket = _bind_socket()
+        self._socket.settimeout(None)
+        # Used to wake up the selector when stopping
+        self._wakeup_r, self._wakeup_w = socketpair()
+        self._users = 0
+        self._sp = False
+        # Links by address, replaced (never modified) when links are added
+        # or removed so the receiver thread can use it without locking
+        self._links = {}
+        self._links_lock = threading.Lock()
+        self.unknown_source = 0
+
+    def register(self, link):
+        """Start handing datagrams from link.addr to link"""
+        with self._links_lock:
+            links = dict(self._links)
+            links[link.addr] = link
+            self._links = links
+        # Add this to the server clients list
+        self.sendto(_KEEP_ALIVE, link.addr)
+
+    def unregister(self, link):
+        with self._links_lock:
+            if self._links.get(link.addr) is link:
+                links = dict(self._links)
+                del links[link.addr]
+                self._links = links
+
+    def sendto(self, data, addr):
+        try:
+            self._socket.sendto(data, addr)
+        except OSError as e:
+            logger.warning('Could not send to %s: %s', addr, e)
+
+    def stop(self):
+        self._sp = True
+        self._wakeup_w.send(b'\x00')
+        # The last link may be closed from a callback in this thread
+        if threading.current_thread() is not self:
+            self.join()
+
+    def run(self):
+        buffer = bytearray(_UdpDriverThread.RX_BUFFER_SIZE)
+        view = memoryview(buffer)
+        selector = selectors.DefaultSelector()
+        selector.register(self._socket, selectors.EVENT_READ)
+        selector.register(self._wakeup_r, selectors.EVENT_READ)
+        while not self._sp:
+            try:
+                if selector.select(self.POLL_INTERVAL):
+                    self._receive_all(buffer, view)
+            except (OSError, ValueError) as e:
+                logger.warning('UDP receive failed: %s', e)
+            now = time.monotonic()
+            for link in list(self._links.values()):
+                link.check_timeout(now)
+        selector.close()
+        self._socket.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def _receive_all(self, buffer, view):
+        """
+        Read all the datagrams waiting in the socket and hand them to the
+        links they are from
+        """
+        flags = _MSG_DONTWAIT
+        if not flags:
+            self._socket.setblocking(False)
+        while not self._sp:
+            try:
+                size, addr = self._socket.recvfrom_into(buffer, 0, flags)
+            except (BlockingIOError, InterruptedError):
+                return
+            rx_time = time.time()
+            link = self._links.get(addr)
+            if link is None:
+                self.unknown_source += 1
+                continue
+            link.handle_datagram(buffer, view, size, rx_time)
@@ -38,7 +38,6 @@ import time
 from collections import namedtuple
 from threading import Lock
 from threading import Thread
-from threading import Timer
 
 import edlib.crtp
 from .camera import Camera
@@ -50,9 +49,11 @@ from .log import Log
 from .mem import Memory
 from .param import Param
 from .platformservice import PlatformService
+from .toccache import ParamValueCache
 from .toccache import TocCache
 from edlib.espdrone.high_level_commander import HighLevelCommander
 from edlib.utils.callbacks import Caller
+from edlib.utils.scheduler import Scheduler
 
 __author__ = 'Bitcraze AB'
 __all__ = ['Espdrone']
@@ -71,12 +72,21 @@ class State:
 class Espdrone():
     """The Espdrone class"""
 
-    def __init__(self, name=None, link=None, ro_cache=None, rw_cache=None):
+    def __init__(self, name=None, link=None, ro_cache=None, rw_cache=None,
+                 cache_param_values=False, scheduler=None):
         """
         Create the objects from this module and register callbacks.
 
         ro_cache -- Path to read-only cache (string)
         rw_cache -- Path to read-write cache (string)
+        cache_param_values -- Store the parameter values in rw_cache and use
+                              them directly on the next connection (bool)
+        scheduler -- Runs the resends of unanswered requests, anything with
+                     a call_later(delay, callback, *args) that returns a
+                     cancellable call, such as a Scheduler or an asyncio
+                     event loop. Defaults to a Scheduler of its own, so a
+                     send blocked on the link of one Espdrone does not
+                     delay the resends of others.
         """
 
         # Called on disconnect, no matter the reason
@@ -106,9 +116,12 @@ class Espdrone():
         self._toc_cache = TocCache(ro_cache=ro_cache,
                                    rw_cache=rw_cache)
 
+        # Started when a link that has to be polled is opened
         self.incoming = _IncomingPacketHandler(self)
         self.incoming.setDaemon(True)
-        self.incoming.start()
+        self._poll_link = link is not None
+        if self._poll_link:
+            self.incoming.start()
 
         self.camera = Camera(self)
         self.commander = Commander(self)
@@ -118,6 +131,8 @@ class Espdrone():
         self.log = Log(self)
         self.console = Console(self)
         self.param = Param(self)
+        if cache_param_values and rw_cache:
+            self.param.value_cache = ParamValueCache(rw_cache)
         self.mem = Memory(self)
         self.platform = PlatformService(self)
 
@@ -127,7 +142,12 @@ class Espdrone():
         self.packet_received.add_callback(self._check_for_initial_packet_cb)
         self.packet_received.add_callback(self._check_for_answers)
 
-        self._answer_patterns = {}
+        # Requests waiting for an answer, resent by the scheduler until the
+        # answer arrives
+        self._answer_patterns = _PendingRequests()
+        self._answer_lock = Lock()
+        self._scheduler = scheduler if scheduler else Scheduler('Espdrone')
+        self._request_stats = {}
 
         self._send_lock = Lock()
 
@@ -170,8 +190,11 @@ class Espdrone():
         logger.info('Param TOC finished updating')
         self.connected_ts = datetime.datetime.now()
         self.connected.call(self.link_uri)
-        # Trigger the update for all the parameters
-        self.param.request_update_of_all_params()
+        # Trigger the update for all the parameters, unless the cached
+        # values should be trusted
+        if (not self.param.load_cached_values(self.link_uri) or
+                self.param.revalidate_cached_values):
+            self.param.request_update_of_all_params()
 
     def _mems_updated_cb(self):
         """Called when the memories have been identified"""
@@ -187,6 +210,7 @@ class Espdrone():
         """Called from the link driver when there's an error"""
         logger.warning('Got link error callback [%s] in state [%s]',
                        errmsg, self.state)
+        self.commander.streamer.stop()
         if (self.link is not None):
             self.link.close()
         self.link = None
@@ -213,17 +237,30 @@ class Espdrone():
         self.link_established.call(self.link_uri)
         self.packet_received.remove_callback(self._check_for_initial_packet_cb)
 
-    def open_link(self, link_uri):
+    def open_link(self, link_uri, link=None):
         """
         Open the communication link to a copter at the given URI and setup the
         connection (download log/parameter TOC).
+
+        link -- Link driver to connect instead of the one found for the URI.
+                It is not polled, the driver hands the received packets to
+                incoming.dispatch() itself, see edlib.aio.
         """
         self.connection_requested.call(link_uri)
         self.state = State.INITIALIZED
         self.link_uri = link_uri
         try:
-            self.link = edlib.crtp.get_link_driver(
-                link_uri, self._link_quality_cb, self._link_error_cb)
+            if link is None:
+                self.link = edlib.crtp.get_link_driver(
+                    link_uri, self._link_quality_cb, self._link_error_cb)
+                self._poll_link = True
+                if self.link and not self.incoming.is_alive():
+                    self.incoming.start()
+            else:
+                self._poll_link = False
+                self.link = link
+                link.connect(link_uri, self._link_quality_cb,
+                             self._link_error_cb)
 
             if not self.link:
                 message = 'No driver found or malformed URI: {}' \
@@ -255,12 +292,15 @@ class Espdrone():
     def close_link(self):
         """Close the communication link."""
         logger.info('Closing link')
+        self.commander.streamer.stop()
         if (self.link is not None):
             self.commander.send_setpoint(0, 0, 0, 0)
         if (self.link is not None):
             self.link.close()
             self.link = None
-        self._answer_patterns = {}
+        with self._answer_lock:
+            for request in self._answer_patterns.clear():
+                request.retry_call.cancel()
         self.disconnected.call(self.link_uri)
 
     """Check if the communication link is open or not."""
@@ -276,10 +316,29 @@ class Espdrone():
         """Remove the callback cb on port"""
         self.incoming.remove_port_callback(port, cb)
 
+    def get_request_stats(self):
+        """
+        Return statistics for the requests that expect an answer, as a dict
+        with a RequestStats tuple per port. The round trip times (in
+        seconds) are only measured for requests answered without a resend.
+        """
+        with self._answer_lock:
+            outstanding = self._answer_patterns.count_per_port()
+            stats = {}
+            for port, port_stats in self._request_stats.items():
+                stats[port] = port_stats.get(outstanding.get(port, 0))
+            return stats
+
+    def _get_port_stats(self, port):
+        port_stats = self._request_stats.get(port)
+        if port_stats is None:
+            port_stats = _PortRequestStats()
+            self._request_stats[port] = port_stats
+        return port_stats
+
     def _no_answer_do_retry(self, pk, pattern):
         """Resend packets that we have not gotten answers to"""
         logger.info('Resending for pattern %s', pattern)
-        # Set the timer to None before trying to send again
         self.send_packet(pk, expected_reply=pattern, resend=True)
 
     def _check_for_answers(self, pk):
@@ -288,63 +347,207 @@ class Espdrone():
         waiting for an answer on this port. If so, then cancel the retry
         timer.
         """
-        longest_match = ()
-        if len(self._answer_patterns) > 0:
-            data = (pk.header,) + tuple(pk.data)
-            for p in list(self._answer_patterns.keys()):
-                logger.debug('Looking for pattern match on %s vs %s', p, data)
-                if len(p) <= len(data):
-                    if p == data[0:len(p)]:
-                        match = data[0:len(p)]
-                        if len(match) >= len(longest_match):
-                            logger.debug('Found new longest match %s', match)
-                            longest_match = match
-        if len(longest_match) > 0:
-            self._answer_patterns[longest_match].cancel()
-            del self._answer_patterns[longest_match]
+        if not self._answer_patterns:
+            return
+        with self._answer_lock:
+            request = self._answer_patterns.pop_longest_match(pk.header,
+                                                              pk.datat)
+            if request is not None:
+                logger.debug('Found match for %s', request.pattern)
+                request.retry_call.cancel()
+                self._get_port_stats(pk.port).answered(request)
 
     def send_packet(self, pk, expected_reply=(), resend=False, timeout=0.1):
         """
         Send a packet through the link interface.
 
         pk -- Packet to send
-        expect_answer -- True if a packet from the Espdrone is expected to
-                         be sent back, otherwise false
-
+        expected_reply -- Start of the data of the packet that is expected to
+                          be sent back from the Espdrone. The packet is resent
+                          every timeout seconds until the reply arrives.
+        resend -- True when resending a packet that has not been answered,
+                  expected_reply is then the full pattern including header
         """
         self._send_lock.acquire()
         if self.link is not None:
             if len(expected_reply) > 0 and not resend and \
                     self.link.needs_resending:
-                pattern = (pk.header,) + expected_reply
+                pattern = (pk.header,) + tuple(expected_reply)
                 logger.debug(
                     'Sending packet and expecting the %s pattern back',
                     pattern)
-                new_timer = Timer(timeout,
-                                  lambda: self._no_answer_do_retry(pk,
-                                                                   pattern))
-                self._answer_patterns[pattern] = new_timer
-                new_timer.start()
+                request = _PendingRequest(pk, pattern, timeout)
+                with self._answer_lock:
+                    request.retry_call = self._scheduler.call_later(
+                        timeout, self._no_answer_do_retry, pk, pattern)
+                    replaced = self._answer_patterns.add(request)
+                    if replaced is not None:
+                        replaced.retry_call.cancel()
+                    self._get_port_stats(pk.port).sent += 1
             elif resend:
                 # Check if we have gotten an answer, if not try again
                 pattern = expected_reply
-                if pattern in self._answer_patterns:
-                    logger.debug('We want to resend and the pattern is there')
-                    if self._answer_patterns[pattern]:
-                        new_timer = Timer(timeout,
-                                          lambda:
-                                          self._no_answer_do_retry(
-                                              pk, pattern))
-                        self._answer_patterns[pattern] = new_timer
-                        new_timer.start()
-                else:
-                    logger.debug('Resend requested, but no pattern found: %s',
-                                 self._answer_patterns)
+                with self._answer_lock:
+                    request = self._answer_patterns.get(pattern)
+                    if request is not None:
+                        logger.debug(
+                            'We want to resend and the pattern is there')
+                        request.retries += 1
+                        request.sent_ts = time.monotonic()
+                        request.retry_call = self._scheduler.call_later(
+                            request.timeout, self._no_answer_do_retry,
+                            pk, pattern)
+                        self._get_port_stats(pk.port).retries += 1
+                    else:
+                        logger.debug(
+                            'Resend requested, but no pattern found: %s',
+                            pattern)
             self.link.send_packet(pk)
             self.packet_sent.call(pk)
         self._send_lock.release()
 
 
+RequestStats = namedtuple('RequestStats', 'outstanding sent retries answered '
+                                          'rtt_min rtt_avg rtt_max')
+
+
+class _PortRequestStats:
+    """Counters for the requests sent on one port"""
+
+    def __init__(self):
+        self.sent = 0
+        self.retries = 0
+        self.answers = 0
+        self._rtt_count = 0
+        self._rtt_total = 0.0
+        self._rtt_min = None
+        self._rtt_max = None
+
+    def answered(self, request):
+        """Account for an answer to a request"""
+        self.answers += 1
+        # Only requests that were not resent give an unambiguous round trip
+        if request.retries == 0:
+            rtt = time.monotonic() - request.sent_ts
+            self._rtt_count += 1
+            self._rtt_total += rtt
+            if self._rtt_min is None or rtt < self._rtt_min:
+                self._rtt_min = rtt
+            if self._rtt_max is None or rtt > self._rtt_max:
+                self._rtt_max = rtt
+
+    def get(self, outstanding):
+        """Return the statistics as a RequestStats tuple"""
+        rtt_avg = None
+        if self._rtt_count > 0:
+            rtt_avg = self._rtt_total / self._rtt_count
+        return RequestStats(outstanding, self.sent, self.retries,
+                            self.answers, self._rtt_min, rtt_avg,
+                            self._rtt_max)
+
+
+class _PendingRequest:
+    """A sent packet that is waiting for an answer"""
+
+    __slots__ = ('pk', 'pattern', 'timeout', 'retry_call', 'sent_ts',
+                 'retries')
+
+    def __init__(self, pk, pattern, timeout):
+        self.pk = pk
+        self.pattern = pattern
+        self.timeout = timeout
+        self.retry_call = None
+        self.sent_ts = time.monotonic()
+        self.retries = 0
+
+
+class _PendingRequests:
+    """
+    The requests waiting for an answer, indexed on the header of the
+    expected answer. For each header the patterns are kept in a dict with
+    the distinct pattern lengths, so matching a received packet is a few
+    dict lookups no matter how many requests are pending.
+    """
+
+    def __init__(self):
+        self._by_header = {}
+        self._length_counts = {}
+        self._lengths = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, request):
+        """Add a request, returns the request it replaces if any"""
+        header = request.pattern[0]
+        tail = request.pattern[1:]
+        patterns = self._by_header.setdefault(header, {})
+        replaced = patterns.get(tail)
+        patterns[tail] = request
+        if replaced is None:
+            self._count += 1
+            self._count_length(header, len(tail), 1)
+        return replaced
+
+    def get(self, pattern):
+        """Get the request with the pattern, None if not pending"""
+        patterns = self._by_header.get(pattern[0])
+        if patterns is None:
+            return None
+        return patterns.get(tuple(pattern[1:]))
+
+    def pop_longest_match(self, header, data):
+        """
+        Remove and return the request with the longest pattern matching the
+        start of the data of a received packet, None if no pattern matches
+        """
+        patterns = self._by_header.get(header)
+        if not patterns:
+            return None
+        for length in self._lengths[header]:
+            if length <= len(data):
+                request = patterns.pop(data[:length], None)
+                if request is not None:
+                    self._count -= 1
+                    self._count_length(header, length, -1)
+                    return request
+        return None
+
+    def clear(self):
+        """Remove all requests, returns the removed requests"""
+        requests = [request for patterns in self._by_header.values()
+                    for request in patterns.values()]
+        self._by_header = {}
+        self._length_counts = {}
+        self._lengths = {}
+        self._count = 0
+        return requests
+
+    def count_per_port(self):
+        """Return the number of pending requests per port"""
+        counts = {}
+        for header, patterns in self._by_header.items():
+            port = header >> 4
+            counts[port] = counts.get(port, 0) + len(patterns)
+        return counts
+
+    def _count_length(self, header, length, delta):
+        """
+        Keep track of the pattern lengths for a header, the lengths to try
+        (longest first) are only sorted again when a length is added or
+        removed
+        """
+        counts = self._length_counts.setdefault(header, {})
+        count = counts.get(length, 0) + delta
+        if count > 0:
+            counts[length] = count
+        else:
+            del counts[length]
+        if count == 0 or count == delta:
+            self._lengths[header] = sorted(counts, reverse=True)
+
+
 _CallbackContainer = namedtuple('CallbackConstainer',
                                 'port port_mask channel channel_mask callback')
 
@@ -352,10 +555,16 @@ _CallbackContainer = namedtuple('CallbackConstainer',
 class _IncomingPacketHandler(Thread):
     """Handles incoming packets and sends the data to the correct receivers"""
 
+    # Size of the port/channel dispatch table, 16 ports with 4 channels each
+    NBR_OF_PORTS = 16
+    NBR_OF_CHANNELS = 4
+
     def __init__(self, ed):
         Thread.__init__(self)
         self.ed = ed
         self.cb = []
+        self._cb_lock = Lock()
+        self._dispatch_table = self._build_dispatch_table(self.cb)
 
     def add_port_callback(self, port, cb):
         """Add a callback for data that comes on a specific port"""
@@ -365,9 +574,11 @@ class _IncomingPacketHandler(Thread):
     def remove_port_callback(self, port, cb):
         """Remove a callback for data that comes on a specific port"""
         logger.debug('Removing callback on port [%d] to [%s]', port, cb)
-        for port_callback in self.cb:
-            if port_callback.port == port and port_callback.callback == cb:
-                self.cb.remove(port_callback)
+        with self._cb_lock:
+            self.cb = [port_callback for port_callback in self.cb
+                       if not (port_callback.port == port and
+                               port_callback.callback == cb)]
+            self._dispatch_table = self._build_dispatch_table(self.cb)
 
     def add_header_callback(self, cb, port, channel, port_mask=0xFF,
                             channel_mask=0xFF):
@@ -376,12 +587,31 @@ class _IncomingPacketHandler(Thread):
         possibility to add a mask for channel and port for multiple
         hits for same callback.
         """
-        self.cb.append(_CallbackContainer(port, port_mask,
-                                          channel, channel_mask, cb))
+        with self._cb_lock:
+            self.cb = self.cb + [_CallbackContainer(port, port_mask,
+                                                    channel, channel_mask,
+                                                    cb)]
+            self._dispatch_table = self._build_dispatch_table(self.cb)
+
+    def _build_dispatch_table(self, callbacks):
+        """
+        Resolve the port/channel masks of the registered callbacks into a
+        table indexed on port and channel, so that routing a packet is a
+        single lookup. The table is rebuilt when callbacks are added or
+        removed and is never modified after that.
+        """
+        table = []
+        for port in range(self.NBR_OF_PORTS):
+            for channel in range(self.NBR_OF_CHANNELS):
+                table.append(tuple(
+                    cb for cb in callbacks
+                    if cb.port == (port & cb.port_mask) and
+                    cb.channel == (channel & cb.channel_mask)))
+        return tuple(table)
 
     def run(self):
         while True:
-            if self.ed.link is None:
+            if self.ed.link is None or not self.ed._poll_link:
                 time.sleep(1)
                 continue
             pk = self.ed.link.receive_packet(1)
@@ -389,26 +619,26 @@ class _IncomingPacketHandler(Thread):
             if pk is None:
                 continue
 
-            # All-packet callbacks
-            self.ed.packet_received.call(pk)
-
-            found = False
-            for cb in (cb for cb in self.cb
-                       if cb.port == (pk.port & cb.port_mask) and
-                       cb.channel == (pk.channel & cb.channel_mask)):
-                try:
-                    cb.callback(pk)
-                except Exception:  # pylint: disable=W0703
-                    # Disregard pylint warning since we want to catch all
-                    # exceptions and we can't know what will happen in
-                    # the callbacks.
-                    import traceback
-
-                    logger.error('Exception while doing callback on port'
-                                 ' [%d]\n\n%s', pk.port,
-                                 traceback.format_exc())
-                if cb.port != 0xFF:
-                    found = True
-
-            if not found:
-                pass
+            self.dispatch(pk)
+
+    def dispatch(self, pk):
+        """Send a received packet to the callbacks registered for it"""
+        # All-packet callbacks
+        self.ed.packet_received.call(pk)
+
+        # Port in bits 4-7 and channel in bits 0-1 of the header
+        header = pk.header
+        callbacks = self._dispatch_table[(header & 0xF0) >> 2 |
+                                         (header & 0x03)]
+        for cb in callbacks:
+            try:
+                cb.callback(pk)
+            except Exception:  # pylint: disable=W0703
+                # Disregard pylint warning since we want to catch all
+                # exceptions and we can't know what will happen in
+                # the callbacks.
+                import traceback
+
+                logger.error('Exception while doing callback on port'
+                             ' [%d]\n\n%s', pk.port,
+                             traceback.format_exc())
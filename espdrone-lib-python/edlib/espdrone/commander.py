@@ -28,13 +28,21 @@
 Used for sending control setpoints to the Espdrone
 """
 from edlib.espdrone.localization import Localization
+import logging
 import struct
+import threading
+import time
+from collections import namedtuple
 
 from edlib.crtp.crtpstack import CRTPPacket
 from edlib.crtp.crtpstack import CRTPPort
+from edlib.utils.callbacks import Caller
+from edlib.utils.scheduler import Scheduler
 
 __author__ = 'Bitcraze AB'
-__all__ = ['Commander']
+__all__ = ['Commander', 'SetpointStreamer', 'SetpointStreamerStats']
+
+logger = logging.getLogger(__name__)
 
 TYPE_STOP = 0
 TYPE_VELOCITY_WORLD = 1
@@ -43,6 +51,10 @@ TYPE_HOVER = 5
 TYPE_POSITION = 7
 TYPE_FULL_STATE = 6
 
+_RPYT_STRUCT = struct.Struct('<fffH')
+_GENERIC_STRUCT = struct.Struct('<Bffff')
+_STOP_STRUCT = struct.Struct('<B')
+
 
 class Commander():
     """
@@ -56,6 +68,7 @@ class Commander():
         """
         self._ed = espdrone
         self._x_mode = False
+        self.streamer = SetpointStreamer(self)
 
     def set_client_xmode(self, enabled):
         """
@@ -71,16 +84,20 @@ class Commander():
         The arguments roll/pitch/yaw/trust is the new setpoints that should
         be sent to the copter
         """
+        pk = CRTPPacket()
+        pk.port = CRTPPort.COMMANDER
+        pk.data = _RPYT_STRUCT.pack(*self._rpyt(roll, pitch, yaw, thrust))
+        self._ed.send_packet(pk)
+
+    def _rpyt(self, roll, pitch, yaw, thrust):
+        """ Check and convert a roll/pitch/yaw/thrust setpoint for packing """
         if thrust > 0xFFFF or thrust < 0:
             raise ValueError('Thrust must be between 0 and 0xFFFF')
 
         if self._x_mode:
             roll, pitch = 0.707 * (roll - pitch), 0.707 * (roll + pitch)
 
-        pk = CRTPPacket()
-        pk.port = CRTPPort.COMMANDER
-        pk.data = struct.pack('<fffH', roll, -pitch, yaw, thrust)
-        self._ed.send_packet(pk)
+        return roll, -pitch, yaw, thrust
 
     def send_stop_setpoint(self):
         """
@@ -88,7 +105,7 @@ class Commander():
         """
         pk = CRTPPacket()
         pk.port = CRTPPort.COMMANDER_GENERIC
-        pk.data = struct.pack('<B', TYPE_STOP)
+        pk.data = _STOP_STRUCT.pack(TYPE_STOP)
         self._ed.send_packet(pk)
 
     def send_velocity_world_setpoint(self, vx, vy, vz, yawrate):
@@ -100,8 +117,8 @@ class Commander():
         """
         pk = CRTPPacket()
         pk.port = CRTPPort.COMMANDER_GENERIC
-        pk.data = struct.pack('<Bffff', TYPE_VELOCITY_WORLD,
-                              vx, vy, vz, yawrate)
+        pk.data = _GENERIC_STRUCT.pack(TYPE_VELOCITY_WORLD,
+                                       vx, vy, vz, yawrate)
         self._ed.send_packet(pk)
 
     def send_zdistance_setpoint(self, roll, pitch, yawrate, zdistance):
@@ -113,8 +130,8 @@ class Commander():
         """
         pk = CRTPPacket()
         pk.port = CRTPPort.COMMANDER_GENERIC
-        pk.data = struct.pack('<Bffff', TYPE_ZDISTANCE,
-                              roll, pitch, yawrate, zdistance)
+        pk.data = _GENERIC_STRUCT.pack(TYPE_ZDISTANCE,
+                                       roll, pitch, yawrate, zdistance)
         self._ed.send_packet(pk)
 
     def send_hover_setpoint(self, vx, vy, yawrate, zdistance):
@@ -127,8 +144,8 @@ class Commander():
         """
         pk = CRTPPacket()
         pk.port = CRTPPort.COMMANDER_GENERIC
-        pk.data = struct.pack('<Bffff', TYPE_HOVER,
-                              vx, vy, yawrate, zdistance)
+        pk.data = _GENERIC_STRUCT.pack(TYPE_HOVER,
+                                       vx, vy, yawrate, zdistance)
         self._ed.send_packet(pk)
 
     def send_full_state_setpoint(self, x, y, z, vx, vy, vz, ax, ay, az, quat_x, quat_y, quat_z, quat_w, rate_roll, rate_pitch, rate_yaw):
@@ -156,6 +173,195 @@ class Commander():
         """
         pk = CRTPPacket()
         pk.port = CRTPPort.COMMANDER_GENERIC
-        pk.data = struct.pack('<Bffff', TYPE_POSITION,
-                              x, y, z, yaw)
+        pk.data = _GENERIC_STRUCT.pack(TYPE_POSITION, x, y, z, yaw)
         self._ed.send_packet(pk)
+
+
+SetpointStreamerStats = namedtuple('SetpointStreamerStats', [
+    'sent', 'coalesced', 'missed', 'expired', 'rate', 'staleness_avg',
+    'staleness_max'])
+
+
+class SetpointStreamer():
+    """
+    Streams the latest setpoint to the Espdrone at a fixed rate.
+
+    Setting a setpoint only packs it into a preallocated buffer, a setpoint
+    that is replaced before it has been sent is dropped (latest wins). Once
+    started the current setpoint is sent every period, also when it has not
+    been updated, so the Espdrone does not time out the setpoint.
+
+    A setpoint that has not been updated for max_staleness seconds has
+    expired, a stop setpoint is then sent instead and streaming pauses until
+    a new setpoint is set. This keeps the motors from running on a setpoint
+    whose source has stopped. Note that the stop setpoint cuts the motors
+    right away, while the Espdrone watchdog first levels the Espdrone and
+    only cuts the motors if the setpoints stay away.
+
+    Each streamer has a thread of its own (while it is started) unless a
+    scheduler is given, so a streamer blocked on a slow link does not delay
+    the setpoints of other Espdrones.
+
+    The before_send callbacks are called on the streamer thread right before
+    each send and can be used to update a setpoint that changes over time.
+    """
+
+    DEFAULT_RATE = 100
+    DEFAULT_MAX_STALENESS = 0.5
+
+    def __init__(self, commander, rate=DEFAULT_RATE, scheduler=None,
+                 max_staleness=DEFAULT_MAX_STALENESS):
+        """
+        Initialize the streamer for the commander, the rate is in Hz and
+        max_staleness in seconds
+        """
+        self._commander = commander
+        self._scheduler = scheduler if scheduler else \
+            Scheduler('SetpointStreamer')
+        self.rate = rate
+        self.max_staleness = max_staleness
+        self.before_send = Caller()
+
+        self._lock = threading.Lock()
+        # Reentrant since a link error while sending can stop the streamer
+        self._send_lock = threading.RLock()
+        self._call = None
+        self._buffer = bytearray(_GENERIC_STRUCT.size)
+        self._size = 0
+        self._port = None
+        self._updated = 0.0
+        self._fresh = False
+
+        self._started = 0.0
+        self._sent = 0
+        self._coalesced = 0
+        self._expired = 0
+        self._staleness_sum = 0.0
+        self._staleness_max = 0.0
+
+    def start(self):
+        """
+        Start streaming, nothing is sent until the first setpoint is set
+        """
+        with self._send_lock:
+            if self._call is not None:
+                return
+            self._started = time.monotonic()
+            self._sent = 0
+            self._coalesced = 0
+            self._expired = 0
+            self._staleness_sum = 0.0
+            self._staleness_max = 0.0
+            self._call = self._scheduler.call_periodic(1.0 / self.rate,
+                                                       self._send)
+
+    def stop(self):
+        """
+        Stop streaming and forget the current setpoint. No setpoint is sent
+        by the streamer once this returns.
+        """
+        with self._send_lock:
+            if self._call is not None:
+                self._call.cancel()
+                self._call = None
+        with self._lock:
+            self._port = None
+            self._fresh = False
+
+    def is_running(self):
+        """ Return True if the streamer is started """
+        return self._call is not None
+
+    def get_stats(self):
+        """
+        Return SetpointStreamerStats for the streaming since it was started.
+        The rate is the measured send rate in Hz, the staleness is the age of
+        the setpoint when it was sent in seconds.
+        """
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            rate = self._sent / elapsed if self._call and elapsed > 0 else 0.0
+            staleness_avg = self._staleness_sum / self._sent \
+                if self._sent else 0.0
+            missed = self._call.get_stats().missed if self._call else 0
+            return SetpointStreamerStats(self._sent, self._coalesced, missed,
+                                         self._expired, rate, staleness_avg,
+                                         self._staleness_max)
+
+    def set_setpoint(self, roll, pitch, yaw, thrust):
+        """
+        Set the roll/pitch/yaw/thrust setpoint to stream, see
+        Commander.send_setpoint()
+        """
+        self._set(CRTPPort.COMMANDER, _RPYT_STRUCT,
+                  *self._commander._rpyt(roll, pitch, yaw, thrust))
+
+    def set_velocity_world_setpoint(self, vx, vy, vz, yawrate):
+        """
+        Set the velocity setpoint to stream, see
+        Commander.send_velocity_world_setpoint()
+        """
+        self._set(CRTPPort.COMMANDER_GENERIC, _GENERIC_STRUCT,
+                  TYPE_VELOCITY_WORLD, vx, vy, vz, yawrate)
+
+    def set_zdistance_setpoint(self, roll, pitch, yawrate, zdistance):
+        """
+        Set the height setpoint to stream, see
+        Commander.send_zdistance_setpoint()
+        """
+        self._set(CRTPPort.COMMANDER_GENERIC, _GENERIC_STRUCT,
+                  TYPE_ZDISTANCE, roll, pitch, yawrate, zdistance)
+
+    def set_hover_setpoint(self, vx, vy, yawrate, zdistance):
+        """
+        Set the hover setpoint to stream, see Commander.send_hover_setpoint()
+        """
+        self._set(CRTPPort.COMMANDER_GENERIC, _GENERIC_STRUCT,
+                  TYPE_HOVER, vx, vy, yawrate, zdistance)
+
+    def set_position_setpoint(self, x, y, z, yaw):
+        """
+        Set the position setpoint to stream, see
+        Commander.send_position_setpoint()
+        """
+        self._set(CRTPPort.COMMANDER_GENERIC, _GENERIC_STRUCT,
+                  TYPE_POSITION, x, y, z, yaw)
+
+    def _set(self, port, packer, *values):
+        with self._lock:
+            packer.pack_into(self._buffer, 0, *values)
+            self._size = packer.size
+            self._port = port
+            self._updated = time.monotonic()
+            if self._fresh:
+                self._coalesced += 1
+            self._fresh = True
+
+    def _send(self):
+        self.before_send.call()
+        with self._send_lock:
+            if self._call is None:
+                return
+            with self._lock:
+                if self._port is None:
+                    return
+                pk = CRTPPacket()
+                staleness = time.monotonic() - self._updated
+                if staleness > self.max_staleness:
+                    # The source of the setpoints has stopped updating it
+                    pk.port = CRTPPort.COMMANDER_GENERIC
+                    pk.data = _STOP_STRUCT.pack(TYPE_STOP)
+                    self._port = None
+                    self._fresh = False
+                    self._expired += 1
+                    logger.warning('Setpoint not updated for %.2f s, '
+                                   'sending stop setpoint', staleness)
+                else:
+                    pk.port = self._port
+                    # The link may queue the packet, so it gets its own copy
+                    pk.data = self._buffer[:self._size]
+                    self._fresh = False
+                    self._sent += 1
+                    self._staleness_sum += staleness
+                    self._staleness_max = max(self._staleness_max, staleness)
+            self._commander._ed.send_packet(pk)
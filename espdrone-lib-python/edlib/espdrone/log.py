@@ -63,12 +63,20 @@ States of a configuration:
 import errno
 import logging
 import struct
+import time
+from collections import namedtuple
 
 from .toc import Toc
 from .toc import Toedetcher
 from edlib.crtp.crtpstack import CRTPPacket
 from edlib.crtp.crtpstack import CRTPPort
 from edlib.utils.callbacks import Caller
+from edlib.utils.clocksync import ClockSync
+from edlib.utils.clocksync import TimestampUnwrapper
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 __author__ = 'Bitcraze AB'
 __all__ = ['Log', 'LogTocElement']
@@ -102,6 +110,11 @@ GET_TOC_ELEMENT = 'GET_TOC_ELEMENT'
 # The max size of a CRTP packet payload
 MAX_LOG_DATA_PACKET_SIZE = 30
 
+# NumPy equivalents of the struct types used for log variables
+_NUMPY_TYPES = {'B': 'u1', 'H': 'u2', 'L': 'u4',
+                'b': 'i1', 'h': 'i2', 'i': 'i4',
+                'f': 'f4'}
+
 
 logger = logging.getLogger(__name__)
 
@@ -146,9 +159,32 @@ class LogConfig(object):
     """Representation of one log configuration that enables logging
     from the Espdrone"""
 
-    def __init__(self, name, period_in_ms):
-        """Initialize the entry"""
+    # Formats the decoded log data can be delivered in
+    FORMAT_DICT = 'dict'
+    FORMAT_TUPLE = 'tuple'
+    FORMAT_NAMEDTUPLE = 'namedtuple'
+    FORMAT_NUMPY = 'numpy'
+
+    def __init__(self, name, period_in_ms, data_format=FORMAT_DICT):
+        """Initialize the entry
+
+        data_format - The type of object passed to data_received_cb: a dict
+                      keyed on variable name (default), a tuple or
+                      namedtuple in variable order or a NumPy record
+        """
+        if data_format not in (LogConfig.FORMAT_DICT, LogConfig.FORMAT_TUPLE,
+                               LogConfig.FORMAT_NAMEDTUPLE,
+                               LogConfig.FORMAT_NUMPY):
+            raise ValueError('Unknown data format {}'.format(data_format))
+        if data_format == LogConfig.FORMAT_NUMPY and numpy is None:
+            raise ValueError('NumPy is required for the numpy data format')
+
         self.data_received_cb = Caller()
+        # Called with (timestamp, host_timestamp, data, logconf) for each
+        # sample. host_timestamp is the host time (time.time()) of the
+        # sample, estimated from the drone timestamp, None until it can be
+        # estimated.
+        self.sample_received_cb = Caller()
         self.error_cb = Caller()
         self.started_cb = Caller()
         self.added_cb = Caller()
@@ -167,6 +203,13 @@ class LogConfig(object):
         self.variables = []
         self.default_fetch_as = []
         self.name = name
+        self.data_format = data_format
+
+        # Decoder for the log data, compiled once the variables are known
+        self._struct = None
+        self._names = ()
+        self._record_type = None
+        self._dtype = None
 
     def add_variable(self, name, fetch_as=None):
         """Add a new variable to the configuration.
@@ -180,6 +223,7 @@ class LogConfig(object):
         Espdrone)."""
         if fetch_as:
             self.variables.append(LogVariable(name, fetch_as))
+            self._struct = None
         else:
             # We cannot determine the default type until we have connected. So
             # save the name and we will add these once we are connected.
@@ -197,6 +241,7 @@ class LogConfig(object):
         """
         self.variables.append(LogVariable(name, fetch_as, LogVariable.MEM_TYPE,
                                           stored_as, address))
+        self._struct = None
 
     def _set_added(self, added):
         if added != self._added:
@@ -293,21 +338,65 @@ class LogConfig(object):
                 self.ed.send_packet(
                     pk, expected_reply=(CMD_DELETE_BLOCK, self.id))
 
-    def unpack_log_data(self, log_data, timestamp):
-        """Unpack received logging data so it repreloggingsent real values according
-        to the configuration in the entry"""
-        ret_data = {}
-        data_index = 0
+    def compile(self):
+        """Compile the decoder used to unpack log data for this configuration.
+
+        All the variables are decoded with one precompiled struct instead of
+        resolving the type of each variable for every received packet. This
+        is done when the configuration is added to the log subsystem, but
+        will be redone automatically if variables are added later on."""
+        fmt = '<'
+        dtype = []
         for var in self.variables:
-            size = LogTocElement.get_size_from_id(var.fetch_as)
-            name = var.name
             unpackstring = LogTocElement.get_unpack_string_from_id(
                 var.fetch_as)
-            value = struct.unpack(
-                unpackstring, log_data[data_index:data_index + size])[0]
-            data_index += size
-            ret_data[name] = value
+            fmt += unpackstring[1:]
+            dtype.append((var.name, '<' + _NUMPY_TYPES[unpackstring[1]]))
+        self._names = tuple(var.name for var in self.variables)
+        self._struct = struct.Struct(fmt)
+        self._dtype = numpy.dtype(dtype) if numpy is not None else None
+
+        if self.data_format == LogConfig.FORMAT_NAMEDTUPLE:
+            self._record_type = namedtuple(
+                'LogData', [n.replace('.', '_') for n in self._names],
+                rename=True)
+        elif self.data_format == LogConfig.FORMAT_NUMPY:
+            self._record_type = self._dtype
+        else:
+            self._record_type = None
+
+    def get_dtype(self):
+        """Return the NumPy dtype of one sample, with one field per
+        variable in the order they were added"""
+        if self._struct is None:
+            self.compile()
+        return self._dtype
+
+    def unpack_log_data(self, log_data, timestamp, offset=0,
+                        host_timestamp=None):
+        """Unpack received logging data so it represent real values according
+        to the configuration in the entry.
+
+        log_data may be any object supporting the buffer protocol, the data
+        is decoded from offset without copying the buffer. host_timestamp
+        is passed on to sample_received_cb."""
+        if self._struct is None:
+            self.compile()
+        data_format = self.data_format
+        if data_format == LogConfig.FORMAT_NUMPY:
+            ret_data = numpy.frombuffer(log_data, dtype=self._record_type,
+                                        count=1, offset=offset).copy()[0]
+        else:
+            values = self._struct.unpack_from(log_data, offset)
+            if data_format == LogConfig.FORMAT_DICT:
+                ret_data = dict(zip(self._names, values))
+            elif data_format == LogConfig.FORMAT_NAMEDTUPLE:
+                ret_data = self._record_type._make(values)
+            else:
+                ret_data = values
         self.data_received_cb.call(timestamp, ret_data, self)
+        self.sample_received_cb.call(timestamp, host_timestamp, ret_data,
+                                     self)
 
 
 class LogTocElement:
@@ -389,6 +478,8 @@ class Log():
 
     def __init__(self, espdrone=None):
         self.log_blocks = []
+        # Index of the log blocks on block id, used to route log data
+        self._blocks_by_id = {}
         # Called with newly created blocks
         self.block_added_cb = Caller()
 
@@ -407,6 +498,10 @@ class Log():
 
         self._useV2 = False
 
+        # The 24 bit log timestamps are unwrapped and mapped to host time
+        self._timestamp_unwrapper = TimestampUnwrapper(24)
+        self.clock = ClockSync()
+
     def add_config(self, logconf):
         """Add a log configuration to the logging framework.
 
@@ -459,7 +554,9 @@ class Log():
             logconf.id = self._config_id_counter
             logconf.useV2 = self._useV2
             self._config_id_counter = (self._config_id_counter + 1) % 255
+            logconf.compile()
             self.log_blocks.append(logconf)
+            self._blocks_by_id[logconf.id] = logconf
             self.block_added_cb.call(logconf)
         else:
             logconf.valid = False
@@ -476,16 +573,16 @@ class Log():
         self._refresh_callback = refresh_done_callback
         self.toc = None
 
+        self._timestamp_unwrapper.reset()
+        self.clock.reset()
+
         pk = CRTPPacket()
         pk.set_header(CRTPPort.LOGGING, CHAN_SETTINGS)
         pk.data = (CMD_RESET_LOGGING,)
         self.ed.send_packet(pk, expected_reply=(CMD_RESET_LOGGING,))
 
     def _find_block(self, id):
-        for block in self.log_blocks:
-            if block.id == id:
-                return block
-        return None
+        return self._blocks_by_id.get(id)
 
     def _new_packet_cb(self, packet):
         """Callback for newly arrived packets with TOC information"""
@@ -560,6 +657,7 @@ class Log():
                 if not self.toc:
                     logger.debug('Logging reset, continue with TOC download')
                     self.log_blocks = []
+                    self._blocks_by_id = {}
 
                     self.toc = Toc()
                     toc_fetcher = Toedetcher(self.ed, LogTocElement,
@@ -572,11 +670,17 @@ class Log():
             chan = packet.channel
             id = packet.data[0]
             block = self._find_block(id)
+            # The time the driver read the packet, queueing in the link and
+            # the dispatcher would add to the delay of the clock sync points
+            host_time = packet.rx_time
+            if host_time is None:
+                host_time = time.time()
             timestamps = struct.unpack('<BBB', packet.data[1:4])
-            timestamp = (
+            timestamp = self._timestamp_unwrapper.unwrap(
                 timestamps[0] | timestamps[1] << 8 | timestamps[2] << 16)
-            logdata = packet.data[4:]
+            self.clock.update(timestamp, host_time)
             if (block is not None):
-                block.unpack_log_data(logdata, timestamp)
+                block.unpack_log_data(memoryview(packet.data), timestamp, 4,
+                                      self.clock.to_host(timestamp))
             else:
                 logger.warning('Error no LogEntry to handle id=%d', id)
@@ -32,8 +32,10 @@ import errno
 import logging
 import struct
 import sys
+import time
 from array import array
 from binascii import crc32
+from collections import namedtuple
 from functools import reduce
 from threading import Lock
 from typing import List
@@ -43,7 +45,7 @@ from edlib.crtp.crtpstack import CRTPPort
 from edlib.utils.callbacks import Caller
 
 __author__ = 'Bitcraze AB'
-__all__ = ['Memory', 'MemoryElement']
+__all__ = ['Memory', 'MemoryElement', 'TransferStats']
 
 # Channels used for the logging port
 CHAN_INFO = 0
@@ -58,6 +60,10 @@ CMD_INFO_DETAILS = 2
 # The max size of a CRTP packet payload
 MAX_LOG_DATA_PACKET_SIZE = 30
 
+# Number of chunks of a memory read or write that are in flight at the
+# same time
+MEM_TRANSFER_WINDOW = 4
+
 if sys.version_info < (3,):
     EEPROM_TOKEN = '0xBC'
 else:
@@ -900,144 +906,215 @@ class MemoryTester(MemoryElement):
         self._write_finished_cb = None
 
 
+TransferStats = namedtuple('TransferStats', 'bytes chunks retries duration '
+                                            'throughput rtt_min rtt_avg '
+                                            'rtt_max')
+
+
+class _TransferStats:
+    """Counters for the chunks of one memory transfer"""
+
+    def __init__(self):
+        self.bytes = 0
+        self.chunks = 0
+        self.retries = 0
+        self._start = time.monotonic()
+        self._end = None
+        self._rtt_total = 0.0
+        self._rtt_min = None
+        self._rtt_max = None
+
+    def chunk_done(self, size, sent_ts):
+        """Account for a chunk that has been acknowledged"""
+        rtt = time.monotonic() - sent_ts
+        self.bytes += size
+        self.chunks += 1
+        self._rtt_total += rtt
+        if self._rtt_min is None or rtt < self._rtt_min:
+            self._rtt_min = rtt
+        if self._rtt_max is None or rtt > self._rtt_max:
+            self._rtt_max = rtt
+
+    def done(self):
+        self._end = time.monotonic()
+
+    def get(self):
+        """Return the statistics as a TransferStats tuple"""
+        end = self._end if self._end is not None else time.monotonic()
+        duration = end - self._start
+        throughput = self.bytes / duration if duration > 0 else None
+        rtt_avg = self._rtt_total / self.chunks if self.chunks else None
+        return TransferStats(self.bytes, self.chunks, self.retries, duration,
+                             throughput, self._rtt_min, rtt_avg,
+                             self._rtt_max)
+
+
 class _ReadRequest:
     """
     Class used to handle memory reads that will split up the read in multiple
-    packets if necessary
+    packets if necessary. Up to window chunks are requested at the same
+    time, the replies are put in place using their address.
     """
     MAX_DATA_LENGTH = 20
 
-    def __init__(self, mem, addr, length, ed):
+    def __init__(self, mem, addr, length, ed, window=MEM_TRANSFER_WINDOW):
         """Initialize the object with good defaults"""
         self.mem = mem
         self.addr = addr
-        self._bytes_left = length
-        self.data = bytearray()
+        self.data = bytearray(length)
         self.ed = ed
+        self.stats = _TransferStats()
 
-        self._current_addr = addr
+        self._window = max(1, window)
+        self._end_addr = addr + length
+        self._next_addr = addr
+        # Address -> (length, time sent) for the chunks in flight
+        self._in_flight = {}
 
     def start(self):
         """Start the fetching of the data"""
-        self._request_new_chunk()
-
-    def resend(self):
-        logger.debug('Sending write again...')
-        self._request_new_chunk()
-
-    def _request_new_chunk(self):
+        self._fill_window()
+
+    def resend(self, addr=None):
+        """Request the chunk at addr (all chunks in flight if None) again"""
+        logger.debug('Sending read again...')
+        for chunk_addr in ([addr] if addr is not None else
+                           list(self._in_flight)):
+            if chunk_addr in self._in_flight:
+                self.stats.retries += 1
+                self._request_chunk(chunk_addr,
+                                    self._in_flight[chunk_addr][0])
+
+    def _fill_window(self):
+        while (len(self._in_flight) < self._window and
+               self._next_addr < self._end_addr):
+            new_len = min(self._end_addr - self._next_addr,
+                          _ReadRequest.MAX_DATA_LENGTH)
+            self._in_flight[self._next_addr] = (new_len, time.monotonic())
+            self._request_chunk(self._next_addr, new_len)
+            self._next_addr += new_len
+
+    def _request_chunk(self, addr, length):
         """
-        Called to request a new chunk of data to be read from the Espdrone
+        Called to request a chunk of data to be read from the Espdrone
         """
-        # Figure out the length of the next request
-        new_len = self._bytes_left
-        if new_len > _ReadRequest.MAX_DATA_LENGTH:
-            new_len = _ReadRequest.MAX_DATA_LENGTH
-
         logger.debug('Requesting new chunk of {}bytes at 0x{:X}'.format(
-            new_len, self._current_addr))
+            length, addr))
 
-        # Request the data for the next address
+        # Request the data for the address
         pk = CRTPPacket()
         pk.set_header(CRTPPort.MEM, CHAN_READ)
-        pk.data = struct.pack('<BIB', self.mem.id, self._current_addr, new_len)
+        pk.data = struct.pack('<BIB', self.mem.id, addr, length)
         reply = struct.unpack('<BBBBB', pk.data[:-1])
         self.ed.send_packet(pk, expected_reply=reply, timeout=1)
 
     def add_data(self, addr, data):
         """Callback when data is received from the Espdrone"""
-        data_len = len(data)
-        if not addr == self._current_addr:
+        chunk = self._in_flight.pop(addr, None)
+        if chunk is None:
+            logger.debug('Ignoring data at 0x{:X} not requested or '
+                         'already received'.format(addr))
+            return False
+        length, sent_ts = chunk
+        if len(data) != length:
             logger.warning(
-                'Address did not match when adding data to read request!')
-            return
+                'Got {} bytes instead of {} at 0x{:X}, requesting '
+                'again'.format(len(data), length, addr))
+            self._in_flight[addr] = chunk
+            self.resend(addr)
+            return False
 
-        # Add the data and calculate the next address to fetch
-        self.data += data
-        self._bytes_left -= data_len
-        self._current_addr += data_len
+        # Put the data in place and request the next chunks
+        offset = addr - self.addr
+        self.data[offset:offset + length] = data
+        self.stats.chunk_done(length, sent_ts)
+        self._fill_window()
 
-        if self._bytes_left > 0:
-            self._request_new_chunk()
+        if self._in_flight:
             return False
-        else:
-            return True
+        self.stats.done()
+        return True
 
 
 class _WriteRequest:
     """
-    Class used to handle memory reads that will split up the read in multiple
-    packets in necessary
+    Class used to handle memory writes that will split up the write in
+    multiple packets if necessary. Up to window chunks are written at the
+    same time.
     """
     MAX_DATA_LENGTH = 25
 
-    def __init__(self, mem, addr, data, ed):
+    def __init__(self, mem, addr, data, ed, window=MEM_TRANSFER_WINDOW):
         """Initialize the object with good defaults"""
         self.mem = mem
         self.addr = addr
-        self._bytes_left = len(data)
         self._data = data
         self.data = bytearray()
         self.ed = ed
+        self.stats = _TransferStats()
 
-        self._current_addr = addr
-
-        self._sent_packet = None
-        self._sent_reply = None
-
-        self._addr_add = 0
+        self._window = max(1, window)
+        self._offset = 0
+        # Address -> (packet, expected reply, length, time sent) for the
+        # chunks in flight
+        self._in_flight = {}
 
     def start(self):
-        """Start the fetching of the data"""
-        self._write_new_chunk()
+        """Start the writing of the data"""
+        self._fill_window()
 
-    def resend(self):
+    def resend(self, addr=None):
+        """Write the chunk at addr (all chunks in flight if None) again"""
         logger.debug('Sending write again...')
-        self.ed.send_packet(
-            self._sent_packet, expected_reply=self._sent_reply, timeout=1)
-
-    def _write_new_chunk(self):
+        for chunk_addr in ([addr] if addr is not None else
+                           list(self._in_flight)):
+            if chunk_addr in self._in_flight:
+                self.stats.retries += 1
+                pk, reply = self._in_flight[chunk_addr][:2]
+                self.ed.send_packet(pk, expected_reply=reply, timeout=1)
+
+    def _fill_window(self):
+        while (len(self._in_flight) < self._window and
+               self._offset < len(self._data)):
+            new_len = min(len(self._data) - self._offset,
+                          _WriteRequest.MAX_DATA_LENGTH)
+            self._write_chunk(self.addr + self._offset,
+                              self._data[self._offset:self._offset + new_len])
+            self._offset += new_len
+
+    def _write_chunk(self, addr, data):
         """
-        Called to request a new chunk of data to be read from the Espdrone
+        Called to write a chunk of data to the Espdrone
         """
-        # Figure out the length of the next request
-        new_len = len(self._data)
-        if new_len > _WriteRequest.MAX_DATA_LENGTH:
-            new_len = _WriteRequest.MAX_DATA_LENGTH
-
         logger.debug('Writing new chunk of {}bytes at 0x{:X}'.format(
-            new_len, self._current_addr))
-
-        data = self._data[:new_len]
-        self._data = self._data[new_len:]
+            len(data), addr))
 
         pk = CRTPPacket()
         pk.set_header(CRTPPort.MEM, CHAN_WRITE)
-        pk.data = struct.pack('<BI', self.mem.id, self._current_addr)
+        pk.data = struct.pack('<BI', self.mem.id, addr)
         # Create a tuple used for matching the reply using id and address
         reply = struct.unpack('<BBBBB', pk.data)
-        self._sent_reply = reply
         # Add the data
         pk.data += struct.pack('B' * len(data), *data)
-        self._sent_packet = pk
+        self._in_flight[addr] = (pk, reply, len(data), time.monotonic())
         self.ed.send_packet(pk, expected_reply=reply, timeout=1)
 
-        self._addr_add = len(data)
-
     def write_done(self, addr):
         """Callback when data is received from the Espdrone"""
-        if not addr == self._current_addr:
-            logger.warning(
-                'Address did not match when adding data to read request!')
-            return
+        chunk = self._in_flight.pop(addr, None)
+        if chunk is None:
+            logger.debug('Ignoring write ack at 0x{:X} not written or '
+                         'already acknowledged'.format(addr))
+            return False
+
+        self.stats.chunk_done(chunk[2], chunk[3])
+        self._fill_window()
 
-        if len(self._data) > 0:
-            self._current_addr += self._addr_add
-            self._write_new_chunk()
+        if self._in_flight:
             return False
-        else:
-            logger.debug('This write request is done')
-            return True
+        logger.debug('This write request is done')
+        self.stats.done()
+        return True
 
 
 class Memory():
@@ -1068,6 +1145,12 @@ class Memory():
         self.ed.disconnected.add_callback(self._disconnected)
         self._write_requests_lock = Lock()
 
+        # Number of chunks in flight for memory reads and writes
+        self.transfer_window = MEM_TRANSFER_WINDOW
+        # TransferStats of the last finished read and write
+        self.last_read_stats = None
+        self.last_write_stats = None
+
         self._clear_state()
 
     def _clear_state(self):
@@ -1124,7 +1207,8 @@ class Memory():
 
     def write(self, memory, addr, data, flush_queue=False):
         """Write the specified data to the given memory at the given address"""
-        wreq = _WriteRequest(memory, addr, data, self.ed)
+        wreq = _WriteRequest(memory, addr, data, self.ed,
+                             self.transfer_window)
         if memory.id not in self._write_requests:
             self._write_requests[memory.id] = []
 
@@ -1151,7 +1235,8 @@ class Memory():
                            'memory id {}'.format(memory.id))
             return False
 
-        rreq = _ReadRequest(memory, addr, length, self.ed)
+        rreq = _ReadRequest(memory, addr, length, self.ed,
+                            self.transfer_window)
         self._read_requests[memory.id] = rreq
 
         rreq.start()
@@ -1331,6 +1416,7 @@ class Memory():
                         # self._write_requests.pop(id, None)
                         # Remove the first item
                         self._write_requests[id].pop(0)
+                        self.last_write_stats = wreq.stats.get()
                         self.mem_write_cb.call(wreq.mem, wreq.addr)
 
                         # Get a new one to start (if there are any)
@@ -1339,7 +1425,7 @@ class Memory():
                 else:
                     logger.debug(
                         'Status {}: write resending...'.format(status))
-                    wreq.resend()
+                    wreq.resend(addr)
                 self._write_requests_lock.release()
 
         if chan == CHAN_READ:
@@ -1357,7 +1443,8 @@ class Memory():
                 if status == 0:
                     if rreq.add_data(addr, payload[5:]):
                         self._read_requests.pop(id, None)
+                        self.last_read_stats = rreq.stats.get()
                         self.mem_read_cb.call(rreq.mem, rreq.addr, rreq.data)
                 else:
                     logger.debug('Status {}: resending...'.format(status))
-                    rreq.resend()
+                    rreq.resend(addr)
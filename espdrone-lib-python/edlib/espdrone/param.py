@@ -31,21 +31,18 @@ When a Espdrone is connected it's possible to download a TableOfContent of all
 the parameters that can be written/read.
 
 """
+import collections
 import logging
 import struct
 import sys
+import time
 from threading import Lock
-from threading import Thread
 
 from .toc import Toc
 from .toc import Toedetcher
 from edlib.crtp.crtpstack import CRTPPacket
 from edlib.crtp.crtpstack import CRTPPort
 from edlib.utils.callbacks import Caller
-if sys.version_info < (3,):
-    from Queue import Queue
-else:
-    from queue import Queue
 
 
 __author__ = 'Bitcraze AB'
@@ -63,6 +60,9 @@ TOC_CHANNEL = 0
 READ_CHANNEL = 1
 WRITE_CHANNEL = 2
 
+# Number of parameter reads/writes that are in flight at the same time
+PARAM_UPDATE_WINDOW = 8
+
 # One element entry in the TOC
 
 
@@ -133,18 +133,38 @@ class Param():
 
         self.param_updater = _ParamUpdater(
             self.ed, self._useV2, self._param_updated)
-        self.param_updater.start()
 
         self.ed.disconnected.add_callback(self._disconnected)
 
         self.all_updated = Caller()
         self.is_updated = False
-
+        # Time in seconds from requesting all parameters until all of them
+        # were fetched, None until done
+        self.all_updated_time = None
+        self._update_all_start = None
+        self._nbr_of_params = None
+        # Ids of the parameters fetched from the Espdrone since connecting
+        self._fetched_ids = set()
+        self._all_fetched = False
+
+        # Optional ParamValueCache with the last known values, used to
+        # serve the values directly when connecting. If
+        # revalidate_cached_values is set all values are fetched in the
+        # background afterwards.
+        self.value_cache = None
+        self.revalidate_cached_values = True
+        self._link_uri = None
+
+        # Precompiled struct for the value of each TOC element, by id
+        self._structs = {}
+
+        # The values as numbers, {group: {name: value}}
         self.values = {}
 
 
     def request_update_of_all_params(self):
         """Request an update of all the parameters in the TOC"""
+        self._update_all_start = time.monotonic()
         for group in self.toc.toc:
             for name in self.toc.toc[group]:
                 complete_name = '%s.%s' % (group, name)
@@ -153,15 +173,63 @@ class Param():
     def _check_if_all_updated(self):
         """Check if all parameters from the TOC has at least been fetched
         once"""
-        for g in self.toc.toc:
-            if g not in self.values:
-                return False
-            for n in self.toc.toc[g]:
-                if n not in self.values[g]:
+        if self._nbr_of_params is None:
+            self._nbr_of_params = sum(
+                len(group) for group in self.toc.toc.values())
+        return len(self._fetched_ids) >= self._nbr_of_params
+
+    def load_cached_values(self, link_uri):
+        """
+        Set the values from the value cache, if there are values for the
+        Espdrone at link_uri with the current TOC. The update callbacks
+        and all_updated are called as if the values were fetched. Returns
+        True if cached values were used.
+        """
+        self._link_uri = link_uri
+        if self.value_cache is None or self.toc.crc is None:
+            return False
+        cached = self.value_cache.fetch(link_uri, self.toc.crc)
+        if not cached:
+            return False
+
+        for group in self.toc.toc:
+            for name in self.toc.toc[group]:
+                if name not in cached.get(group, {}):
+                    logger.info('Cached parameter values are incomplete')
                     return False
 
+        logger.info('Using cached parameter values for [%s]', link_uri)
+        for group in self.toc.toc:
+            self.values[group] = {}
+            for name in self.toc.toc[group]:
+                value = cached[group][name]
+                if isinstance(value, str):
+                    value = _to_number(value)
+                self.values[group][name] = value
+                self._call_update_callbacks(group, name, value)
+        if not self.is_updated:
+            self.is_updated = True
+            self.all_updated.call()
         return True
 
+    def _call_update_callbacks(self, group, name, value):
+        # The callbacks get the value as a string, as they always have
+        value = str(value)
+        complete_name = '%s.%s' % (group, name)
+        logger.debug('Updated parameter [%s]' % complete_name)
+        if complete_name in self.param_update_callbacks:
+            self.param_update_callbacks[complete_name].call(
+                complete_name, value)
+        if group in self.group_update_callbacks:
+            self.group_update_callbacks[group].call(complete_name, value)
+        self.all_update_callback.call(complete_name, value)
+
+    def _save_values(self):
+        if (self.value_cache is not None and self._link_uri and
+                self.toc.crc is not None):
+            self.value_cache.insert(self._link_uri, self.toc.crc,
+                                    self.values)
+
     def _param_updated(self, pk):
         """Callback with data for an updated parameter"""
         if self._useV2:
@@ -170,33 +238,36 @@ class Param():
             var_id = pk.data[0]
         element = self.toc.get_element_by_id(var_id)
         if element:
-            if self._useV2:
-                s = struct.unpack(element.pytype, pk.data[2:])[0]
-            else:
-                s = struct.unpack(element.pytype, pk.data[1:])[0]
-            s = s.__str__()
-            complete_name = '%s.%s' % (element.group, element.name)
+            value_struct = self._get_struct(element)
+            if value_struct is None:
+                logger.warning('Type %s of [%s.%s] is not supported',
+                               element.ctype, element.group, element.name)
+                return
+            value = value_struct.unpack_from(
+                pk.data, 2 if self._useV2 else 1)[0]
 
             # Save the value for synchronous access
             if element.group not in self.values:
                 self.values[element.group] = {}
-            self.values[element.group][element.name] = s
+            self.values[element.group][element.name] = value
+            self._fetched_ids.add(var_id)
 
-            logger.debug('Updated parameter [%s]' % complete_name)
-            if complete_name in self.param_update_callbacks:
-                self.param_update_callbacks[complete_name].call(
-                    complete_name, s)
-            if element.group in self.group_update_callbacks:
-                self.group_update_callbacks[element.group].call(
-                    complete_name, s)
-            self.all_update_callback.call(complete_name, s)
+            self._call_update_callbacks(element.group, element.name, value)
 
             # Once all the parameters are updated call the
             # callback for "everything updated" (after all the param
             # updated callbacks)
-            if self._check_if_all_updated() and not self.is_updated:
-                self.is_updated = True
-                self.all_updated.call()
+            if not self._all_fetched and self._check_if_all_updated():
+                self._all_fetched = True
+                if self._update_all_start is not None:
+                    self.all_updated_time = (time.monotonic() -
+                                             self._update_all_start)
+                    logger.info('All %d parameters fetched in %.3f s',
+                                self._nbr_of_params, self.all_updated_time)
+                self._save_values()
+                if not self.is_updated:
+                    self.is_updated = True
+                    self.all_updated.call()
         else:
             logger.debug('Variable id [%d] not found in TOC', var_id)
 
@@ -243,9 +314,18 @@ class Param():
     def _disconnected(self, uri):
         """Disconnected callback from Espdrone API"""
         self.param_updater.close()
+        # Keep values set after all of them were fetched
+        if self._all_fetched:
+            self._save_values()
         self.is_updated = False
+        self.all_updated_time = None
+        self._update_all_start = None
+        self._nbr_of_params = None
+        self._fetched_ids = set()
+        self._all_fetched = False
         # Clear all values from the previous Espdrone
         self.toc = Toc()
+        self._structs = {}
         self.values = {}
 
     def request_param_update(self, complete_name):
@@ -255,10 +335,45 @@ class Param():
         self.param_updater.request_param_update(
             self.toc.get_element_id(complete_name))
 
+    def get_value(self, complete_name):
+        """
+        Get the last known value of the supplied parameter as a number.
+        """
+        [group, name] = complete_name.split('.')
+        return self.values[group][name]
+
     def set_value(self, complete_name, value):
         """
-        Set the value for the supplied parameter.
+        Set the value for the supplied parameter. The value can be a number
+        or a string with a number.
+        """
+        self.param_updater.request_param_setvalue(
+            self._pack_setvalue(complete_name, value))
+
+    def set_values(self, values):
+        """
+        Set the values of several parameters, values is a dict with the
+        complete names and values. All names are checked before anything
+        is sent, the writes are then sent without waiting for each other.
         """
+        packets = [self._pack_setvalue(complete_name, value)
+                   for complete_name, value in values.items()]
+        for pk in packets:
+            self.param_updater.request_param_setvalue(pk)
+
+    def _get_struct(self, element):
+        """Return the precompiled struct for the value of an element"""
+        try:
+            return self._structs[element.ident]
+        except KeyError:
+            value_struct = None
+            if element.pytype:
+                value_struct = struct.Struct(element.pytype)
+            self._structs[element.ident] = value_struct
+            return value_struct
+
+    def _pack_setvalue(self, complete_name, value):
+        """Create the packet that sets a parameter to value"""
         element = self.toc.get_element_by_complete_name(complete_name)
 
         if not element:
@@ -269,56 +384,64 @@ class Param():
             logger.debug('[%s] is read only, no trying to set value',
                          complete_name)
             raise AttributeError('{} is read-only!'.format(complete_name))
+
+        value_struct = self._get_struct(element)
+        if value_struct is None:
+            raise TypeError('Type {} of {} is not supported'.format(
+                element.ctype, complete_name))
+        if isinstance(value, str):
+            value = _to_number(value)
+
+        pk = CRTPPacket()
+        pk.set_header(CRTPPort.PARAM, WRITE_CHANNEL)
+        if self._useV2:
+            pk.data = struct.pack('<H', element.ident) + \
+                value_struct.pack(value)
         else:
-            varid = element.ident
-            pk = CRTPPacket()
-            pk.set_header(CRTPPort.PARAM, WRITE_CHANNEL)
-            if self._useV2:
-                pk.data = struct.pack('<H', varid)
-            else:
-                pk.data = struct.pack('<B', varid)
+            pk.data = struct.pack('<B', element.ident) + \
+                value_struct.pack(value)
+        return pk
 
-            try:
-                value_nr = eval(value)
-            except TypeError:
-                value_nr = value
 
-            pk.data += struct.pack(element.pytype, value_nr)
-            self.param_updater.request_param_setvalue(pk)
+def _to_number(value):
+    """Parse a string with an integer (in any base) or a float"""
+    try:
+        return int(value, 0)
+    except ValueError:
+        return float(value)
 
 
-class _ParamUpdater(Thread):
-    """This thread will update params through a queue to make sure that we
-    get back values"""
+class _ParamUpdater():
+    """Sends the param requests and makes sure that we get back values. Up
+    to window requests are in flight at the same time, but only one per
+    parameter. The requests that don't fit are queued and sent when answers
+    arrive, so the updater has no thread of its own and can be driven from
+    an event loop."""
 
-    def __init__(self, ed, useV2, updated_callback):
-        """Initialize the thread"""
-        Thread.__init__(self)
-        self.setDaemon(True)
-        self.wait_lock = Lock()
+    def __init__(self, ed, useV2, updated_callback,
+                 window=PARAM_UPDATE_WINDOW):
         self.ed = ed
         self._useV2 = useV2
         self.updated_callback = updated_callback
-        self.request_queue = Queue()
         self.ed.add_port_callback(CRTPPort.PARAM, self._new_packet_cb)
-        self._should_close = False
-        self._req_param = -1
+        self._window = max(1, window)
+        self._lock = Lock()
+        # Requests waiting to be sent, oldest first
+        self._queued = collections.deque()
+        # The var ids of the requests waiting for an answer
+        self._in_flight = set()
 
     def close(self):
-        # First empty the queue from all packets
-        while not self.request_queue.empty():
-            self.request_queue.get()
-        # Then force an unlock of the mutex if we are waiting for a packet
-        # we didn't get back due to a disconnect for example.
-        try:
-            self.wait_lock.release()
-        except Exception:
-            pass
+        # Forget the queued requests and the requests we are waiting for,
+        # we will not get them back due to a disconnect for example.
+        with self._lock:
+            self._queued.clear()
+            self._in_flight.clear()
 
     def request_param_setvalue(self, pk):
-        """Place a param set value request on the queue. When this is sent to
-        the Espdrone it will answer with the update param value. """
-        self.request_queue.put(pk)
+        """Send a param set value request. When this is sent to the
+        Espdrone it will answer with the update param value. """
+        self._queue_request(pk)
 
     def _new_packet_cb(self, pk):
         """Callback for newly arrived packets"""
@@ -329,17 +452,15 @@ class _ParamUpdater(Thread):
                     pk.data = pk.data[:2] + pk.data[3:]
             else:
                 var_id = pk.data[0]
-            if (pk.channel != TOC_CHANNEL and self._req_param == var_id and
-                    pk is not None):
-                self.updated_callback(pk)
-                self._req_param = -1
-                try:
-                    self.wait_lock.release()
-                except Exception:
-                    pass
+            with self._lock:
+                if var_id not in self._in_flight:
+                    return
+                self._in_flight.remove(var_id)
+            self.updated_callback(pk)
+            self._send_queued()
 
     def request_param_update(self, var_id):
-        """Place a param update request on the queue"""
+        """Send a param update request"""
         self._useV2 = self.ed.platform.get_protocol_version() >= 4
         pk = CRTPPacket()
         pk.set_header(CRTPPort.PARAM, READ_CHANNEL)
@@ -348,20 +469,39 @@ class _ParamUpdater(Thread):
         else:
             pk.data = struct.pack('<B', var_id)
         logger.debug('Requesting request to update param [%d]', var_id)
-        self.request_queue.put(pk)
+        self._queue_request(pk)
 
-    def run(self):
-        while not self._should_close:
-            pk = self.request_queue.get()  # Wait for request update
-            self.wait_lock.acquire()
-            if self.ed.link:
+    def _queue_request(self, pk):
+        with self._lock:
+            self._queued.append(pk)
+        self._send_queued()
+
+    def _send_queued(self):
+        """
+        Send the queued requests while there is room in the window, oldest
+        first. A request stays queued while another request for the same
+        parameter is waiting for an answer.
+        """
+        to_send = []
+        with self._lock:
+            waiting = []
+            while self._queued and len(self._in_flight) < self._window:
+                pk = self._queued.popleft()
                 if self._useV2:
-                    self._req_param = struct.unpack('<H', pk.data[:2])[0]
-                    self.ed.send_packet(
-                        pk, expected_reply=(tuple(pk.data[:2])))
+                    var_id = struct.unpack('<H', pk.data[:2])[0]
+                    expected_reply = tuple(pk.data[:2])
                 else:
-                    self._req_param = pk.data[0]
-                    self.ed.send_packet(
-                        pk, expected_reply=(tuple(pk.data[:1])))
-            else:
-                self.wait_lock.release()
+                    var_id = pk.data[0]
+                    expected_reply = tuple(pk.data[:1])
+                if var_id in self._in_flight:
+                    waiting.append(pk)
+                    continue
+                if not self.ed.link:
+                    continue
+                self._in_flight.add(var_id)
+                to_send.append((pk, expected_reply))
+            self._queued.extendleft(reversed(waiting))
+        # Sent without holding the lock, the answer can be handled by
+        # another thread before send_packet returns
+        for pk, expected_reply in to_send:
+            self.ed.send_packet(pk, expected_reply=expected_reply)
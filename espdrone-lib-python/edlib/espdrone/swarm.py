@@ -21,10 +21,29 @@
 #  along with this program; if not, write to the Free Software
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #  MA  02110-1301, USA.
+import logging
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from concurrent.futures import wait
+from threading import Lock
 from threading import Thread
 
 from edlib.espdrone import Espdrone
 from edlib.espdrone.syncEspdrone import SyncEspdrone
+if sys.version_info < (3,):
+    from Queue import Queue
+else:
+    from queue import Queue
+
+__author__ = 'Bitcraze AB'
+__all__ = ['Swarm', 'CachededFactory', 'DroneStats']
+
+logger = logging.getLogger(__name__)
+
+DroneStats = namedtuple('DroneStats', 'steps errors queued latency_avg '
+                                      'latency_max')
 
 
 class _Factory:
@@ -39,15 +58,19 @@ class _Factory:
 class CachededFactory:
     """
     Factory class that creates Espdrone instances with TOC caching
-    to reduce connection time.
+    to reduce connection time. With cache_param_values the parameter values
+    are cached as well.
     """
 
-    def __init__(self, ro_cache=None, rw_cache=None):
+    def __init__(self, ro_cache=None, rw_cache=None,
+                 cache_param_values=False):
         self.ro_cache = ro_cache
         self.rw_cache = rw_cache
+        self.cache_param_values = cache_param_values
 
     def construct(self, uri):
-        ed = Espdrone(ro_cache=self.ro_cache, rw_cache=self.rw_cache)
+        ed = Espdrone(ro_cache=self.ro_cache, rw_cache=self.rw_cache,
+                      cache_param_values=self.cache_param_values)
         return SyncEspdrone(uri, ed=ed)
 
 
@@ -59,6 +82,11 @@ class Swarm:
     When the swarm is connected, a link is opened to each Espdrone through
     SyncEspdrone instances. The instances are maintained by the class and are
     passed in as the first argument in swarm wide actions.
+
+    Every Espdrone has a worker thread with its own queue of steps. Steps
+    are submitted with submit() or submit_all() and return futures, so a
+    slow Espdrone only delays its own queue. barrier() waits until all
+    steps submitted so far are done.
     """
 
     def __init__(self, uris, factory=_Factory()):
@@ -73,6 +101,8 @@ class Swarm:
         """
         self._eds = {}
         self._is_open = False
+        self._workers = {}
+        self._workers_lock = Lock()
 
         for uri in uris:
             self._eds[uri] = factory.construct(uri)
@@ -99,6 +129,7 @@ class Swarm:
             ed.close_link()
 
         self._is_open = False
+        self._stop_workers()
 
     def __enter__(self):
         self.open_links()
@@ -136,60 +167,115 @@ class Swarm:
             args = self._process_args_dict(ed, uri, args_dict)
             func(*args)
 
-    def parallel(self, func, args_dict=None):
+    def parallel(self, func, args_dict=None, timeout=None):
         """
         Execute a function for all Espdrones in the swarm, in parallel.
-        One thread per Espdrone is started to execute the function. The
-        threads are joined at the end. Exceptions raised by the threads are
-        ignored.
+        The function is queued to the worker of each Espdrone and this
+        method waits for all of them to finish. Exceptions raised by the
+        function are ignored.
 
         For a description of the arguments, see sequential()
 
         :param func:
         :param args_dict:
+        :param timeout: max time to wait in seconds, None waits forever
         """
         try:
-            self.parallel_safe(func, args_dict)
+            self.parallel_safe(func, args_dict, timeout)
         except Exception:
             pass
 
-    def parallel_safe(self, func, args_dict=None):
+    def parallel_safe(self, func, args_dict=None, timeout=None):
         """
         Execute a function for all Espdrones in the swarm, in parallel.
-        One thread per Espdrone is started to execute the function. The
-        threads are joined at the end and if one or more of the threads raised
-        an exception this function will also raise an exception.
+        The function is queued to the worker of each Espdrone and this
+        method waits for all of them to finish. If one or more of them
+        raised an exception, or did not finish within timeout seconds, this
+        function will also raise an exception.
 
         For a description of the arguments, see sequential()
 
         :param func:
         :param args_dict:
+        :param timeout: max time to wait in seconds, None waits forever
+        """
+        futures = self.submit_all(func, args_dict)
+        done, not_done = wait(futures.values(), timeout)
+
+        if not_done:
+            raise Exception('One or more threads did not finish the '
+                            'parallel task in time')
+        for future in done:
+            if future.exception() is not None:
+                raise Exception('One or more threads raised an exception '
+                                'when executing parallel task')
+
+    def submit(self, uri, func, *args):
         """
-        threads = []
-        reporter = self.Reporter()
+        Queue a function to be executed by the worker of one Espdrone. The
+        function is called with the SyncEspdrone instance followed by args.
+        Functions for the same Espdrone are executed in order.
 
-        for uri, sed in self._eds.items():
-            args = [func, reporter] + \
-                self._process_args_dict(sed, uri, args_dict)
+        :param uri: the Espdrone to execute the function for
+        :param func: the function to execute
+        :return: a concurrent.futures.Future with the result
+        """
+        return self._get_worker(uri).submit(func, self._eds[uri], *args)
 
-            thread = Thread(target=self._thread_function_wrapper, args=args)
-            threads.append(thread)
-            thread.start()
+    def submit_all(self, func, args_dict=None):
+        """
+        Queue a function for all Espdrones in the swarm.
 
-        for thread in threads:
-            thread.join()
+        For a description of the arguments, see sequential()
 
-        if reporter.is_error_reported():
-            raise Exception('One or more threads raised an exception when '
-                            'executing parallel task')
+        :return: a dictionary keyed on URI with a Future per Espdrone
+        """
+        futures = {}
+        for uri, sed in self._eds.items():
+            args = self._process_args_dict(sed, uri, args_dict)
+            futures[uri] = self._get_worker(uri).submit(func, *args)
+        return futures
 
-    def _thread_function_wrapper(self, *args):
-        try:
-            func = args[0]
-            reporter = args[1]
-            func(*args[2:])
-        except Exception:
-            reporter.report_error()
+    def barrier(self, timeout=None):
+        """
+        Wait until all functions that have been queued so far are done for
+        all Espdrones.
+
+        :param timeout: max time to wait in seconds, None waits forever
+        :return: True if all Espdrones reached the barrier in time
+        """
+        futures = [worker.barrier() for worker in self._all_workers()]
+        done, not_done = wait(futures, timeout)
+        return len(not_done) == 0
+
+    def get_stats(self):
+        """
+        Return the statistics of the workers as a dictionary keyed on URI
+        with a DroneStats tuple per Espdrone. The latencies (in seconds)
+        are from queuing a function until it is done.
+        """
+        with self._workers_lock:
+            return {uri: worker.get_stats()
+                    for uri, worker in self._workers.items()}
+
+    def _get_worker(self, uri):
+        with self._workers_lock:
+            worker = self._workers.get(uri)
+            if worker is None:
+                worker = _DroneWorker(uri)
+                worker.start()
+                self._workers[uri] = worker
+            return worker
+
+    def _all_workers(self):
+        return [self._get_worker(uri) for uri in self._eds]
+
+    def _stop_workers(self):
+        with self._workers_lock:
+            workers = list(self._workers.values())
+            self._workers = {}
+        for worker in workers:
+            worker.stop()
 
     def _process_args_dict(self, sed, uri, args_dict):
         args = [sed]
@@ -199,13 +285,75 @@ class Swarm:
 
         return args
 
-    class Reporter:
 
-        def __init__(self):
-            self.error_reported = False
+class _DroneWorker(Thread):
+    """Executes the queued functions for one Espdrone, in order"""
+
+    def __init__(self, uri):
+        Thread.__init__(self, name='swarm-' + str(uri))
+        self.daemon = True
+        self._queue = Queue()
+        self._lock = Lock()
+        self._steps = 0
+        self._errors = 0
+        self._latency_total = 0.0
+        self._latency_max = None
 
-        def report_error(self):
-            self.error_reported = True
+    def submit(self, func, *args):
+        future = Future()
+        self._queue.put((future, func, args, time.monotonic()))
+        return future
 
-        def is_error_reported(self):
-            return self.error_reported
+    def barrier(self):
+        """
+        Return a future that is done when the functions queued so far are
+        done. The barrier is not counted as a step in the statistics.
+        """
+        future = Future()
+        self._queue.put((future, None, (), time.monotonic()))
+        return future
+
+    def stop(self):
+        """Stop the thread once the queued functions are done"""
+        self._queue.put(None)
+
+    def get_stats(self):
+        with self._lock:
+            latency_avg = None
+            if self._steps > 0:
+                latency_avg = self._latency_total / self._steps
+            return DroneStats(self._steps, self._errors, self._queue.qsize(),
+                              latency_avg, self._latency_max)
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, func, args, queued_ts = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            if func is None:
+                future.set_result(None)
+                continue
+            result = None
+            exception = None
+            try:
+                result = func(*args)
+            except Exception as e:
+                logger.debug('Swarm step raised %s', e)
+                exception = e
+
+            # Update the statistics before anyone waiting is released
+            latency = time.monotonic() - queued_ts
+            with self._lock:
+                self._steps += 1
+                self._errors += exception is not None
+                self._latency_total += latency
+                if self._latency_max is None or latency > self._latency_max:
+                    self._latency_max = latency
+
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
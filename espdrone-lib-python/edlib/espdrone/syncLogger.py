@@ -28,8 +28,15 @@ This class provides synchronous access to log data from the Espdrone.
 
 It acts as an iterator and returns the next value on each iteration.
 If no value is available it blocks until log data is available again.
+
+In batch mode the samples are collected in preallocated NumPy columns and
+each iteration returns a LogBatch with the samples of a fixed number of
+packets and/or a time window. The samples are kept in a ring of max_samples,
+if the consumer falls behind the oldest samples are dropped and counted.
 """
+import collections
 import sys
+import threading
 
 from edlib.espdrone.syncEspdrone import SyncEspdrone
 
@@ -38,15 +45,36 @@ if sys.version_info < (3,):
 else:
     from queue import Queue
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LogBatch = collections.namedtuple(
+    'LogBatch', 'timestamps data dropped logconf host_timestamps')
+
 
 class SyncLogger:
     DISCONNECT_EVENT = 'DISCONNECT_EVENT'
 
-    def __init__(self, espdrone, log_config):
+    # Size of the sample ring in batch mode
+    DEFAULT_MAX_SAMPLES = 10000
+
+    def __init__(self, espdrone, log_config, batch_size=None,
+                 batch_period_ms=None, max_samples=DEFAULT_MAX_SAMPLES):
         """
         Construct an instance of a SyncLogger
 
-        Takes an Espdrone or SyncEspdrone instance and a log configuration
+        Takes an Espdrone or SyncEspdrone instance and a log configuration.
+
+        If batch_size and/or batch_period_ms is set the logger is iterated
+        as LogBatch tuples: timestamps, host_timestamps and data are NumPy
+        arrays, data is a dict with one array per variable. The host
+        timestamps are NaN until the host time can be estimated. A batch is
+        returned when it holds batch_size samples or when a sample ends the
+        batch_period_ms window the batch started in, whichever comes first.
+        dropped is the number of samples lost since the last batch because
+        the ring was full.
         """
         if isinstance(espdrone, SyncEspdrone):
             self._ed = espdrone.ed
@@ -60,12 +88,34 @@ class SyncLogger:
 
         self._is_connected = False
 
+        self._batch_mode = batch_size is not None or \
+            batch_period_ms is not None
+        if self._batch_mode:
+            if numpy is None:
+                raise ValueError('NumPy is required for batch mode')
+            if batch_size is not None and not 0 < batch_size <= max_samples:
+                raise ValueError('batch_size must be between 1 and '
+                                 'max_samples')
+        self._batch_size = batch_size
+        self._batch_period = batch_period_ms
+        self._max_samples = max_samples
+        self._ring_lock = threading.Condition()
+        self._ring_clear()
+        self.dropped = 0
+
     def connect(self):
         if self._is_connected:
             raise Exception('Already connected')
 
+        with self._ring_lock:
+            self._ring_clear()
+
         self._ed.disconnected.add_callback(self._disconnected)
-        self._log_config.data_received_cb.add_callback(self._log_callback)
+        if self._batch_mode:
+            self._log_config.sample_received_cb.add_callback(self._ring_add)
+        else:
+            self._log_config.data_received_cb.add_callback(
+                self._log_callback)
         self._log_config.start()
 
         self._is_connected = True
@@ -75,14 +125,22 @@ class SyncLogger:
             self._log_config.stop()
             self._log_config.delete()
 
-            self._log_config.data_received_cb.remove_callback(
-                self._log_callback)
+            if self._batch_mode:
+                self._log_config.sample_received_cb.remove_callback(
+                    self._ring_add)
+            else:
+                self._log_config.data_received_cb.remove_callback(
+                    self._log_callback)
             self._ed.disconnected.remove_callback(self._disconnected)
 
             self._queue.empty()
 
             self._is_connected = False
 
+            # Wake up a consumer waiting for a batch
+            with self._ring_lock:
+                self._ring_lock.notify_all()
+
     def is_connected(self):
         return self._is_connected
 
@@ -93,6 +151,10 @@ class SyncLogger:
         return self.__next__()
 
     def __next__(self):
+        # Batches collected before a disconnect are still returned
+        if self._batch_mode:
+            return self._next_batch()
+
         if not self._is_connected:
             raise StopIteration
 
@@ -116,3 +178,100 @@ class SyncLogger:
     def _disconnected(self, link_uri):
         self._queue.put(self.DISCONNECT_EVENT)
         self.disconnect()
+
+    def _ring_clear(self):
+        self._timestamps = None
+        self._host_timestamps = None
+        self._samples = None
+        self._logblock = None
+        # Sequence numbers of the oldest sample in the ring and the next
+        # sample to be written, the ring index is the sequence modulo size
+        self._read_seq = 0
+        self._write_seq = 0
+        # Sequence numbers of the first sample of each finished time window
+        self._window_ends = collections.deque()
+        self._window_start = None
+        self._dropped_since_batch = 0
+
+    def _ring_add(self, ts, host_timestamp, data, logblock):
+        with self._ring_lock:
+            if self._samples is None:
+                self._timestamps = numpy.zeros(self._max_samples, 'u8')
+                self._host_timestamps = numpy.zeros(self._max_samples)
+                self._samples = numpy.zeros(self._max_samples,
+                                            logblock.get_dtype())
+                self._logblock = logblock
+
+            if self._write_seq - self._read_seq == self._max_samples:
+                self._read_seq += 1
+                self._dropped_since_batch += 1
+                self.dropped += 1
+
+            if isinstance(data, dict):
+                data = tuple(data[name] for name in self._samples.dtype.names)
+            elif not isinstance(data, numpy.void):
+                data = tuple(data)
+            index = self._write_seq % self._max_samples
+            self._samples[index] = data
+            self._timestamps[index] = ts
+            self._host_timestamps[index] = numpy.nan \
+                if host_timestamp is None else host_timestamp
+
+            ready = False
+            if self._batch_period is not None:
+                if self._window_start is None:
+                    self._window_start = ts
+                elif ts >= self._window_start + self._batch_period:
+                    windows = (ts - self._window_start) // self._batch_period
+                    self._window_start += windows * self._batch_period
+                    self._window_ends.append(self._write_seq)
+                    ready = True
+            self._write_seq += 1
+
+            if self._batch_size is not None and \
+                    self._write_seq - self._read_seq >= self._batch_size:
+                ready = True
+            if ready:
+                self._ring_lock.notify_all()
+
+    def _batch_end(self):
+        """The sequence number ending the next batch, None if not ready"""
+        # Windows that have been dropped completely are skipped
+        while self._window_ends and self._window_ends[0] <= self._read_seq:
+            self._window_ends.popleft()
+        end = None
+        if self._window_ends:
+            end = self._window_ends[0]
+        if self._batch_size is not None:
+            size_end = self._read_seq + self._batch_size
+            if size_end <= self._write_seq and (end is None or
+                                                size_end < end):
+                end = size_end
+        return end
+
+    def _next_batch(self):
+        with self._ring_lock:
+            while True:
+                end = self._batch_end()
+                if end is not None:
+                    break
+                if not self._is_connected:
+                    # Return what is left before stopping
+                    if self._write_seq > self._read_seq:
+                        end = self._write_seq
+                        break
+                    raise StopIteration
+                self._ring_lock.wait()
+
+            indexes = numpy.arange(self._read_seq, end) % self._max_samples
+            samples = self._samples[indexes]
+            batch = LogBatch(
+                self._timestamps[indexes],
+                {name: numpy.ascontiguousarray(samples[name])
+                 for name in samples.dtype.names},
+                self._dropped_since_batch,
+                self._logblock,
+                self._host_timestamps[indexes])
+            self._read_seq = end
+            self._dropped_since_batch = 0
+            return batch
@@ -30,6 +30,7 @@ a TOC for logging or parameters.
 """
 import logging
 import struct
+import time
 
 from edlib.crtp.crtpstack import CRTPPacket
 
@@ -51,12 +52,23 @@ IDLE = 'IDLE'
 GET_TOC_INFO = 'GET_TOC_INFO'
 GET_TOC_ELEMENT = 'GET_TOC_ELEMENT'
 
+# Number of TOC element requests that are in flight at the same time
+TOC_FETCH_WINDOW = 10
+
 
 class Toc:
     """Container for TocElements."""
 
     def __init__(self):
         self.toc = {}
+        # Time in seconds it took to fetch the TOC from the Espdrone (or the
+        # cache), None until fetched
+        self.fetch_time = None
+        # CRC of the TOC reported by the Espdrone, None until fetched
+        self.crc = None
+        # Index of the elements by id, built for the dict in _indexed_toc
+        self._by_id = {}
+        self._indexed_toc = None
 
     def clear(self):
         """Clear the TOC"""
@@ -69,15 +81,18 @@ class Toc:
         except KeyError:
             self.toc[element.group] = {}
             self.toc[element.group][element.name] = element
+        if self._indexed_toc is self.toc:
+            self._by_id[element.ident] = element
 
     def get_element_by_complete_name(self, complete_name):
         """Get a TocElement element identified by complete name from the
         container."""
         try:
-            return self.get_element_by_id(self.get_element_id(complete_name))
+            [group, name] = complete_name.split('.')
         except ValueError:
             # Item not found
             return None
+        return self.get_element(group, name)
 
     def get_element_id(self, complete_name):
         """Get the TocElement element id-number of the element with the
@@ -101,18 +116,27 @@ class Toc:
     def get_element_by_id(self, ident):
         """Get a TocElement element identified by index number from the
         container."""
-        for group in list(self.toc.keys()):
-            for name in list(self.toc[group].keys()):
-                if self.toc[group][name].ident == ident:
-                    return self.toc[group][name]
-        return None
+        # The dict is replaced when the TOC is cleared or read from the cache
+        if self._indexed_toc is not self.toc:
+            self._by_id = {element.ident: element
+                           for group in self.toc.values()
+                           for element in group.values()}
+            self._indexed_toc = self.toc
+        return self._by_id.get(ident)
 
 
 class Toedetcher:
-    """Fetches TOC entries from the Espdrone"""
+    """
+    Fetches TOC entries from the Espdrone
+
+    Up to window element requests are kept in flight at the same time.
+    Replies may arrive in any order and duplicates (caused by resends) are
+    ignored. Requests that are not answered are resent by the Espdrone
+    class until the reply arrives.
+    """
 
     def __init__(self, espdrone, element_class, port, toc_holder,
-                 finished_callback, toc_cache):
+                 finished_callback, toc_cache, window=TOC_FETCH_WINDOW):
         self.ed = espdrone
         self.port = port
         self._crc = 0
@@ -124,6 +148,9 @@ class Toedetcher:
         self.finished_callback = finished_callback
         self.element_class = element_class
         self._useV2 = False
+        self._window = max(1, window)
+        self._received = set()
+        self._start_time = None
 
     def start(self):
         """Initiate fetching of the TOC."""
@@ -132,6 +159,7 @@ class Toedetcher:
         logger.debug('[%d]: Using V2 protocol: %d', self.port, self._useV2)
 
         logger.debug('[%d]: Start fetching...', self.port)
+        self._start_time = time.monotonic()
         # Register callback in this class for the port
         self.ed.add_port_callback(self.port, self._new_packet_cb)
 
@@ -149,7 +177,10 @@ class Toedetcher:
     def _toc_fetch_finished(self):
         """Callback for when the TOC fetching is finished"""
         self.ed.remove_port_callback(self.port, self._new_packet_cb)
-        logger.debug('[%d]: Done!', self.port)
+        self.state = IDLE
+        self.toc.fetch_time = time.monotonic() - self._start_time
+        logger.info('[%d]: TOC with %d items fetched in %.3f s',
+                    self.port, self.nbr_of_items, self.toc.fetch_time)
         self.finished_callback()
 
     def _new_packet_cb(self, packet):
@@ -157,9 +188,12 @@ class Toedetcher:
         chan = packet.channel
         if (chan != 0):
             return
+        cmd = packet.data[0]
         payload = packet.data[1:]
 
         if (self.state == GET_TOC_INFO):
+            if cmd != (CMD_TOC_INFO_V2 if self._useV2 else CMD_TOC_INFO):
+                return
             if self._useV2:
                 [self.nbr_of_items, self._crc] = struct.unpack(
                     '<HI', payload[:6])
@@ -169,39 +203,53 @@ class Toedetcher:
             logger.debug('[%d]: Got TOC CRC, %d items and crc=0x%08X',
                          self.port, self.nbr_of_items, self._crc)
 
+            self.toc.crc = self._crc
             cache_data = self._toc_cache.fetch(self._crc)
             if (cache_data):
                 self.toc.toc = cache_data
                 logger.info('TOC for port [%s] found in cache' % self.port)
                 self._toc_fetch_finished()
+            elif self.nbr_of_items == 0:
+                self._toc_cache.insert(self._crc, self.toc.toc)
+                self._toc_fetch_finished()
             else:
                 self.state = GET_TOC_ELEMENT
-                self.requested_index = 0
-                self._request_toc_element(self.requested_index)
+                self.requested_index = -1
+                self._received = set()
+                for _ in range(min(self._window, self.nbr_of_items)):
+                    self._request_next_toc_element()
 
         elif (self.state == GET_TOC_ELEMENT):
-            # Always add new element, but only request new if it's not the
-            # last one.
+            if cmd != (CMD_TOC_ITEM_V2 if self._useV2 else CMD_TOC_ELEMENT):
+                return
             if self._useV2:
                 ident = struct.unpack('<H', payload[:2])[0]
             else:
                 ident = payload[0]
 
-            if ident != self.requested_index:
+            # Ignore duplicates caused by resends and unexpected replies
+            if ident in self._received or ident >= self.nbr_of_items:
                 return
+            self._received.add(ident)
             if self._useV2:
                 self.toc.add_element(self.element_class(ident, payload[2:]))
             else:
                 self.toc.add_element(self.element_class(ident, payload[1:]))
             logger.debug('Added element [%s]', ident)
-            if (self.requested_index < (self.nbr_of_items - 1)):
-                logger.debug('[%d]: More variables, requesting index %d',
-                             self.port, self.requested_index + 1)
-                self.requested_index = self.requested_index + 1
-                self._request_toc_element(self.requested_index)
-            else:  # No more variables in TOC
+
+            if len(self._received) == self.nbr_of_items:
+                # No more variables in TOC
                 self._toc_cache.insert(self._crc, self.toc.toc)
                 self._toc_fetch_finished()
+            elif self.requested_index < (self.nbr_of_items - 1):
+                self._request_next_toc_element()
+
+    def _request_next_toc_element(self):
+        """Request the next item in the TOC that has not been requested"""
+        self.requested_index = self.requested_index + 1
+        logger.debug('[%d]: More variables, requesting index %d',
+                     self.port, self.requested_index)
+        self._request_toc_element(self.requested_index)
 
     def _request_toc_element(self, index):
         """Request information about a specific item in the TOC"""
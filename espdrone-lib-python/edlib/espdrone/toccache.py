@@ -27,20 +27,89 @@
 """
 Access the TOC cache for reading/writing. It supports both user
 cache and dist cache.
+
+The last known parameter values of each Espdrone can be stored as well,
+see ParamValueCache.
+
+TOCs are stored either as JSON (<CRC>.json) or in a compact binary
+format (<CRC>.toc). Decoded TOCs are kept in an in-process LRU that is
+shared by all TocCache instances, so several Espdrones with the same
+firmware only read and parse the TOC once.
 """
 import json
 import logging
 import os
+import re
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
 from glob import glob
 
-from .log import LogTocElement  # noqa
-from .param import ParamTocElement  # noqa
+from .log import LogTocElement
+from .param import ParamTocElement
 
 __author__ = 'Bitcraze AB'
-__all__ = ['TocCache']
+__all__ = ['TocCache', 'ParamValueCache']
 
 logger = logging.getLogger(__name__)
 
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'toc'
+
+_BINARY_MAGIC = b'EDTC'
+_BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct('<4sBH')
+_BINARY_ELEMENT = struct.Struct('<BHB')
+
+# Element classes that can be stored in the cache, the index in the tuple
+# is used as class id in the binary format
+_ELEMENT_CLASSES = (LogTocElement, ParamTocElement)
+_ELEMENT_CLASSES_BY_NAME = {c.__name__: c for c in _ELEMENT_CLASSES}
+
+
+class _TocLru():
+    """Thread safe LRU of decoded TOCs keyed by CRC"""
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._tocs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, crc):
+        with self._lock:
+            toc = self._tocs.get(crc)
+            if toc is not None:
+                self._tocs.move_to_end(crc)
+            return toc
+
+    def put(self, crc, toc):
+        with self._lock:
+            self._tocs[crc] = toc
+            self._tocs.move_to_end(crc)
+            while len(self._tocs) > self._max_size:
+                self._tocs.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._tocs.clear()
+
+
+# Shared between all TocCache instances
+_shared_lru = _TocLru(16)
+
+
+def _write_atomic(filename, data):
+    """Write to a temporary file and move it in place"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as cache:
+            cache.write(data)
+        os.replace(tmp, filename)
+    except Exception:
+        os.remove(tmp)
+        raise
+
 
 class TocCache():
     """
@@ -48,56 +117,137 @@ class TocCache():
     don't supply any directories.
     """
 
-    def __init__(self, ro_cache=None, rw_cache=None):
-        self._cache_files = []
-        if (ro_cache):
-            self._cache_files += glob(ro_cache + '/*.json')
+    def __init__(self, ro_cache=None, rw_cache=None,
+                 file_format=FORMAT_BINARY):
+        if file_format not in (FORMAT_JSON, FORMAT_BINARY):
+            raise ValueError('Unknown TOC cache format [%s]' % file_format)
+
+        # CRC -> path, files in rw_cache take precedence over ro_cache and
+        # binary files over JSON files
+        self._cache_files = {}
+        for directory in (ro_cache, rw_cache):
+            if directory:
+                self._index_files(directory)
         if (rw_cache):
-            self._cache_files += glob(rw_cache + '/*.json')
             if not os.path.exists(rw_cache):
                 os.makedirs(rw_cache)
 
+        self._enabled = bool(ro_cache or rw_cache)
         self._rw_cache = rw_cache
+        self._file_format = file_format
+
+    def _index_files(self, directory):
+        for extension in (FORMAT_JSON, FORMAT_BINARY):
+            for path in glob(os.path.join(directory, '*.' + extension)):
+                name = os.path.splitext(os.path.basename(path))[0]
+                try:
+                    crc = int(name, 16)
+                except ValueError:
+                    continue
+                self._cache_files[crc] = path
 
     def fetch(self, crc):
         """ Try to get a hit in the cache, return None otherwise """
-        cache_data = None
-        pattern = '%08X.json' % crc
-        hit = None
+        if not self._enabled:
+            return None
 
-        for name in self._cache_files:
-            if (name.endswith(pattern)):
-                hit = name
-
-        if (hit):
+        toc = _shared_lru.get(crc)
+        if toc is None:
+            hit = self._cache_files.get(crc)
+            if hit is None:
+                return None
             try:
-                cache = open(hit)
-                cache_data = json.load(cache,
-                                       object_hook=self._decoder)
-                cache.close()
+                toc = self._read_file(hit)
             except Exception as exp:
                 logger.warning('Error while parsing cache file [%s]:%s',
                                hit, str(exp))
+                return None
+            _shared_lru.put(crc, toc)
 
-        return cache_data
+        return self._copy(toc)
 
     def insert(self, crc, toc):
         """ Save a new cache to file """
         if self._rw_cache:
+            filename = os.path.join(self._rw_cache,
+                                    '%08X.%s' % (crc, self._file_format))
             try:
-                filename = '%s/%08X.json' % (self._rw_cache, crc)
-                cache = open(filename, 'w')
-                cache.write(json.dumps(toc, indent=2,
-                                       default=self._encoder))
-                cache.close()
+                if self._file_format == FORMAT_BINARY:
+                    data = self._encode_binary(toc)
+                else:
+                    data = json.dumps(toc, separators=(',', ':'),
+                                      default=self._encoder).encode()
+                _write_atomic(filename, data)
                 logger.info('Saved cache to [%s]', filename)
-                self._cache_files += [filename]
+                self._cache_files[crc] = filename
+                _shared_lru.put(crc, self._copy(toc))
             except Exception as exp:
                 logger.warning('Could not save cache to file [%s]: %s',
                                filename, str(exp))
         else:
             logger.warning('Could not save cache, no writable directory')
 
+    @staticmethod
+    def _copy(toc):
+        """
+        Copy the group dictionaries of a TOC. Elements are shared, they
+        are not modified after the TOC has been fetched.
+        """
+        return {group: dict(elements) for group, elements in toc.items()}
+
+    def _read_file(self, path):
+        if path.endswith('.' + FORMAT_BINARY):
+            with open(path, 'rb') as cache:
+                return self._decode_binary(cache.read())
+        with open(path) as cache:
+            return json.load(cache, object_hook=self._decoder)
+
+    @staticmethod
+    def _encode_binary(toc):
+        """
+        Encode a TOC as a header followed by one record per element. Each
+        record is class id, ident and access followed by group, name,
+        ctype and pytype as length prefixed strings.
+        """
+        elements = [elem for group in toc.values() for elem in group.values()]
+        data = bytearray(_BINARY_HEADER.pack(_BINARY_MAGIC, _BINARY_VERSION,
+                                             len(elements)))
+        for elem in elements:
+            data += _BINARY_ELEMENT.pack(
+                _ELEMENT_CLASSES.index(type(elem)), elem.ident, elem.access)
+            for string in (elem.group, elem.name, elem.ctype, elem.pytype):
+                encoded = string.encode('ISO-8859-1')
+                data.append(len(encoded))
+                data += encoded
+        return bytes(data)
+
+    @staticmethod
+    def _decode_binary(data):
+        """Decode a TOC encoded by _encode_binary"""
+        magic, version, count = _BINARY_HEADER.unpack_from(data)
+        if magic != _BINARY_MAGIC or version != _BINARY_VERSION:
+            raise ValueError('Unsupported binary TOC cache file')
+
+        toc = {}
+        offset = _BINARY_HEADER.size
+        for _ in range(count):
+            class_id, ident, access = _BINARY_ELEMENT.unpack_from(data,
+                                                                  offset)
+            offset += _BINARY_ELEMENT.size
+            strings = []
+            for _ in range(4):
+                length = data[offset]
+                strings.append(
+                    data[offset + 1:offset + 1 + length].decode('ISO-8859-1'))
+                offset += 1 + length
+
+            elem = _ELEMENT_CLASSES[class_id]()
+            elem.ident = ident
+            elem.access = access
+            elem.group, elem.name, elem.ctype, elem.pytype = strings
+            toc.setdefault(elem.group, {})[elem.name] = elem
+        return toc
+
     def _encoder(self, obj):
         """ Encode a toc element leaf-node """
         return {'__class__': obj.__class__.__name__,
@@ -107,12 +257,11 @@ class TocCache():
                 'ctype': obj.ctype,
                 'pytype': obj.pytype,
                 'access': obj.access}
-        raise TypeError(repr(obj) + ' is not JSON serializable')
 
     def _decoder(self, obj):
         """ Decode a toc element leaf-node """
         if '__class__' in obj:
-            elem = eval(obj['__class__'])()
+            elem = _ELEMENT_CLASSES_BY_NAME[obj['__class__']]()
             elem.ident = obj['ident']
             elem.group = str(obj['group'])
             elem.name = str(obj['name'])
@@ -121,3 +270,45 @@ class TocCache():
             elem.access = obj['access']
             return elem
         return obj
+
+
+class ParamValueCache():
+    """
+    Access to the last known parameter values of Espdrones. The values are
+    stored per URI and parameter TOC CRC, so they are only used for the
+    same Espdrone running the same firmware.
+    """
+
+    def __init__(self, rw_cache):
+        self._rw_cache = rw_cache
+        if not os.path.exists(rw_cache):
+            os.makedirs(rw_cache)
+
+    def _filename(self, uri, crc):
+        name = re.sub('[^0-9A-Za-z]+', '_', uri).strip('_')
+        return os.path.join(self._rw_cache,
+                            'params_%s_%08X.json' % (name, crc))
+
+    def fetch(self, uri, crc):
+        """Return the values as {group: {name: value}} or None"""
+        filename = self._filename(uri, crc)
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename) as cache:
+                return json.load(cache)
+        except Exception as exp:
+            logger.warning('Error while parsing cache file [%s]:%s',
+                           filename, str(exp))
+            return None
+
+    def insert(self, uri, crc, values):
+        """Save the values of all parameters"""
+        filename = self._filename(uri, crc)
+        try:
+            _write_atomic(filename, json.dumps(
+                values, separators=(',', ':')).encode())
+            logger.debug('Saved parameter values to [%s]', filename)
+        except Exception as exp:
+            logger.warning('Could not save cache to file [%s]: %s',
+                           filename, str(exp))
@@ -42,17 +42,11 @@ this mode of operation takeoff and landing is executed when the context is
 created/closed.
 """
 import math
-import sys
 import time
-from threading import Thread
+from threading import Lock
 
 from edlib.espdrone.syncEspdrone import SyncEspdrone
 
-if sys.version_info < (3,):
-    from Queue import Queue, Empty
-else:
-    from queue import Queue, Empty
-
 
 class MotionCommander:
     """The motion commander"""
@@ -74,7 +68,7 @@ class MotionCommander:
         self.default_height = default_height
 
         self._is_flying = False
-        self._thread = None
+        self._setpoint_streamer = None
 
     # Distance based primitives
 
@@ -98,8 +92,8 @@ class MotionCommander:
         self._is_flying = True
         self._reset_position_estimator()
 
-        self._thread = _SetPointThread(self._ed)
-        self._thread.start()
+        self._setpoint_streamer = _SetPointStreamer(self._ed)
+        self._setpoint_streamer.start()
 
         if height is None:
             height = self.default_height
@@ -117,10 +111,10 @@ class MotionCommander:
         :return:
         """
         if self._is_flying:
-            self.down(self._thread.get_height(), velocity)
+            self.down(self._setpoint_streamer.get_height(), velocity)
 
-            self._thread.stop()
-            self._thread = None
+            self._setpoint_streamer.stop()
+            self._setpoint_streamer = None
 
             self._ed.commander.send_stop_setpoint()
             self._is_flying = False
@@ -406,7 +400,7 @@ class MotionCommander:
     def _set_vel_setpoint(self, velocity_x, velocity_y, velocity_z, rate_yaw):
         if not self._is_flying:
             raise Exception('Can not move on the ground. Take off first!')
-        self._thread.set_vel_setpoint(
+        self._setpoint_streamer.set_vel_setpoint(
             velocity_x, velocity_y, velocity_z, rate_yaw)
 
     def _reset_position_estimator(self):
@@ -416,17 +410,12 @@ class MotionCommander:
         time.sleep(2)
 
 
-class _SetPointThread(Thread):
-    TERMINATE_EVENT = 'terminate'
-    UPDATE_PERIOD = 0.2
+class _SetPointStreamer():
     ABS_Z_INDEX = 3
 
-    def __init__(self, ed, update_period=UPDATE_PERIOD):
-        Thread.__init__(self)
-        self.update_period = update_period
-
-        self._queue = Queue()
-        self._ed = ed
+    def __init__(self, ed):
+        self._streamer = ed.commander.streamer
+        self._lock = Lock()
 
         self._hover_setpoint = [0.0, 0.0, 0.0, 0.0]
 
@@ -434,18 +423,31 @@ class _SetPointThread(Thread):
         self._z_velocity = 0.0
         self._z_base_time = 0.0
 
+    def start(self):
+        """
+        Start streaming hover setpoints through the commander streamer
+        """
+        self._streamer.before_send.add_callback(self._update_setpoint)
+        self._streamer.start()
+
     def stop(self):
         """
-        Stop the thread and wait for it to terminate
+        Stop streaming setpoints
 
         :return:
         """
-        self._queue.put(self.TERMINATE_EVENT)
-        self.join()
+        self._streamer.stop()
+        self._streamer.before_send.remove_callback(self._update_setpoint)
 
     def set_vel_setpoint(self, velocity_x, velocity_y, velocity_z, rate_yaw):
         """Set the velocity setpoint to use for the future motion"""
-        self._queue.put((velocity_x, velocity_y, velocity_z, rate_yaw))
+        with self._lock:
+            self._z_base = self._current_z()
+            self._z_velocity = velocity_z
+            self._z_base_time = time.time()
+
+            self._hover_setpoint = [velocity_x, velocity_y, rate_yaw,
+                                    self._z_base]
 
     def get_height(self):
         """
@@ -455,29 +457,12 @@ class _SetPointThread(Thread):
         """
         return self._hover_setpoint[self.ABS_Z_INDEX]
 
-    def run(self):
-        while True:
-            try:
-                event = self._queue.get(block=True, timeout=self.update_period)
-                if event == self.TERMINATE_EVENT:
-                    return
-
-                self._new_setpoint(*event)
-            except Empty:
-                pass
-
-            self._update_z_in_setpoint()
-            self._ed.commander.send_hover_setpoint(*self._hover_setpoint)
-
-    def _new_setpoint(self, velocity_x, velocity_y, velocity_z, rate_yaw):
-        self._z_base = self._current_z()
-        self._z_velocity = velocity_z
-        self._z_base_time = time.time()
-
-        self._hover_setpoint = [velocity_x, velocity_y, rate_yaw, self._z_base]
-
-    def _update_z_in_setpoint(self):
-        self._hover_setpoint[self.ABS_Z_INDEX] = self._current_z()
+    def _update_setpoint(self):
+        # Called by the streamer right before each send, the height is
+        # integrated from the vertical velocity
+        with self._lock:
+            self._hover_setpoint[self.ABS_Z_INDEX] = self._current_z()
+            self._streamer.set_hover_setpoint(*self._hover_setpoint)
 
     def _current_z(self):
         now = time.time()
@@ -26,27 +26,314 @@
 #  MA  02110-1301, USA.
 """
 Callback objects used in the Espdrone library
+
+A Caller is normally called from the link threads of the Espdrone. The
+callbacks are kept in a tuple that is replaced when callbacks are added or
+removed, so call() iterates a snapshot without taking a lock and callbacks
+can add or remove callbacks while being called.
+
+Slow subscribers (writing files, publishing data, updating a UI) can be
+dispatched to a CallbackExecutor instead of being called on the link thread.
+Each dispatched callback has its own bounded queue of pending calls, when it
+is full new calls are either dropped or replace the pending call (coalesce).
 """
+import collections
+import logging
+import sys
+import threading
+import time
+import weakref
+
+if sys.version_info < (3,):
+    import Queue as queue
+else:
+    import queue
 
 __author__ = 'Bitcraze AB'
-__all__ = ['Caller']
+__all__ = ['Caller', 'CallbackExecutor', 'CallbackStats', 'shared_executor',
+           'POLICY_DROP', 'POLICY_COALESCE']
+
+logger = logging.getLogger(__name__)
+
+# Drop new calls when the pending queue of a dispatched callback is full
+POLICY_DROP = 'drop'
+# Replace the pending calls of a dispatched callback with the latest call
+POLICY_COALESCE = 'coalesce'
+
+DEFAULT_MAX_PENDING = 100
+
+CallbackStats = collections.namedtuple(
+    'CallbackStats', 'calls dropped coalesced pending time_avg time_max')
+
+
+class _Callback():
+    """
+    Base for callbacks that are wrapped by the Caller. Compares equal to and
+    hashes like the wrapped callable so that it can be found and removed
+    again.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self._hash = hash(target)
+        self.calls = 0
+        self.time_total = 0.0
+        self.time_max = 0.0
+
+    def _resolve(self):
+        return self.target
+
+    def _run(self, cb, args):
+        start = time.perf_counter()
+        try:
+            cb(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.calls += 1
+            self.time_total += elapsed
+            if elapsed > self.time_max:
+                self.time_max = elapsed
+
+    def __call__(self, *args):
+        cb = self._resolve()
+        if cb is not None:
+            self._run(cb, args)
+
+    def __eq__(self, other):
+        if isinstance(other, _Callback):
+            return self is other
+        cb = self._resolve()
+        return cb is not None and cb == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
+    def stats(self):
+        return CallbackStats(
+            self.calls, 0, 0, 0,
+            self.time_total / self.calls if self.calls else 0.0,
+            self.time_max)
+
+
+class _WeakCallback(_Callback):
+    """
+    Keeps a weak reference to the callback, bound methods are referenced
+    through their object. The callback is removed from the Caller when it's
+    garbage collected.
+    """
+
+    def __init__(self, target, on_dead):
+        super(_WeakCallback, self).__init__(None)
+        if hasattr(target, '__self__') and hasattr(target, '__func__'):
+            self._ref = weakref.WeakMethod(target, on_dead)
+        else:
+            self._ref = weakref.ref(target, on_dead)
+        self._hash = hash(target)
+
+    def _resolve(self):
+        return self._ref()
+
+
+class _DispatchedCallback(_Callback):
+    """
+    Queues the calls and runs them on a CallbackExecutor. The calls of one
+    callback are run in order, one at a time.
+    """
+
+    def __init__(self, inner, executor, policy, max_pending):
+        super(_DispatchedCallback, self).__init__(None)
+        self._hash = hash(inner)
+        self._inner = inner
+        self._executor = executor
+        self._policy = policy
+        self._pending = collections.deque()
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self.dropped = 0
+        self.coalesced = 0
+
+    def _resolve(self):
+        return self._inner._resolve()
+
+    def __call__(self, *args):
+        with self._lock:
+            if len(self._pending) >= self._max_pending:
+                if self._policy == POLICY_COALESCE:
+                    self.coalesced += len(self._pending)
+                    self._pending.clear()
+                else:
+                    self.dropped += 1
+                    return
+            self._pending.append(args)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._executor.submit(self)
+
+    def run_pending(self):
+        """Run one pending call, called from the executor threads"""
+        with self._lock:
+            args = self._pending.popleft()
+        cb = self._resolve()
+        if cb is not None:
+            try:
+                self._run(cb, args)
+            except Exception:  # pylint: disable=W0703
+                logger.exception('Exception in dispatched callback %s', cb)
+        with self._lock:
+            if not self._pending:
+                self._scheduled = False
+                return
+        # Let other callbacks run before the next call
+        self._executor.submit(self)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return CallbackStats(
+            self.calls, self.dropped, self.coalesced, pending,
+            self.time_total / self.calls if self.calls else 0.0,
+            self.time_max)
+
+
+class CallbackExecutor():
+    """
+    A pool of worker threads that runs dispatched callbacks. The threads are
+    started on first use.
+    """
+
+    def __init__(self, workers=2, name='CallbackExecutor'):
+        self._name = name
+        self._nbr_of_workers = workers
+        self._queue = queue.Queue()
+        self._threads = []
+        # Number of submitted callbacks that have not been run yet
+        self._outstanding = 0
+        self._condition = threading.Condition()
+
+    def submit(self, dispatched):
+        with self._condition:
+            if not self._threads:
+                self._start()
+            self._outstanding += 1
+        self._queue.put(dispatched)
+
+    def _start(self):
+        for i in range(self._nbr_of_workers):
+            thread = threading.Thread(target=self._run,
+                                      name='{}-{}'.format(self._name, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def shutdown(self, timeout=None):
+        """Stop the worker threads when all queued calls have been run"""
+        with self._condition:
+            # A dispatched callback can't wait for itself to finish
+            if threading.current_thread() not in self._threads:
+                self._condition.wait_for(lambda: self._outstanding == 0,
+                                         timeout)
+            threads = self._threads
+            self._threads = []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _run(self):
+        while True:
+            dispatched = self._queue.get()
+            if dispatched is None:
+                return
+            dispatched.run_pending()
+            with self._condition:
+                self._outstanding -= 1
+                if self._outstanding == 0:
+                    self._condition.notify_all()
+
+
+_shared_executor = CallbackExecutor(name='SharedCallbackExecutor')
+
+
+def shared_executor():
+    """ Return the callback executor shared by everything in the process """
+    return _shared_executor
 
 
 class Caller():
-    """ An object were callbacks can be registered and called """
+    """
+    An object were callbacks can be registered and called. The callbacks
+    must be hashable.
+    """
 
     def __init__(self):
         """ Create the object """
-        self.callbacks = []
+        self.callbacks = ()
+        # The registered entries keyed on themselves, wrapped callbacks are
+        # looked up with the callable they wrap
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _find(self, cb):
+        return self._entries.get(cb)
+
+    def add_callback(self, cb, weak=False, executor=None,
+                     policy=POLICY_DROP, max_pending=DEFAULT_MAX_PENDING,
+                     timed=False):
+        """
+        Register cb as a new callback. Will not register duplicates.
 
-    def add_callback(self, cb):
-        """ Register cb as a new callback. Will not register duplicates. """
-        if ((cb in self.callbacks) is False):
-            self.callbacks.append(cb)
+        If weak is set only a weak reference to cb is kept. If an executor
+        is given cb is called from the threads of the executor, with at most
+        max_pending queued calls handled according to policy. Dispatched
+        and timed callbacks have stats, see get_stats().
+        """
+        with self._lock:
+            if self._find(cb) is not None:
+                return
+            entry = cb
+            if weak:
+                entry = _WeakCallback(cb, self._remove_dead)
+            elif executor is not None or timed:
+                entry = _Callback(cb)
+            if executor is not None:
+                entry = _DispatchedCallback(entry, executor, policy,
+                                            max_pending)
+            self._entries[entry] = entry
+            self.callbacks = self.callbacks + (entry,)
 
     def remove_callback(self, cb):
         """ Un-register cb from the callbacks """
-        self.callbacks.remove(cb)
+        with self._lock:
+            entry = self._find(cb)
+            if entry is None:
+                raise ValueError('Callback not registered')
+            del self._entries[entry]
+            self.callbacks = tuple(
+                e for e in self.callbacks if e is not entry)
+
+    def _remove_dead(self, ref):
+        with self._lock:
+            dead = [e for e in self.callbacks
+                    if isinstance(e, _Callback) and e._resolve() is None]
+            for entry in dead:
+                del self._entries[entry]
+            self.callbacks = tuple(
+                e for e in self.callbacks if e not in dead)
+
+    def get_stats(self):
+        """
+        Return a dict with the CallbackStats of the dispatched and timed
+        callbacks, keyed on the callback
+        """
+        return {entry._resolve(): entry.stats() for entry in self.callbacks
+                if isinstance(entry, _Callback) and
+                entry._resolve() is not None}
 
     def call(self, *args):
         """ Call the callbacks registered with the arguments args """
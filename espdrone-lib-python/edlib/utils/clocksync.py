@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+"""
+Helpers to relate the clock of an Espdrone to the clock of the host.
+
+The log timestamps sent by the Espdrone are milliseconds in 24 bits, they
+wrap around about every 4.6 hours. TimestampUnwrapper turns them into a
+counter that doesn't wrap.
+
+ClockSync estimates the mapping from drone time to host time using packets
+that carry a drone timestamp and are timestamped by the host when received.
+The host time of a packet is the drone time plus an unknown transport delay
+that is never negative, so for each period the packet with the smallest
+delay is kept and a line is fitted to these points. The error is bounded by
+the smallest delay of the link plus the spread of the points around the
+line. Updating the estimate is a couple of comparisons per packet and the
+fit is only recomputed once per period.
+"""
+import collections
+import time
+
+__author__ = 'Bitcraze AB'
+__all__ = ['TimestampUnwrapper', 'ClockSync']
+
+
+class TimestampUnwrapper():
+    """ Unwraps a counter that wraps around after a number of bits """
+
+    def __init__(self, bits=24):
+        self._range = 1 << bits
+        self._half_range = 1 << (bits - 1)
+        self.reset()
+
+    def reset(self):
+        self._last = None
+        self._offset = 0
+
+    def unwrap(self, raw):
+        """ Return raw with all the wraps seen so far added """
+        last = self._last
+        if last is None:
+            self._last = raw
+            return raw
+        offset = self._offset
+        if raw < last - self._half_range:
+            # Wrapped around
+            offset += self._range
+            self._offset = offset
+            self._last = raw
+        elif raw > last + self._half_range:
+            # Reordered value from before the last wrap
+            return offset - self._range + raw
+        elif raw > last:
+            self._last = raw
+        return offset + raw
+
+
+class ClockSync():
+    """
+    Online estimate of host time (seconds, time.time()) from drone time
+    (milliseconds)
+    """
+
+    # Length in seconds of host time of the periods the fastest packet is
+    # picked from
+    PERIOD = 1.0
+    # Number of periods used for the fit
+    POINTS = 60
+    # Points further than this from the fitted line are rejected, in seconds
+    MAX_DELAY = 0.05
+    # The estimate is restarted after this many rejected points in a row
+    MAX_REJECTED = 3
+    # Max deviation of the drone clock rate from the host clock
+    MAX_SKEW = 0.001
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        self._points = collections.deque(maxlen=self.POINTS)
+        self._period_end = None
+        self._best = None
+        self._origin = None
+        self._offset = None
+        self._skew = 1.0
+        self._rejected = 0
+        self.error = None
+
+    def update(self, drone_ms, host_time=None):
+        """
+        Add a packet with drone timestamp drone_ms received at host_time.
+        Returns host_time.
+        """
+        if host_time is None:
+            host_time = self._clock()
+        drone_time = drone_ms / 1000.0
+        delay = host_time - drone_time
+        best = self._best
+        if best is None or delay < best[1] - best[0]:
+            self._best = best = (drone_time, host_time)
+            if not self._points:
+                # Use the best packet so far until there is a fit
+                self._origin = drone_time
+                self._offset = host_time
+        if self._period_end is None:
+            self._period_end = host_time + self.PERIOD
+        elif host_time >= self._period_end:
+            self._period_end = host_time + self.PERIOD
+            self._best = None
+            self._add_point(best)
+        return host_time
+
+    def _add_point(self, point):
+        if len(self._points) >= 2:
+            residual = point[1] - self._predict(point[0])
+            if abs(residual) > self.MAX_DELAY:
+                # Either the whole period was delayed or the drone clock has
+                # jumped, for instance when it was restarted
+                self._rejected += 1
+                if residual > 0 and self._rejected < self.MAX_REJECTED:
+                    return
+                self.reset()
+        self._rejected = 0
+        self._points.append(point)
+        self._fit()
+
+    def _fit(self):
+        points = self._points
+        n = len(points)
+        x0, y0 = points[0]
+        if n == 1:
+            self._origin, self._offset, self._skew = x0, y0, 1.0
+            self.error = None
+            return
+        xs = [p[0] - x0 for p in points]
+        ys = [p[1] - y0 for p in points]
+        x_mean = sum(xs) / n
+        y_mean = sum(ys) / n
+        sxx = sum((x - x_mean) ** 2 for x in xs)
+        sxy = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys))
+        skew = sxy / sxx if sxx > 0 else 1.0
+        skew = min(max(skew, 1.0 - self.MAX_SKEW), 1.0 + self.MAX_SKEW)
+        self._origin = x0
+        self._offset = y0 + y_mean - skew * x_mean
+        self._skew = skew
+        self.error = max(abs(y - (y_mean + skew * (x - x_mean)))
+                         for x, y in zip(xs, ys))
+
+    def _predict(self, drone_time):
+        return self._offset + (drone_time - self._origin) * self._skew
+
+    def is_synced(self):
+        """ True when the mapping is based on at least two periods """
+        return self.error is not None
+
+    def to_host(self, drone_ms):
+        """ Return the host time of drone time drone_ms, None if unknown """
+        if self._offset is None:
+            return None
+        return self._predict(drone_ms / 1000.0)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+"""
+Scheduler that runs delayed and periodic calls for many users on a single
+thread
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import namedtuple
+
+__author__ = 'Bitcraze AB'
+__all__ = ['Scheduler', 'shared_scheduler', 'TimerStats']
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledCall():
+    """ A call scheduled by the Scheduler, can be cancelled until it's run """
+
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """ Cancel the call, has no effect if it has already been run """
+        self.cancelled = True
+
+
+TimerStats = namedtuple('TimerStats', ['calls', 'missed', 'jitter_avg',
+                                       'jitter_max', 'duration_max'])
+
+
+class PeriodicCall(ScheduledCall):
+    """
+    A call run by the Scheduler every period seconds until it's cancelled.
+
+    The deadlines are absolute, each one is the previous deadline plus the
+    period, so the time spent waking up and running the callback does not
+    add up over time. Deadlines that have already passed when the callback
+    returns are skipped and counted as missed instead of being run late in
+    a burst.
+    """
+
+    __slots__ = ('period', '_calls', '_missed', '_jitter_sum', '_jitter_max',
+                 '_duration_max')
+
+    def __init__(self, deadline, period, callback, args):
+        super(PeriodicCall, self).__init__(deadline, callback, args)
+        self.period = period
+        self._calls = 0
+        self._missed = 0
+        self._jitter_sum = 0.0
+        self._jitter_max = 0.0
+        self._duration_max = 0.0
+
+    def get_stats(self):
+        """
+        Return TimerStats for the call. The jitter is how late the callback
+        was started compared to its deadline, the duration is how long the
+        callback ran. All times are in seconds.
+        """
+        jitter_avg = self._jitter_sum / self._calls if self._calls else 0.0
+        return TimerStats(self._calls, self._missed, jitter_avg,
+                          self._jitter_max, self._duration_max)
+
+    def _done(self, started, finished):
+        """ Account for one run and move the deadline to the next period """
+        jitter = started - self.deadline
+        self._calls += 1
+        self._jitter_sum += jitter
+        self._jitter_max = max(self._jitter_max, jitter)
+        self._duration_max = max(self._duration_max, finished - started)
+
+        self.deadline += self.period
+        if self.deadline <= finished:
+            missed = int((finished - self.deadline) // self.period) + 1
+            self._missed += missed
+            self.deadline += missed * self.period
+
+
+class Scheduler():
+    """
+    Runs delayed calls ordered on their deadline from one thread. This
+    replaces starting one threading.Timer per delayed call, which is costly
+    when many calls are scheduled and most of them are cancelled.
+
+    Periodic calls are run on absolute deadlines, see PeriodicCall.
+
+    The callbacks are run on the scheduler thread and should return quickly.
+    The thread is started when a call is scheduled and exits when nothing
+    has been scheduled for IDLE_TIMEOUT seconds, so a scheduler per object
+    only costs a thread while it is in use.
+    """
+
+    # Time the thread waits for new calls before exiting
+    IDLE_TIMEOUT = 1.0
+
+    def __init__(self, name='Scheduler'):
+        """ Create the scheduler, the thread is started on first use """
+        self._name = name
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition(threading.Lock())
+        self._thread = None
+
+    def call_later(self, delay, callback, *args):
+        """
+        Call callback with args after delay seconds. Returns a ScheduledCall
+        that can be used to cancel the call.
+        """
+        call = ScheduledCall(time.monotonic() + delay, callback, args)
+        self._push(call)
+        return call
+
+    def call_periodic(self, period, callback, *args):
+        """
+        Call callback with args every period seconds, the first call is made
+        one period from now. Returns a PeriodicCall that can be used to
+        cancel the calls and to get their timing statistics.
+        """
+        if period <= 0:
+            raise ValueError('Period must be positive, got {}'.format(period))
+        call = PeriodicCall(time.monotonic() + period, period, callback, args)
+        self._push(call)
+        return call
+
+    def _push(self, call):
+        with self._condition:
+            heapq.heappush(self._queue,
+                           (call.deadline, next(self._counter), call))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name=self._name)
+                self._thread.daemon = True
+                self._thread.start()
+            # Only wake up the thread if it has to wait for a shorter time
+            if self._queue[0][2] is call:
+                self._condition.notify()
+
+    def pending(self):
+        """ Return the number of calls that are scheduled and not cancelled """
+        with self._condition:
+            return sum(1 for entry in self._queue if not entry[2].cancelled)
+
+    def _next_call(self):
+        """
+        Wait for the next call that is due and remove it from the queue.
+        Returns None when the thread has been idle for IDLE_TIMEOUT.
+        """
+        with self._condition:
+            while True:
+                if not self._queue:
+                    if not self._condition.wait(self.IDLE_TIMEOUT) and \
+                            not self._queue:
+                        # A new thread is started by the next _push()
+                        self._thread = None
+                        return None
+                    continue
+                deadline, _, call = self._queue[0]
+                if call.cancelled:
+                    heapq.heappop(self._queue)
+                    continue
+                delay = deadline - time.monotonic()
+                if delay <= 0:
+                    heapq.heappop(self._queue)
+                    return call
+                self._condition.wait(delay)
+
+    def _run(self):
+        while True:
+            call = self._next_call()
+            if call is None:
+                return
+            started = time.monotonic()
+            try:
+                call.callback(*call.args)
+            except Exception:  # pylint: disable=W0703
+                logger.exception('Exception in scheduled call %s',
+                                 call.callback)
+            if isinstance(call, PeriodicCall):
+                call._done(started, time.monotonic())
+                if not call.cancelled:
+                    self._push(call)
+
+
+_shared_scheduler = Scheduler('SharedScheduler')
+
+
+def shared_scheduler():
+    """ Return the scheduler shared by everything in the process """
+    return _shared_scheduler
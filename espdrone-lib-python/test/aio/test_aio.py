@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import asyncio
+import gc
+import sys
+import threading
+import unittest
+
+from edlib.aio import AsyncEspdrone
+from edlib.aio import AsyncUdpDriver
+from edlib.espdrone import Espdrone
+from edlib.espdrone.log import LogConfig
+from edlib.espdrone.mem import Memory
+from edlib.espdrone.param import Param
+from edlib.utils.callbacks import Caller
+
+if sys.version_info < (3, 3):
+    from mock import ANY, MagicMock
+else:
+    from unittest.mock import ANY, MagicMock
+
+
+def _later(func, *args):
+    """Call func from another thread, like the link threads do"""
+    threading.Timer(0.01, func, args).start()
+
+
+class AsyncEspdroneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.uri = 'udp://192.168.43.42'
+        self.ed_mock = MagicMock(spec=Espdrone)
+        self.ed_mock.connected = Caller()
+        self.ed_mock.connection_failed = Caller()
+        self.ed_mock.incoming = MagicMock()
+
+        self.ed_mock.param = MagicMock(spec=Param)
+        self.ed_mock.param.values = {}
+        self.update_callbacks = {}
+
+        def add_update_callback(group=None, name=None, cb=None):
+            self.update_callbacks['{}.{}'.format(group, name)] = cb
+
+        def remove_update_callback(group, name=None, cb=None):
+            del self.update_callbacks['{}.{}'.format(group, name)]
+
+        self.ed_mock.param.add_update_callback.side_effect = \
+            add_update_callback
+        self.ed_mock.param.remove_update_callback.side_effect = \
+            remove_update_callback
+
+        self.ed_mock.log = MagicMock()
+
+        self.ed_mock.mem = MagicMock(spec=Memory)
+        self.ed_mock.mem.mem_read_cb = Caller()
+        self.ed_mock.mem.mem_write_cb = Caller()
+
+        self.sut = AsyncEspdrone(self.uri, ed=self.ed_mock)
+
+    def _run(self, coro):
+        return asyncio.run(asyncio.wait_for(coro, 5))
+
+    def _connect_on_open(self):
+        self.ed_mock.open_link.side_effect = \
+            lambda uri, link=None: _later(self.ed_mock.connected.call, uri)
+
+    def test_connect_waits_for_connected(self):
+        # Fixture
+        self._connect_on_open()
+
+        # Test
+        self._run(self.sut.connect())
+
+        # Assert
+        self.ed_mock.open_link.assert_called_once_with(self.uri, link=ANY)
+        link = self.ed_mock.open_link.call_args[1]['link']
+        self.assertIsInstance(link, AsyncUdpDriver)
+        self.assertTrue(self.sut.is_link_open())
+        self.assertEqual(0, len(self.ed_mock.connected.callbacks))
+        self.assertEqual(0, len(self.ed_mock.connection_failed.callbacks))
+
+    def test_connect_raises_on_connection_failed(self):
+        # Fixture
+        self.ed_mock.open_link.side_effect = \
+            lambda uri, link=None: _later(
+                self.ed_mock.connection_failed.call, uri, 'No answer')
+
+        # Test
+        # Assert
+        with self.assertRaises(Exception):
+            self._run(self.sut.connect())
+        self.assertFalse(self.sut.is_link_open())
+
+    def test_connect_does_not_leave_unretrieved_exception(self):
+        # Fixture
+        errors = []
+
+        def open_link(uri, link=None):
+            self.ed_mock.connection_failed.call(uri, 'No answer')
+            raise ConnectionError()
+
+        self.ed_mock.open_link.side_effect = open_link
+
+        async def connect():
+            asyncio.get_running_loop().set_exception_handler(
+                lambda loop, context: errors.append(context))
+            with self.assertRaises(ConnectionError):
+                await self.sut.connect()
+
+        # Test
+        self._run(connect())
+        gc.collect()
+
+        # Assert
+        self.assertEqual([], errors)
+
+    def test_context_manager_closes_link(self):
+        # Fixture
+        self._connect_on_open()
+
+        async def use():
+            async with self.sut as aed:
+                self.assertTrue(aed.is_link_open())
+
+        # Test
+        self._run(use())
+
+        # Assert
+        self.ed_mock.close_link.assert_called_once_with()
+        self.assertFalse(self.sut.is_link_open())
+
+    def test_param_get_returns_updated_value(self):
+        # Fixture
+        param = self.ed_mock.param
+        param.get_value.return_value = 7
+
+        def request(name):
+            _later(self.update_callbacks[name], name, '7')
+
+        param.request_param_update.side_effect = request
+
+        # Test
+        actual = self._run(self.sut.param.get('ring.effect'))
+
+        # Assert
+        self.assertEqual(7, actual)
+        param.get_value.assert_called_with('ring.effect')
+        self.assertEqual({}, self.update_callbacks)
+
+    def test_param_set_waits_for_confirmation(self):
+        # Fixture
+        param = self.ed_mock.param
+        param.get_value.return_value = 3
+
+        def set_value(name, value):
+            _later(self.update_callbacks[name], name, str(value))
+
+        param.set_value.side_effect = set_value
+
+        # Test
+        actual = self._run(self.sut.param.set('ring.effect', 3))
+
+        # Assert
+        param.set_value.assert_called_once_with('ring.effect', 3)
+        self.assertEqual(3, actual)
+
+    def test_param_get_raises_on_timeout(self):
+        # Fixture
+
+        # Test
+        # Assert
+        with self.assertRaises(asyncio.TimeoutError):
+            self._run(self.sut.param.get('ring.effect', timeout=0.01))
+        self.assertEqual({}, self.update_callbacks)
+
+    def test_log_stream_yields_data_and_deletes_config(self):
+        # Fixture
+        logconf = MagicMock(spec=LogConfig)
+        logconf.data_received_cb = Caller()
+
+        def start():
+            for i in range(3):
+                _later(logconf.data_received_cb.call, i, {'v': i}, logconf)
+
+        logconf.start.side_effect = start
+
+        async def collect():
+            received = []
+            async for timestamp, data, conf in self.sut.log.stream(logconf):
+                received.append((timestamp, data))
+                if len(received) == 3:
+                    break
+            return received
+
+        # Test
+        actual = self._run(collect())
+
+        # Assert
+        self.assertEqual([0, 1, 2], sorted(t for t, _ in actual))
+        self.ed_mock.log.add_config.assert_called_once_with(logconf)
+        logconf.delete.assert_called_once_with()
+        self.assertEqual(0, len(logconf.data_received_cb.callbacks))
+
+    def test_mem_read_returns_data_for_the_request(self):
+        # Fixture
+        memory = MagicMock()
+        memory.id = 1
+        other = MagicMock()
+        other.id = 2
+
+        def read(mem, addr, length):
+            _later(self.ed_mock.mem.mem_read_cb.call, other, addr,
+                   bytearray(length))
+            _later(self.ed_mock.mem.mem_read_cb.call, mem, addr,
+                   bytearray(range(length)))
+            return True
+
+        self.ed_mock.mem.read.side_effect = read
+
+        # Test
+        actual = self._run(self.sut.mem.read(memory, 0x10, 4))
+
+        # Assert
+        self.assertEqual(b'\x00\x01\x02\x03', actual)
+        self.assertEqual(0, len(self.ed_mock.mem.mem_read_cb.callbacks))
+
+    def test_mem_read_raises_if_a_read_is_ongoing(self):
+        # Fixture
+        memory = MagicMock()
+        memory.id = 1
+        self.ed_mock.mem.read.return_value = False
+
+        # Test
+        # Assert
+        with self.assertRaises(Exception):
+            self._run(self.sut.mem.read(memory, 0, 4))
+
+    def test_mem_write_waits_for_write_done(self):
+        # Fixture
+        memory = MagicMock()
+        memory.id = 1
+
+        def write(mem, addr, data):
+            _later(self.ed_mock.mem.mem_write_cb.call, mem, addr)
+            return True
+
+        self.ed_mock.mem.write.side_effect = write
+
+        # Test
+        self._run(self.sut.mem.write(memory, 0x20, b'abc'))
+
+        # Assert
+        self.ed_mock.mem.write.assert_called_once_with(memory, 0x20, b'abc')
+        self.assertEqual(0, len(self.ed_mock.mem.mem_write_cb.callbacks))
+
+    def test_mem_read_raises_on_timeout(self):
+        # Fixture
+        memory = MagicMock()
+        memory.id = 1
+        self.ed_mock.mem.read.return_value = True
+
+        # Test
+        # Assert
+        with self.assertRaises(asyncio.TimeoutError):
+            self._run(self.sut.mem.read(memory, 0, 4, timeout=0.01))
+        self.assertEqual(0, len(self.ed_mock.mem.mem_read_cb.callbacks))
+
+    def test_mem_write_raises_on_timeout(self):
+        # Fixture
+        memory = MagicMock()
+        memory.id = 1
+
+        # Test
+        # Assert
+        with self.assertRaises(asyncio.TimeoutError):
+            self._run(self.sut.mem.write(memory, 0, b'abc', timeout=0.01))
+        self.assertEqual(0, len(self.ed_mock.mem.mem_write_cb.callbacks))
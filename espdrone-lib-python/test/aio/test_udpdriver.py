@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import asyncio
+import socket
+import threading
+import time
+import unittest
+
+from edlib.aio.udpdriver import AsyncUdpDriver
+from edlib.crtp.crtpstack import CRTPPacket
+from edlib.crtp.udpdriver import _KEEP_ALIVE
+from edlib.espdrone import Espdrone
+
+
+def _datagram(header, data):
+    raw = bytes((header,) + data)
+    return raw + bytes((sum(raw) & 0xFF,))
+
+
+class AsyncUdpDriverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.drone = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.drone.bind(('127.0.0.1', 0))
+        self.drone.settimeout(1)
+        self.received = []
+        self.errors = []
+
+    def tearDown(self):
+        self.drone.close()
+
+    def _run(self, coro):
+        return asyncio.run(asyncio.wait_for(coro, 5))
+
+    def _connect(self, loop, packet_callback=None):
+        if packet_callback is None:
+            packet_callback = self.received.append
+        sut = AsyncUdpDriver(loop, packet_callback,
+                             port=self.drone.getsockname()[1])
+        sut.connect('127.0.0.1', None, self.errors.append)
+        return sut
+
+    async def _recv(self):
+        """Receive a datagram sent to the drone, returns it and the link
+        address"""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.drone.recvfrom, 64)
+
+    async def _wait_for(self, condition):
+        while not condition():
+            await asyncio.sleep(0.005)
+
+    def test_that_packets_sent_before_the_transport_is_ready_are_sent(self):
+        # Fixture
+        async def send():
+            sut = self._connect(asyncio.get_running_loop())
+            sut.send_packet(CRTPPacket(0x20, (1, 2)))
+            first, _ = await self._recv()
+            second, _ = await self._recv()
+            sut.close()
+            return first, second
+
+        # Test
+        first, second = self._run(send())
+
+        # Assert
+        self.assertEqual(_KEEP_ALIVE, first)
+        self.assertEqual(_datagram(0x2C, (1, 2)), second)
+
+    def test_that_received_packets_are_handed_over_on_the_loop(self):
+        # Fixture
+        threads = []
+
+        def packet_received(pk):
+            threads.append(threading.current_thread())
+            self.received.append(pk)
+
+        async def receive():
+            sut = self._connect(asyncio.get_running_loop(), packet_received)
+            _, addr = await self._recv()
+            self.drone.sendto(_datagram(0x21, (1, 2, 3)), addr)
+            self.drone.sendto(bytes((0x21, 1, 2, 0)), addr)
+            self.drone.sendto(_datagram(0x32, (4,)), addr)
+            await self._wait_for(lambda: len(self.received) == 2)
+            sut.close()
+            return sut
+
+        # Test
+        before = time.time()
+        sut = self._run(receive())
+
+        # Assert
+        self.assertEqual([(2, 1, (1, 2, 3)), (3, 2, (4,))],
+                         [(pk.port, pk.channel, pk.datat)
+                          for pk in self.received])
+        self.assertGreaterEqual(self.received[0].rx_time, before)
+        self.assertEqual([threading.current_thread()] * 2, threads)
+        self.assertEqual((3, 0, 1, 0), sut.get_rx_stats())
+
+    def test_that_packets_can_be_sent_from_other_threads(self):
+        # Fixture
+        async def send():
+            sut = self._connect(asyncio.get_running_loop())
+            await self._recv()
+            sender = threading.Thread(
+                target=sut.send_packet, args=(CRTPPacket(0x30, (7,)),))
+            sender.start()
+            actual, _ = await self._recv()
+            sender.join()
+            sut.close()
+            return actual
+
+        # Test
+        actual = self._run(send())
+
+        # Assert
+        self.assertEqual(_datagram(0x3C, (7,)), actual)
+
+    def test_that_espdrone_is_driven_from_the_loop(self):
+        # Fixture
+        async def request():
+            loop = asyncio.get_running_loop()
+            ed = Espdrone(scheduler=loop)
+            ed.open_link('127.0.0.1', link=self._connect(
+                loop, ed.incoming.dispatch))
+            # Packets on the log port are sent until answered
+            ed.send_packet(CRTPPacket(0x50, (1, 2)), expected_reply=(1,),
+                           timeout=0.01)
+            resent = 0
+            while resent < 2:
+                data, addr = await self._recv()
+                if data == _datagram(0x5C, (1, 2)):
+                    resent += 1
+            self.drone.sendto(_datagram(0x5C, (1, 5)), addr)
+            await self._wait_for(
+                lambda: ed.get_request_stats()[5].outstanding == 0)
+            stats = ed.get_request_stats()[5]
+            ed.close_link()
+            return ed, stats
+
+        # Test
+        ed, stats = self._run(request())
+
+        # Assert
+        self.assertFalse(ed.incoming.is_alive())
+        self.assertEqual(0, stats.outstanding)
+        self.assertEqual(1, stats.answered)
+        self.assertGreaterEqual(stats.retries, 1)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+"""
+Benchmark of the packet encoding in UdpDriver.send_packet.
+
+Sends setpoint packets to a local socket and reports packets/second for the
+current implementation and for the previous one that built the datagram
+from a tuple and chr() strings.
+
+Run with: python -m test.crtp.bench_udpdriver
+"""
+import socket
+import struct
+import time
+
+from edlib.crtp.crtpstack import CRTPPacket
+from edlib.crtp.crtpstack import CRTPPort
+from edlib.crtp.udpdriver import UdpDriver
+
+PACKETS = 200000
+
+
+class _Thread:
+    link_keep_alive = 0
+
+
+def legacy_send_packet(driver, pk):
+    """The encoding as it was done before the send buffer was reused"""
+    raw = (pk.header,) + pk.datat
+    cksum = 0
+    for i in raw:
+        cksum += i
+    cksum %= 256
+    raw = raw + (cksum,)
+    data = ''.join(chr(v) for v in raw)
+    if driver.connected:
+        driver.socket.sendto(data.encode('latin'), driver.addr)
+        driver._thread.link_keep_alive = 0
+
+
+def measure(send, driver, pk):
+    start = time.perf_counter()
+    for _ in range(PACKETS):
+        send(driver, pk)
+    return PACKETS / (time.perf_counter() - start)
+
+
+def main():
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+
+    driver = UdpDriver()
+    driver.addr = sink.getsockname()
+    driver.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    driver.socket.connect(driver.addr)
+    driver.connected = True
+    driver._thread = _Thread()
+
+    pk = CRTPPacket()
+    pk.port = CRTPPort.COMMANDER
+    pk.data = struct.pack('<fffH', 1.0, -2.0, 3.0, 40000)
+
+    before = measure(legacy_send_packet, driver, pk)
+    after = measure(UdpDriver.send_packet, driver, pk)
+    print('before: {:10.0f} packets/s'.format(before))
+    print('after:  {:10.0f} packets/s ({:.2f}x)'.format(after,
+                                                        after / before))
+
+    driver.socket.close()
+    sink.close()
+
+
+if __name__ == '__main__':
+    main()
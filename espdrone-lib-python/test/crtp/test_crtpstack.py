@@ -102,3 +102,67 @@ class CRTPPacketTest(unittest.TestCase):
         self.assertEqual(0x2d, actual)
         self.assertEqual(2, sut.port)
         self.assertEqual(1, sut.channel)
+
+    def test_that_port_is_kept_when_channel_is_set(self):
+        # Fixture
+        self.sut.set_header(5, 1)
+
+        # Test
+        self.sut.channel = 2
+
+        # Assert
+        self.assertEqual(5, self.sut.port)
+        self.assertEqual(0x5e, self.sut.get_header())
+
+    def test_that_packet_has_no_instance_dict(self):
+        # Fixture
+
+        # Test
+        # Assert
+        with self.assertRaises(AttributeError):
+            self.sut.not_an_attribute = 1
+
+    def test_that_packet_from_buffer_uses_buffer_without_copy(self):
+        # Fixture
+        data = b'\x01\x02\x03'
+
+        # Test
+        sut = CRTPPacket.from_buffer(0x52, data)
+
+        # Assert
+        self.assertIs(data, sut.data)
+        self.assertEqual(5, sut.port)
+        self.assertEqual(2, sut.channel)
+        self.assertEqual((1, 2, 3), sut.datat)
+
+    def test_that_receive_time_is_set_for_received_packets_only(self):
+        # Fixture
+
+        # Test
+        received = CRTPPacket.from_buffer(0x52, b'\x01', 12.5)
+
+        # Assert
+        self.assertEqual(12.5, received.rx_time)
+        self.assertIsNone(self.sut.rx_time)
+
+    def test_that_tuple_view_is_cached_for_immutable_data(self):
+        # Fixture
+        sut = CRTPPacket.from_buffer(0x52, b'\x01\x02')
+
+        # Test
+        actual = sut.datat
+
+        # Assert
+        self.assertIs(actual, sut.datat)
+
+    def test_that_tuple_view_follows_changes_of_data(self):
+        # Fixture
+        self.sut.data = (1, 2)
+        self.sut.datat
+
+        # Test
+        self.sut.data.append(3)
+
+        # Assert
+        self.assertEqual((1, 2, 3), self.sut.datat)
+        self.assertEqual([1, 2, 3], self.sut.datal)
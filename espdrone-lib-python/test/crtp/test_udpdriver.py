@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import socket
+import sys
+import time
+import unittest
+
+from edlib.crtp.crtpstack import CRTPPacket
+from edlib.crtp.udpdriver import _PacketQueue
+from edlib.crtp.udpdriver import _UdpDriverThread
+from edlib.crtp.udpdriver import _UdpTransport
+from edlib.crtp.udpdriver import queue
+from edlib.crtp.udpdriver import UDP_PORT
+from edlib.crtp.udpdriver import UdpDriver
+
+if sys.version_info < (3, 3):
+    from mock import MagicMock
+else:
+    from unittest.mock import MagicMock
+
+
+class PacketQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sut = _PacketQueue(2)
+
+    def test_that_oldest_droppable_packet_is_dropped_when_full(self):
+        # Fixture
+        self.sut.put(1, droppable=True)
+        self.sut.put(2, droppable=True)
+
+        # Test
+        self.sut.put(3, droppable=True)
+
+        # Assert
+        self.assertEqual(1, self.sut.dropped)
+        self.assertEqual([2, 3], self._get_all())
+
+    def test_that_reliable_packets_are_never_dropped(self):
+        # Fixture
+
+        # Test
+        for i in range(5):
+            self.sut.put(i)
+
+        # Assert
+        self.assertEqual(0, self.sut.dropped)
+        self.assertEqual([0, 1, 2, 3, 4], self._get_all())
+
+    def test_that_reliable_packets_are_handed_out_first(self):
+        # Fixture
+        self.sut.put(1, droppable=True)
+        self.sut.put(2)
+
+        # Test
+        actual = self._get_all()
+
+        # Assert
+        self.assertEqual([2, 1], actual)
+
+    def test_that_get_from_empty_queue_raises_empty(self):
+        # Fixture
+
+        # Test
+        # Assert
+        with self.assertRaises(queue.Empty):
+            self.sut.get(True, 0.01)
+
+    def _get_all(self):
+        result = []
+        while self.sut.qsize() > 0:
+            result.append(self.sut.get(False))
+        return result
+
+
+class UdpDriverThreadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.drone = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.drone.bind(('127.0.0.1', 0))
+        self.link = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.link.bind(('127.0.0.1', 0))
+        self.link.connect(self.drone.getsockname())
+        self.in_queue = _PacketQueue(10)
+
+        self.sut = _UdpDriverThread(self.link, self.drone.getsockname(),
+                                    self.in_queue, None, None,
+                                    frozenset((0x52,)))
+        self.sut.start()
+
+    def tearDown(self):
+        self.sut.stop()
+        self.drone.close()
+
+    def test_that_received_packets_are_queued(self):
+        # Fixture
+        self._send(0x21, (1, 2, 3))
+        self._send(0x32, (4,))
+
+        # Test
+        first = self.in_queue.get(True, 1)
+        second = self.in_queue.get(True, 1)
+
+        # Assert
+        self.assertEqual((2, 1, (1, 2, 3)),
+                         (first.port, first.channel, first.datat))
+        self.assertEqual((3, 2, (4,)),
+                         (second.port, second.channel, second.datat))
+
+    def test_that_receive_time_is_recorded(self):
+        # Fixture
+        before = time.time()
+        self._send(0x21, (1,))
+
+        # Test
+        actual = self.in_queue.get(True, 1)
+
+        # Assert
+        self.assertGreaterEqual(actual.rx_time, before)
+        self.assertLessEqual(actual.rx_time, time.time())
+
+    def test_that_packets_with_bad_checksum_are_discarded(self):
+        # Fixture
+        self.drone.sendto(bytes((0x21, 1, 2, 0)), self.link.getsockname())
+        self._send(0x21, (5,))
+
+        # Test
+        actual = self.in_queue.get(True, 1)
+
+        # Assert
+        self.assertEqual((5,), actual.datat)
+        self.assertEqual(1, self.sut.bad_checksum)
+        self.assertEqual(2, self.sut.received)
+
+    def test_that_log_data_is_dropped_when_queue_is_full(self):
+        # Fixture
+        for i in range(15):
+            self._send(0x52, (i,))
+        self._send(0x21, (99,))
+        self._wait_for_received(16)
+
+        # Test
+        actual = []
+        while self.in_queue.qsize() > 0:
+            actual.append(self.in_queue.get(False).datat[0])
+
+        # Assert
+        self.assertEqual([99] + list(range(5, 15)), actual)
+        self.assertEqual(5, self.in_queue.dropped)
+
+    def _send(self, header, data):
+        raw = bytes((header,) + data)
+        raw += bytes((sum(raw) & 0xFF,))
+        self.drone.sendto(raw, self.link.getsockname())
+
+    def _wait_for_received(self, count):
+        deadline = time.time() + 1
+        while self.sut.received < count and time.time() < deadline:
+            time.sleep(0.01)
+
+
+class UdpDriverSendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.drone = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.drone.bind(('127.0.0.1', 0))
+        self.drone.settimeout(1)
+
+        self.sut = UdpDriver()
+        self.sut.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sut.socket.connect(self.drone.getsockname())
+        self.sut.connected = True
+        self.sut._thread = MagicMock()
+
+    def tearDown(self):
+        self.sut.socket.close()
+        self.drone.close()
+
+    def test_that_packet_is_sent_with_checksum(self):
+        # Fixture
+        pk = CRTPPacket(0x21, (1, 2, 0xff))
+
+        # Test
+        self.sut.send_packet(pk)
+
+        # Assert
+        actual = self.drone.recv(100)
+        expected = bytes((0x2d, 1, 2, 0xff, (0x2d + 1 + 2 + 0xff) & 0xff))
+        self.assertEqual(expected, actual)
+
+    def test_that_consecutive_packets_of_different_size_are_sent(self):
+        # Fixture
+        long_pk = CRTPPacket(0x30, tuple(range(30)))
+        short_pk = CRTPPacket(0x30, (7,))
+
+        # Test
+        self.sut.send_packet(long_pk)
+        self.sut.send_packet(short_pk)
+
+        # Assert
+        self.assertEqual(32, len(self.drone.recv(100)))
+        self.assertEqual(bytes((0x3c, 7, 0x43)), self.drone.recv(100))
+
+    def test_that_packet_larger_than_buffer_is_sent(self):
+        # Fixture
+        pk = CRTPPacket(0x30, bytes(UdpDriver.TX_BUFFER_SIZE))
+
+        # Test
+        self.sut.send_packet(pk)
+
+        # Assert
+        actual = self.drone.recv(1000)
+        self.assertEqual(UdpDriver.TX_BUFFER_SIZE + 2, len(actual))
+
+
+class UdpDriverSharedTransportTest(unittest.TestCase):
+    IPS = ('127.0.0.2', '127.0.0.3')
+
+    def setUp(self):
+        self.drones = []
+        for ip in self.IPS:
+            drone = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            drone.bind((ip, UDP_PORT))
+            drone.settimeout(1)
+            self.drones.append(drone)
+
+        self.suts = []
+        for ip in self.IPS:
+            sut = UdpDriver(shared_transport=True)
+            sut.connect(ip, None, MagicMock())
+            self.suts.append(sut)
+
+        # The keep alive sent when connecting tells each drone where to send
+        self.client_addrs = [drone.recvfrom(100)[1] for drone in self.drones]
+
+    def tearDown(self):
+        for sut in self.suts:
+            if sut.connected:
+                sut.close()
+        for drone in self.drones:
+            drone.close()
+
+    def test_that_links_share_one_transport(self):
+        # Fixture
+
+        # Test
+        transports = set(sut._transport for sut in self.suts)
+
+        # Assert
+        self.assertEqual(1, len(transports))
+        self.assertEqual(1, len(set(self.client_addrs)))
+
+    def test_that_packets_are_delivered_to_the_link_of_the_sender(self):
+        # Fixture
+        self._send(1, 0x21, (2,))
+        self._send(0, 0x21, (1,))
+
+        # Test
+        first = self.suts[0].receive_packet(1)
+        second = self.suts[1].receive_packet(1)
+
+        # Assert
+        self.assertEqual((1,), first.datat)
+        self.assertEqual((2,), second.datat)
+        self.assertIsNone(self.suts[0].receive_packet(0))
+
+    def test_that_receive_time_is_recorded_by_transport(self):
+        # Fixture
+        before = time.time()
+        self._send(0, 0x21, (1,))
+
+        # Test
+        actual = self.suts[0].receive_packet(1)
+
+        # Assert
+        self.assertGreaterEqual(actual.rx_time, before)
+        self.assertLessEqual(actual.rx_time, time.time())
+
+    def test_that_packets_are_sent_to_the_link_address(self):
+        # Fixture
+        pk = CRTPPacket(0x21, (7,))
+
+        # Test
+        self.suts[1].send_packet(pk)
+
+        # Assert
+        actual = self.drones[1].recv(100)
+        self.assertEqual(bytes((0x2d, 7, 0x34)), actual)
+
+    def test_that_transport_is_stopped_when_last_link_is_closed(self):
+        # Fixture
+        transport = self.suts[0]._transport
+
+        # Test
+        self.suts[0].close()
+        alive_with_one_link = transport.is_alive()
+        self.suts[1].close()
+        transport.join(1)
+
+        # Assert
+        self.assertTrue(alive_with_one_link)
+        self.assertFalse(transport.is_alive())
+        self.assertIsNone(_UdpTransport._instance)
+
+    def _send(self, drone, header, data):
+        raw = bytes((header,) + data)
+        raw += bytes((sum(raw) & 0xFF,))
+        self.drones[drone].sendto(raw, self.client_addrs[drone])
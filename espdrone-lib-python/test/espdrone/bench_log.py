@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+"""
+Micro-benchmark of the log data decoding.
+
+Compares the per-packet cost of LogConfig.unpack_log_data with the previous
+implementation that resolved and unpacked every variable separately.
+
+Run with: python -m test.espdrone.bench_log
+"""
+import struct
+import timeit
+
+from edlib.espdrone.log import LogConfig
+from edlib.espdrone.log import LogTocElement
+
+PACKETS = 100000
+
+VARIABLES = [('stabilizer.roll', 'float'), ('stabilizer.pitch', 'float'),
+             ('stabilizer.yaw', 'float'), ('stabilizer.thrust', 'uint16_t'),
+             ('acc.x', 'float'), ('acc.y', 'float'), ('acc.z', 'float'),
+             ('pm.vbat', 'FP16'), ('pm.state', 'int8_t')]
+
+
+def legacy_unpack_log_data(config, log_data, timestamp):
+    """The decoding as it was done before the decoder was precompiled"""
+    ret_data = {}
+    data_index = 0
+    for var in config.variables:
+        size = LogTocElement.get_size_from_id(var.fetch_as)
+        name = var.name
+        unpackstring = LogTocElement.get_unpack_string_from_id(
+            var.fetch_as)
+        value = struct.unpack(
+            unpackstring, log_data[data_index:data_index + size])[0]
+        data_index += size
+        ret_data[name] = value
+    config.data_received_cb.call(timestamp, ret_data, config)
+
+
+def create_config(data_format):
+    config = LogConfig('bench', 10, data_format=data_format)
+    for name, fetch_as in VARIABLES:
+        config.add_variable(name, fetch_as)
+    config.data_received_cb.add_callback(lambda ts, data, logblock: None)
+    config.compile()
+    return config
+
+
+def main():
+    # Packet data as received: block id, 3 byte timestamp and the payload
+    config = create_config(LogConfig.FORMAT_DICT)
+    packet = bytearray(4 + config._struct.size)
+
+    def legacy():
+        legacy_unpack_log_data(config, packet[4:], 0)
+
+    results = [('legacy', timeit.timeit(legacy, number=PACKETS))]
+    for data_format in (LogConfig.FORMAT_DICT, LogConfig.FORMAT_TUPLE,
+                        LogConfig.FORMAT_NAMEDTUPLE,
+                        LogConfig.FORMAT_NUMPY):
+        try:
+            config = create_config(data_format)
+        except ValueError as e:
+            print('Skipping {}: {}'.format(data_format, e))
+            continue
+        results.append((data_format, timeit.timeit(
+            lambda: config.unpack_log_data(memoryview(packet), 0, 4),
+            number=PACKETS)))
+
+    reference = results[0][1]
+    for name, elapsed in results:
+        print('{:<12} {:8.3f} us/packet {:6.2f}x'.format(
+            name, elapsed / PACKETS * 1e6, reference / elapsed))
+
+
+if __name__ == '__main__':
+    main()
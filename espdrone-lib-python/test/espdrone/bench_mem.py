@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+"""
+Benchmark of windowed memory reads and writes.
+
+Reads and writes a DebugDriver fake memory over a simulated link with a
+fixed one way latency and reports the throughput for a window of one chunk
+(stop-and-wait, as before) and for larger windows.
+
+Run with: python -m test.espdrone.bench_mem
+"""
+import queue
+import threading
+import time
+
+from edlib.crtp.debugdriver import _PacketHandlingThread
+from edlib.crtp.debugdriver import FakeMemory
+from edlib.espdrone.mem import Memory
+from edlib.espdrone.mem import MemoryElement
+from edlib.utils.callbacks import Caller
+
+LATENCY = 0.005
+MEM_SIZE = 4000
+WINDOWS = (1, 4, 8, 16)
+
+
+class _DelayQueue(queue.Queue):
+    """Queue where items become available LATENCY seconds after put"""
+
+    def put(self, item, block=True, timeout=None):
+        super().put((time.monotonic() + LATENCY, item), block, timeout)
+
+    def get(self, block=True, timeout=None):
+        deadline, item = super().get(block, timeout)
+        time.sleep(max(0, deadline - time.monotonic()))
+        return item
+
+
+class _FakeEspdrone:
+    """Minimal Espdrone connecting Memory to a DebugDriver packet handler"""
+
+    def __init__(self):
+        self.disconnected = Caller()
+        self._callback = None
+        self._uplink = _DelayQueue()
+        self._downlink = _DelayQueue()
+        self._handler = _PacketHandlingThread(
+            self._downlink, [], [], [FakeMemory(type=0, size=MEM_SIZE,
+                                                addr=0)])
+
+    def add_port_callback(self, port, cb):
+        self._callback = cb
+        self._handler.start()
+        for target in (self._deliver_uplink, self._deliver_downlink):
+            threading.Thread(target=target, daemon=True).start()
+
+    def send_packet(self, pk, expected_reply=(), timeout=0.1):
+        self._uplink.put(pk)
+
+    def _deliver_uplink(self):
+        while True:
+            self._handler.handle_packet(self._uplink.get())
+
+    def _deliver_downlink(self):
+        while True:
+            self._callback(self._downlink.get())
+
+
+def measure(memory, mem, window):
+    memory.transfer_window = window
+    done = threading.Event()
+    memory.mem_write_cb.add_callback(lambda m, addr: done.set())
+    memory.mem_read_cb.add_callback(lambda m, addr, data: done.set())
+
+    memory.write(mem, 0, bytes(i & 0xFF for i in range(MEM_SIZE)))
+    done.wait()
+    done.clear()
+    memory.read(mem, 0, MEM_SIZE)
+    done.wait()
+
+    memory.mem_write_cb.callbacks = ()
+    memory.mem_read_cb.callbacks = ()
+    return memory.last_write_stats, memory.last_read_stats
+
+
+def main():
+    memory = Memory(_FakeEspdrone())
+    mem = MemoryElement(0, MemoryElement.TYPE_I2C, MEM_SIZE, memory)
+
+    print('{} bytes, {:.0f} ms one way latency'.format(MEM_SIZE,
+                                                       LATENCY * 1000))
+    for window in WINDOWS:
+        write, read = measure(memory, mem, window)
+        print('window {:2d}: write {:8.0f} B/s, read {:8.0f} B/s, '
+              'read rtt {:.1f} ms'.format(window, write.throughput,
+                                          read.throughput,
+                                          read.rtt_avg * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import struct
+import sys
+import threading
+import time
+import unittest
+
+from edlib.crtp.crtpstack import CRTPPort
+from edlib.espdrone import Espdrone
+from edlib.espdrone.commander import Commander
+from edlib.espdrone.commander import TYPE_HOVER
+from edlib.espdrone.commander import TYPE_POSITION
+from edlib.espdrone.commander import TYPE_STOP
+from edlib.utils.scheduler import Scheduler
+
+if sys.version_info < (3, 3):
+    from mock import MagicMock
+else:
+    from unittest.mock import MagicMock
+
+
+class SetpointStreamerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.packets = []
+        self.sent = threading.Event()
+        self.ed_mock = MagicMock(spec=Espdrone)
+        self.ed_mock.send_packet.side_effect = self._send_packet
+
+        self.commander = Commander(self.ed_mock)
+        self.sut = self.commander.streamer
+        self.sut._scheduler = Scheduler()
+        self.sut.rate = 200
+
+    def tearDown(self):
+        self.sut.stop()
+
+    def test_that_nothing_is_sent_before_a_setpoint_is_set(self):
+        # Fixture
+
+        # Test
+        self.sut.start()
+        time.sleep(0.03)
+
+        # Assert
+        self.assertEqual([], self.packets)
+
+    def test_that_latest_setpoint_is_sent(self):
+        # Fixture
+        self.sut.set_hover_setpoint(1.0, 2.0, 3.0, 4.0)
+        self.sut.set_position_setpoint(1.0, 2.0, 3.0, 4.0)
+        coalesced = self.sut.get_stats().coalesced
+
+        # Test
+        self.sut.start()
+
+        # Assert
+        self.assertTrue(self.sent.wait(1))
+        self.sut.stop()
+        pk = self.packets[0]
+        self.assertEqual(CRTPPort.COMMANDER_GENERIC, pk.port)
+        self.assertEqual((TYPE_POSITION, 1.0, 2.0, 3.0, 4.0),
+                         struct.unpack('<Bffff', pk.data))
+        self.assertEqual(1, coalesced)
+
+    def test_that_setpoint_is_resent_every_period(self):
+        # Fixture
+        self.sut.set_hover_setpoint(0.0, 0.0, 0.0, 0.5)
+
+        # Test
+        self.sut.start()
+        time.sleep(0.1)
+        stats = self.sut.get_stats()
+        self.sut.stop()
+
+        # Assert
+        self.assertGreaterEqual(len(self.packets), 10)
+        self.assertTrue(all(struct.unpack('<Bffff', pk.data) ==
+                            (TYPE_HOVER, 0.0, 0.0, 0.0, 0.5)
+                            for pk in self.packets))
+        self.assertGreater(stats.rate, 100)
+        self.assertGreater(stats.staleness_max, 0.0)
+
+    def test_that_sent_packets_are_not_changed_by_new_setpoints(self):
+        # Fixture
+        self.sut.set_hover_setpoint(0.0, 0.0, 0.0, 0.5)
+        self.sut.start()
+        self.assertTrue(self.sent.wait(1))
+
+        # Test
+        self.sut.set_hover_setpoint(1.0, 1.0, 1.0, 1.0)
+
+        # Assert
+        self.assertEqual((TYPE_HOVER, 0.0, 0.0, 0.0, 0.5),
+                         struct.unpack('<Bffff', self.packets[0].data))
+
+    def test_that_rpyt_setpoint_is_converted_as_by_commander(self):
+        # Fixture
+        self.commander.set_client_xmode(True)
+
+        # Test
+        self.sut.set_setpoint(1.0, 1.0, 2.0, 100)
+        self.sut.start()
+
+        # Assert
+        self.assertTrue(self.sent.wait(1))
+        pk = self.packets[0]
+        self.assertEqual(CRTPPort.COMMANDER, pk.port)
+        roll, pitch, yaw, thrust = struct.unpack('<fffH', pk.data)
+        self.assertAlmostEqual(0.0, roll)
+        self.assertAlmostEqual(-1.414, pitch)
+        self.assertEqual((2.0, 100), (yaw, thrust))
+
+    def test_that_invalid_thrust_raises(self):
+        # Fixture
+
+        # Test
+        # Assert
+        with self.assertRaises(ValueError):
+            self.sut.set_setpoint(0, 0, 0, 0x10000)
+
+    def test_that_before_send_callbacks_can_update_setpoint(self):
+        # Fixture
+        self.sut.before_send.add_callback(
+            lambda: self.sut.set_hover_setpoint(0.0, 0.0, 0.0, 0.7))
+
+        # Test
+        self.sut.start()
+
+        # Assert
+        self.assertTrue(self.sent.wait(1))
+        self.assertAlmostEqual(0.7, struct.unpack('<Bffff',
+                                                  self.packets[0].data)[4],
+                               places=5)
+
+    def test_that_stop_setpoint_is_sent_when_setpoint_expires(self):
+        # Fixture
+        self.sut.max_staleness = 0.02
+        self.sut.set_hover_setpoint(0.0, 0.0, 0.0, 0.5)
+
+        # Test
+        self.sut.start()
+        time.sleep(0.06)
+        count = len(self.packets)
+        time.sleep(0.03)
+
+        # Assert
+        self.assertEqual(count, len(self.packets))
+        pk = self.packets[-1]
+        self.assertEqual(CRTPPort.COMMANDER_GENERIC, pk.port)
+        self.assertEqual((TYPE_STOP,), struct.unpack('<B', pk.data))
+        self.assertEqual(1, self.sut.get_stats().expired)
+
+    def test_that_streaming_resumes_after_expiry_on_new_setpoint(self):
+        # Fixture
+        self.sut.max_staleness = 0.02
+        self.sut.set_hover_setpoint(0.0, 0.0, 0.0, 0.5)
+        self.sut.start()
+        time.sleep(0.06)
+
+        # Test
+        self.sut.set_hover_setpoint(0.0, 0.0, 0.0, 0.75)
+        time.sleep(0.015)
+
+        # Assert
+        self.assertEqual((TYPE_HOVER, 0.0, 0.0, 0.0, 0.75),
+                         struct.unpack('<Bffff', self.packets[-1].data))
+
+    def test_that_nothing_is_sent_after_stop(self):
+        # Fixture
+        self.sut.set_hover_setpoint(0.0, 0.0, 0.0, 0.5)
+        self.sut.start()
+        self.assertTrue(self.sent.wait(1))
+
+        # Test
+        self.sut.stop()
+        count = len(self.packets)
+        time.sleep(0.03)
+
+        # Assert
+        self.assertEqual(count, len(self.packets))
+        self.assertFalse(self.sut.is_running())
+
+    def test_that_a_blocked_streamer_does_not_delay_other_streamers(self):
+        # Fixture
+        unblock = threading.Event()
+        blocked_ed = MagicMock(spec=Espdrone)
+        blocked_ed.send_packet.side_effect = lambda pk: unblock.wait(1)
+        blocked = Commander(blocked_ed).streamer
+        blocked.set_hover_setpoint(0.0, 0.0, 0.0, 0.5)
+        blocked.start()
+        other = Commander(self.ed_mock).streamer
+        other.set_hover_setpoint(0.0, 0.0, 0.0, 0.5)
+
+        # Test
+        other.start()
+
+        # Assert
+        try:
+            self.assertTrue(self.sent.wait(0.5))
+        finally:
+            other.stop()
+            unblock.set()
+            blocked.stop()
+
+    def _send_packet(self, pk):
+        self.packets.append(pk)
+        self.sent.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
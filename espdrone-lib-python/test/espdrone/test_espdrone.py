@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import sys
+import threading
+import time
+import unittest
+
+from edlib.crtp.crtpstack import CRTPPacket
+from edlib.espdrone import _IncomingPacketHandler
+from edlib.espdrone import _PendingRequest
+from edlib.espdrone import _PendingRequests
+from edlib.espdrone import Espdrone
+from edlib.utils.callbacks import Caller
+
+if sys.version_info < (3, 3):
+    from mock import MagicMock
+    from mock import patch
+else:
+    from unittest.mock import MagicMock
+    from unittest.mock import patch
+
+
+class IncomingPacketHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ed_mock = MagicMock()
+        self.ed_mock.packet_received = Caller()
+
+        self.sut = _IncomingPacketHandler(self.ed_mock)
+
+    def test_that_port_callback_is_called_for_all_channels(self):
+        # Fixture
+        cb = MagicMock()
+        self.sut.add_port_callback(5, cb)
+
+        # Test
+        for channel in range(4):
+            self.sut.dispatch(CRTPPacket(0x50 | channel))
+
+        # Assert
+        self.assertEqual(4, cb.call_count)
+
+    def test_that_port_callback_is_not_called_for_other_ports(self):
+        # Fixture
+        cb = MagicMock()
+        self.sut.add_port_callback(5, cb)
+
+        # Test
+        self.sut.dispatch(CRTPPacket(0x20))
+
+        # Assert
+        cb.assert_not_called()
+
+    def test_that_header_callback_is_called_for_channel_only(self):
+        # Fixture
+        cb = MagicMock()
+        self.sut.add_header_callback(cb, 2, 1)
+
+        # Test
+        self.sut.dispatch(CRTPPacket(0x21))
+        self.sut.dispatch(CRTPPacket(0x22))
+
+        # Assert
+        cb.assert_called_once()
+
+    def test_that_masked_callback_is_called_for_all_ports(self):
+        # Fixture
+        cb = MagicMock()
+        self.sut.add_header_callback(cb, 0, 0, 0, 0)
+
+        # Test
+        self.sut.dispatch(CRTPPacket(0x21))
+        self.sut.dispatch(CRTPPacket(0xF3))
+
+        # Assert
+        self.assertEqual(2, cb.call_count)
+
+    def test_that_removed_port_callback_is_not_called(self):
+        # Fixture
+        cb = MagicMock()
+        self.sut.add_port_callback(5, cb)
+
+        # Test
+        self.sut.remove_port_callback(5, cb)
+        self.sut.dispatch(CRTPPacket(0x52))
+
+        # Assert
+        cb.assert_not_called()
+
+    def test_that_callbacks_are_called_in_registration_order(self):
+        # Fixture
+        calls = []
+        self.sut.add_port_callback(5, lambda pk: calls.append(1))
+        self.sut.add_header_callback(lambda pk: calls.append(2), 0, 0, 0, 0)
+        self.sut.add_port_callback(5, lambda pk: calls.append(3))
+
+        # Test
+        self.sut.dispatch(CRTPPacket(0x52))
+
+        # Assert
+        self.assertEqual([1, 2, 3], calls)
+
+    def test_that_exception_in_callback_does_not_stop_dispatch(self):
+        # Fixture
+        cb = MagicMock()
+        self.sut.add_port_callback(5, MagicMock(side_effect=Exception()))
+        self.sut.add_port_callback(5, cb)
+
+        # Test
+        self.sut.dispatch(CRTPPacket(0x50))
+
+        # Assert
+        cb.assert_called_once()
+
+
+class PendingRequestsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sut = _PendingRequests()
+
+    def test_that_longest_matching_pattern_is_popped(self):
+        # Fixture
+        short = self._add((0x2c, 1))
+        long = self._add((0x2c, 1, 2))
+
+        # Test
+        actual = self.sut.pop_longest_match(0x2c, (1, 2, 3))
+
+        # Assert
+        self.assertIs(long, actual)
+        self.assertIs(short, self.sut.get((0x2c, 1)))
+        self.assertEqual(1, len(self.sut))
+
+    def test_that_pattern_for_other_header_does_not_match(self):
+        # Fixture
+        self._add((0x2c, 1))
+
+        # Test
+        actual = self.sut.pop_longest_match(0x3c, (1,))
+
+        # Assert
+        self.assertIsNone(actual)
+
+    def test_that_pattern_longer_than_data_does_not_match(self):
+        # Fixture
+        self._add((0x2c, 1, 2))
+
+        # Test
+        actual = self.sut.pop_longest_match(0x2c, (1,))
+
+        # Assert
+        self.assertIsNone(actual)
+
+    def test_that_added_pattern_replaces_pending_pattern(self):
+        # Fixture
+        first = self._add((0x2c, 1))
+
+        # Test
+        actual = self.sut.add(_PendingRequest(None, (0x2c, 1), 0.1))
+
+        # Assert
+        self.assertIs(first, actual)
+        self.assertEqual(1, len(self.sut))
+
+    def test_that_pending_requests_are_counted_per_port(self):
+        # Fixture
+        self._add((0x2c, 1))
+        self._add((0x2d, 1))
+        self._add((0x5c, 1))
+
+        # Test
+        actual = self.sut.count_per_port()
+
+        # Assert
+        self.assertEqual({2: 2, 5: 1}, actual)
+
+    def _add(self, pattern):
+        request = _PendingRequest(None, pattern, 0.1)
+        self.sut.add(request)
+        return request
+
+
+class EspdroneSendPacketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.link_mock = MagicMock()
+        self.link_mock.needs_resending = True
+
+        # Avoid starting the thread reading from the link
+        with patch('edlib.espdrone._IncomingPacketHandler'):
+            self.sut = Espdrone(link=self.link_mock)
+
+    def test_that_packet_is_resent_until_answered(self):
+        # Fixture
+        pk = CRTPPacket(0x20, (1, 2))
+
+        # Test
+        self.sut.send_packet(pk, expected_reply=(1,), timeout=0.01)
+        time.sleep(0.1)
+        self.sut._check_for_answers(CRTPPacket(0x20, (1, 5)))
+        sent = self.link_mock.send_packet.call_count
+        time.sleep(0.05)
+
+        # Assert
+        self.assertGreater(sent, 1)
+        self.assertEqual(sent, self.link_mock.send_packet.call_count)
+
+    def test_that_a_blocked_link_does_not_delay_resends_of_others(self):
+        # Fixture
+        unblock = threading.Event()
+        blocked_link = MagicMock()
+        blocked_link.needs_resending = True
+        # Only the resends, made from the scheduler thread, block
+        blocked_link.send_packet.side_effect = lambda pk: \
+            threading.current_thread() is not threading.main_thread() and \
+            unblock.wait(1)
+        with patch('edlib.espdrone._IncomingPacketHandler'):
+            blocked = Espdrone(link=blocked_link)
+        blocked.send_packet(CRTPPacket(0x20, (1, 2)), expected_reply=(1,),
+                            timeout=0.01)
+        time.sleep(0.02)
+
+        # Test
+        self.sut.send_packet(CRTPPacket(0x20, (1, 2)), expected_reply=(1,),
+                             timeout=0.01)
+        time.sleep(0.1)
+
+        # Assert
+        try:
+            self.assertGreater(self.link_mock.send_packet.call_count, 1)
+        finally:
+            unblock.set()
+            blocked.close_link()
+            self.sut.close_link()
+
+    def test_that_request_stats_are_reported_per_port(self):
+        # Fixture
+        pk = CRTPPacket(0x20, (1, 2))
+        self.sut.send_packet(pk, expected_reply=(1,), timeout=10)
+        self.sut.send_packet(pk, expected_reply=(2,), timeout=10)
+
+        # Test
+        self.sut._check_for_answers(CRTPPacket(0x20, (1, 5)))
+
+        # Assert
+        actual = self.sut.get_request_stats()[2]
+        self.assertEqual(1, actual.outstanding)
+        self.assertEqual(2, actual.sent)
+        self.assertEqual(0, actual.retries)
+        self.assertEqual(1, actual.answered)
+        self.assertIsNotNone(actual.rtt_avg)
+
+    def test_that_pending_requests_are_dropped_when_link_is_closed(self):
+        # Fixture
+        pk = CRTPPacket(0x20, (1, 2))
+        self.sut.send_packet(pk, expected_reply=(1,), timeout=0.01)
+
+        # Test
+        self.sut.close_link()
+        sent = self.link_mock.send_packet.call_count
+        time.sleep(0.05)
+
+        # Assert
+        self.assertEqual(sent, self.link_mock.send_packet.call_count)
+        self.assertEqual(0, len(self.sut._answer_patterns))
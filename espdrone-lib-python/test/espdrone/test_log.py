@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import struct
+import sys
+import time
+import unittest
+
+from edlib.crtp.crtpstack import CRTPPacket
+from edlib.crtp.crtpstack import CRTPPort
+from edlib.espdrone.log import CHAN_LOGDATA
+from edlib.espdrone.log import Log
+from edlib.espdrone.log import LogConfig
+
+if sys.version_info < (3, 3):
+    from mock import MagicMock
+else:
+    from unittest.mock import MagicMock
+
+
+class LogConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+        self.sut = self._create_config(LogConfig.FORMAT_DICT)
+
+    def test_that_data_is_unpacked_to_dict(self):
+        # Fixture
+        data = struct.pack('<fhB', 1.5, -2, 7)
+
+        # Test
+        self.sut.unpack_log_data(data, 123)
+
+        # Assert
+        expected = (123, {'a.f': 1.5, 'a.h': -2, 'b.u': 7}, self.sut)
+        self.assertEqual(expected, self.received[0])
+
+    def test_that_data_is_unpacked_from_offset(self):
+        # Fixture
+        data = memoryview(b'\x01\x02\x03\x04' + struct.pack('<fhB', 1, 2, 3))
+
+        # Test
+        self.sut.unpack_log_data(data, 0, 4)
+
+        # Assert
+        self.assertEqual({'a.f': 1.0, 'a.h': 2, 'b.u': 3}, self.received[0][1])
+
+    def test_that_data_is_unpacked_to_tuple(self):
+        # Fixture
+        sut = self._create_config(LogConfig.FORMAT_TUPLE)
+        data = struct.pack('<fhB', 1.5, -2, 7)
+
+        # Test
+        sut.unpack_log_data(data, 0)
+
+        # Assert
+        self.assertEqual((1.5, -2, 7), self.received[0][1])
+
+    def test_that_data_is_unpacked_to_namedtuple(self):
+        # Fixture
+        sut = self._create_config(LogConfig.FORMAT_NAMEDTUPLE)
+        data = struct.pack('<fhB', 1.5, -2, 7)
+
+        # Test
+        sut.unpack_log_data(data, 0)
+
+        # Assert
+        actual = self.received[0][1]
+        self.assertEqual(1.5, actual.a_f)
+        self.assertEqual(-2, actual.a_h)
+        self.assertEqual(7, actual.b_u)
+
+    def test_that_data_is_unpacked_to_numpy_record(self):
+        # Fixture
+        sut = self._create_config(LogConfig.FORMAT_NUMPY)
+        data = struct.pack('<fhB', 1.5, -2, 7)
+
+        # Test
+        sut.unpack_log_data(data, 0)
+
+        # Assert
+        actual = self.received[0][1]
+        self.assertEqual(1.5, actual['a.f'])
+        self.assertEqual(-2, actual['a.h'])
+        self.assertEqual(7, actual['b.u'])
+
+    def test_that_decoder_is_recompiled_when_variable_is_added(self):
+        # Fixture
+        self.sut.compile()
+        self.sut.add_variable('b.i', 'int32_t')
+        data = struct.pack('<fhBi', 1.5, -2, 7, -100000)
+
+        # Test
+        self.sut.unpack_log_data(data, 0)
+
+        # Assert
+        self.assertEqual(-100000, self.received[0][1]['b.i'])
+
+    def test_that_dtype_has_one_field_per_variable(self):
+        # Fixture
+
+        # Test
+        actual = self.sut.get_dtype()
+
+        # Assert
+        self.assertEqual(('a.f', 'a.h', 'b.u'), actual.names)
+        self.assertEqual('<f4', actual['a.f'].str)
+        self.assertEqual('|u1', actual['b.u'].str)
+
+    def test_that_unknown_data_format_raises_exception(self):
+        # Fixture
+
+        # Test
+        # Assert
+        with self.assertRaises(ValueError):
+            LogConfig('name', 10, data_format='xml')
+
+    def _create_config(self, data_format):
+        config = LogConfig('name', 10, data_format=data_format)
+        config.add_variable('a.f', 'float')
+        config.add_variable('a.h', 'int16_t')
+        config.add_variable('b.u', 'uint8_t')
+        config.data_received_cb.add_callback(self._data_received)
+        return config
+
+    def _data_received(self, ts, data, logblock):
+        self.received.append((ts, data, logblock))
+
+
+class LogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+        self.sut = Log(MagicMock())
+        self.config = LogConfig('name', 10)
+        self.config.add_variable('a.u', 'uint8_t')
+        self.config.sample_received_cb.add_callback(self._sample_received)
+        self.config.id = 1
+        self.sut._blocks_by_id[1] = self.config
+
+    def test_that_timestamp_is_unwrapped(self):
+        # Fixture
+
+        # Test
+        self._log_packet(0xFFFFF0)
+        self._log_packet(0x000010)
+
+        # Assert
+        self.assertEqual([0xFFFFF0, 0x1000010],
+                         [r[0] for r in self.received])
+
+    def test_that_host_timestamp_is_set(self):
+        # Fixture
+
+        # Test
+        self._log_packet(1000)
+
+        # Assert
+        self.assertAlmostEqual(time.time(), self.received[0][1], delta=0.1)
+
+    def test_that_host_timestamp_uses_receive_time_of_packet(self):
+        # Fixture
+        rx_time = time.time() - 5
+
+        # Test
+        self._log_packet(1000, rx_time)
+
+        # Assert
+        self.assertAlmostEqual(rx_time, self.received[0][1], delta=0.001)
+
+    def _log_packet(self, timestamp, rx_time=None):
+        pk = CRTPPacket()
+        pk.set_header(CRTPPort.LOGGING, CHAN_LOGDATA)
+        pk.data = struct.pack('<BI', 1, timestamp)[:4] + b'\x07'
+        pk.rx_time = rx_time
+        self.sut._new_packet_cb(pk)
+
+    def _sample_received(self, ts, host_timestamp, data, logblock):
+        self.received.append((ts, host_timestamp))
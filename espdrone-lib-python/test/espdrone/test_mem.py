@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import struct
+import sys
+import unittest
+
+from edlib.crtp.crtpstack import CRTPPacket
+from edlib.crtp.crtpstack import CRTPPort
+from edlib.espdrone.mem import CHAN_READ
+from edlib.espdrone.mem import CHAN_WRITE
+from edlib.espdrone.mem import Memory
+from edlib.espdrone.mem import MemoryElement
+from edlib.utils.callbacks import Caller
+
+if sys.version_info < (3, 3):
+    from mock import MagicMock
+else:
+    from unittest.mock import MagicMock
+
+
+class MemoryTransferTest(unittest.TestCase):
+    MEM_ID = 3
+
+    def setUp(self):
+        self.ed_mock = MagicMock()
+        self.ed_mock.disconnected = Caller()
+        self.sut = Memory(self.ed_mock)
+        self.sut.transfer_window = 3
+        self.mem = MemoryElement(self.MEM_ID, MemoryElement.TYPE_I2C, 1000,
+                                 self.sut)
+        self.content = bytes(range(200))
+
+    def test_that_read_requests_window_of_chunks(self):
+        # Fixture
+
+        # Test
+        self.sut.read(self.mem, 0x10, 100)
+
+        # Assert
+        self.assertEqual([0x10, 0x10 + 20, 0x10 + 40],
+                         self._sent_addresses())
+
+    def test_that_read_reassembles_out_of_order_chunks(self):
+        # Fixture
+        read_cb = MagicMock()
+        self.sut.mem_read_cb.add_callback(read_cb)
+        self.sut.read(self.mem, 0, 90)
+
+        # Test
+        for addr in [20, 0, 40, 80, 60]:
+            read_cb.assert_not_called()
+            self._read_reply(addr, self.content[addr:min(addr + 20, 90)])
+
+        # Assert
+        read_cb.assert_called_once_with(self.mem, 0, self.content[:90])
+        self.assertEqual(90, self.sut.last_read_stats.bytes)
+        self.assertEqual(5, self.sut.last_read_stats.chunks)
+
+    def test_that_duplicate_read_replies_are_ignored(self):
+        # Fixture
+        read_cb = MagicMock()
+        self.sut.mem_read_cb.add_callback(read_cb)
+        self.sut.read(self.mem, 0, 40)
+        self._read_reply(0, self.content[0:20])
+
+        # Test
+        self._read_reply(0, self.content[0:20])
+        self._read_reply(20, self.content[20:40])
+
+        # Assert
+        read_cb.assert_called_once_with(self.mem, 0, self.content[:40])
+
+    def test_that_failed_read_chunk_is_requested_again(self):
+        # Fixture
+        self.sut.read(self.mem, 0, 100)
+        self.ed_mock.send_packet.reset_mock()
+
+        # Test
+        self._read_reply(20, b'', status=1)
+
+        # Assert
+        self.assertEqual([20], self._sent_addresses())
+        self.assertEqual(1, self.sut._read_requests[self.MEM_ID].stats.retries)
+
+    def test_that_write_sends_window_of_chunks(self):
+        # Fixture
+
+        # Test
+        self.sut.write(self.mem, 0, self.content[:100])
+
+        # Assert
+        self.assertEqual([0, 25, 50], self._sent_addresses())
+        pk = self.ed_mock.send_packet.call_args_list[1][0][0]
+        self.assertEqual(self.content[25:50], bytes(pk.data[5:]))
+
+    def test_that_write_is_done_when_all_chunks_are_acked(self):
+        # Fixture
+        write_cb = MagicMock()
+        self.sut.mem_write_cb.add_callback(write_cb)
+        self.sut.write(self.mem, 0, self.content[:100])
+
+        # Test
+        for addr in [25, 0, 50, 75]:
+            write_cb.assert_not_called()
+            self._write_reply(addr)
+
+        # Assert
+        write_cb.assert_called_once_with(self.mem, 0)
+        self.assertEqual(100, self.sut.last_write_stats.bytes)
+        self.assertEqual([0, 25, 50, 75], self._sent_addresses())
+
+    def _sent_addresses(self):
+        addresses = []
+        for call in self.ed_mock.send_packet.call_args_list:
+            addresses.append(struct.unpack('<I', call[0][0].data[1:5])[0])
+        return addresses
+
+    def _read_reply(self, addr, data, status=0):
+        pk = CRTPPacket()
+        pk.set_header(CRTPPort.MEM, CHAN_READ)
+        pk.data = struct.pack('<BIB', self.MEM_ID, addr, status) + data
+        self.sut._new_packet_cb(pk)
+
+    def _write_reply(self, addr, status=0):
+        pk = CRTPPacket()
+        pk.set_header(CRTPPort.MEM, CHAN_WRITE)
+        pk.data = struct.pack('<BIB', self.MEM_ID, addr, status)
+        self.sut._new_packet_cb(pk)
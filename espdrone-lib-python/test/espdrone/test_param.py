@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import struct
+import sys
+import unittest
+
+from edlib.crtp.crtpstack import CRTPPacket
+from edlib.crtp.crtpstack import CRTPPort
+from edlib.espdrone.param import _ParamUpdater
+from edlib.espdrone.param import Param
+from edlib.espdrone.param import ParamTocElement
+from edlib.espdrone.param import READ_CHANNEL
+from edlib.utils.callbacks import Caller
+
+if sys.version_info < (3, 3):
+    from mock import MagicMock
+else:
+    from unittest.mock import MagicMock
+
+
+def _read_reply(var_id, value):
+    pk = CRTPPacket()
+    pk.set_header(CRTPPort.PARAM, READ_CHANNEL)
+    pk.data = struct.pack('<HBB', var_id, 0, value)
+    return pk
+
+
+class ParamUpdaterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ed_mock = MagicMock()
+        self.ed_mock.platform.get_protocol_version.return_value = 4
+        self.updated_cb = MagicMock()
+        self.sut = _ParamUpdater(self.ed_mock, True, self.updated_cb,
+                                 window=2)
+
+    def test_that_requests_are_sent_without_waiting_for_answers(self):
+        # Fixture
+
+        # Test
+        self._request(0)
+        self._request(1)
+
+        # Assert
+        self.assertEqual(2, self.ed_mock.send_packet.call_count)
+
+    def test_that_request_waits_for_room_in_the_window(self):
+        # Fixture
+        self._request(0)
+        self._request(1)
+        self._request(2)
+        queued = self.ed_mock.send_packet.call_count
+
+        # Test
+        self.sut._new_packet_cb(_read_reply(1, 0))
+
+        # Assert
+        self.assertEqual(2, queued)
+        self.assertEqual(3, self.ed_mock.send_packet.call_count)
+
+    def test_that_request_waits_for_answer_for_the_same_param(self):
+        # Fixture
+        self._request(0)
+        self._request(0)
+        self._request(1)
+        queued = self.ed_mock.send_packet.call_count
+
+        # Test
+        self.sut._new_packet_cb(_read_reply(0, 0))
+
+        # Assert
+        self.assertEqual(2, queued)
+        self.assertEqual(3, self.ed_mock.send_packet.call_count)
+
+    def test_that_answers_are_reported_once(self):
+        # Fixture
+        self._request(0)
+
+        # Test
+        self.sut._new_packet_cb(_read_reply(0, 5))
+        self.sut._new_packet_cb(_read_reply(0, 5))
+
+        # Assert
+        self.assertEqual(1, self.updated_cb.call_count)
+
+    def test_that_close_drops_queued_requests(self):
+        # Fixture
+        self._request(0)
+        self._request(1)
+        self._request(2)
+
+        # Test
+        self.sut.close()
+        self._request(3)
+
+        # Assert
+        sent = [struct.unpack('<H', call[0][0].data[:2])[0]
+                for call in self.ed_mock.send_packet.call_args_list]
+        self.assertEqual([0, 1, 3], sent)
+
+    def _request(self, var_id):
+        pk = CRTPPacket()
+        pk.set_header(CRTPPort.PARAM, READ_CHANNEL)
+        pk.data = struct.pack('<H', var_id)
+        self.sut.request_param_setvalue(pk)
+
+
+class ParamAllUpdatedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ed_mock = MagicMock()
+        self.ed_mock.disconnected = Caller()
+        self.ed_mock.platform.get_protocol_version.return_value = 4
+        self.sut = Param(self.ed_mock)
+        self.sut._useV2 = True
+        for ident, name in enumerate(['a', 'b', 'c']):
+            self.sut.toc.add_element(
+                ParamTocElement(ident, b'\x08group\x00' + name.encode() +
+                                b'\x00'))
+
+    def test_that_all_updated_is_called_when_all_params_are_fetched(self):
+        # Fixture
+        all_updated_cb = MagicMock()
+        self.sut.all_updated.add_callback(all_updated_cb)
+        self.sut.request_update_of_all_params()
+
+        # Test
+        for var_id in [2, 0, 2]:
+            self.sut._param_updated(self._updated(var_id, 7))
+        all_updated_cb.assert_not_called()
+        self.sut._param_updated(self._updated(1, 7))
+
+        # Assert
+        all_updated_cb.assert_called_once_with()
+        self.assertEqual(7, self.sut.values['group']['b'])
+        self.assertIsNotNone(self.sut.all_updated_time)
+
+    def test_that_cached_values_are_used(self):
+        # Fixture
+        all_updated_cb = MagicMock()
+        param_cb = MagicMock()
+        self.sut.all_updated.add_callback(all_updated_cb)
+        self.sut.add_update_callback(group='group', name='b', cb=param_cb)
+        self.sut.toc.crc = 0x1234
+        self.sut.value_cache = MagicMock()
+        self.sut.value_cache.fetch.return_value = {
+            'group': {'a': '1', 'b': '2', 'c': '3'}}
+
+        # Test
+        actual = self.sut.load_cached_values('udp://1')
+
+        # Assert
+        self.assertTrue(actual)
+        self.sut.value_cache.fetch.assert_called_once_with('udp://1', 0x1234)
+        self.assertEqual(3, self.sut.values['group']['c'])
+        param_cb.assert_called_once_with('group.b', '2')
+        all_updated_cb.assert_called_once_with()
+
+    def test_that_incomplete_cached_values_are_not_used(self):
+        # Fixture
+        self.sut.toc.crc = 0x1234
+        self.sut.value_cache = MagicMock()
+        self.sut.value_cache.fetch.return_value = {'group': {'a': '1'}}
+
+        # Test
+        actual = self.sut.load_cached_values('udp://1')
+
+        # Assert
+        self.assertFalse(actual)
+        self.assertFalse(self.sut.is_updated)
+
+    def test_that_values_are_saved_when_all_params_are_fetched(self):
+        # Fixture
+        self.sut.toc.crc = 0x1234
+        self.sut.value_cache = MagicMock()
+        self.sut.value_cache.fetch.return_value = None
+        self.sut.load_cached_values('udp://1')
+
+        # Test
+        for var_id in range(3):
+            self.sut._param_updated(self._updated(var_id, var_id))
+
+        # Assert
+        self.sut.value_cache.insert.assert_called_once_with(
+            'udp://1', 0x1234, {'group': {'a': 0, 'b': 1, 'c': 2}})
+
+    def test_that_update_callbacks_get_the_value_as_string(self):
+        # Fixture
+        param_cb = MagicMock()
+        self.sut.add_update_callback(group='group', name='a', cb=param_cb)
+
+        # Test
+        self.sut._param_updated(self._updated(0, 42))
+
+        # Assert
+        param_cb.assert_called_once_with('group.a', '42')
+        self.assertEqual(42, self.sut.get_value('group.a'))
+
+    def _updated(self, var_id, value):
+        pk = CRTPPacket()
+        pk.set_header(CRTPPort.PARAM, READ_CHANNEL)
+        pk.data = struct.pack('<HB', var_id, value)
+        return pk
+
+
+class ParamSetValueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ed_mock = MagicMock()
+        self.ed_mock.disconnected = Caller()
+        self.sut = Param(self.ed_mock)
+        self.sut._useV2 = True
+        self.sut.param_updater = MagicMock()
+        self.sut.toc.add_element(
+            ParamTocElement(0, b'\x08ring\x00effect\x00'))
+        self.sut.toc.add_element(
+            ParamTocElement(1, b'\x06ring\x00fadeTime\x00'))
+        self.sut.toc.add_element(
+            ParamTocElement(2, b'\x48ring\x00version\x00'))
+
+    def test_that_string_values_are_parsed(self):
+        # Fixture
+
+        # Test
+        self.sut.set_value('ring.effect', '0x0A')
+        self.sut.set_value('ring.fadeTime', '1.5')
+
+        # Assert
+        self.assertEqual([struct.pack('<HB', 0, 10),
+                          struct.pack('<Hf', 1, 1.5)], self._sent_data())
+
+    def test_that_set_values_sends_all_writes(self):
+        # Fixture
+
+        # Test
+        self.sut.set_values({'ring.effect': 7, 'ring.fadeTime': 0.5})
+
+        # Assert
+        self.assertEqual([struct.pack('<HB', 0, 7),
+                          struct.pack('<Hf', 1, 0.5)], self._sent_data())
+
+    def test_that_set_values_sends_nothing_if_a_param_is_read_only(self):
+        # Fixture
+
+        # Test
+        with self.assertRaises(AttributeError):
+            self.sut.set_values({'ring.effect': 7, 'ring.version': 1})
+
+        # Assert
+        self.sut.param_updater.request_param_setvalue.assert_not_called()
+
+    def test_that_unknown_param_raises(self):
+        # Fixture
+
+        # Test
+        # Assert
+        with self.assertRaises(KeyError):
+            self.sut.set_value('ring.unknown', 1)
+
+    def _sent_data(self):
+        return [bytes(call[0][0].data) for call in
+                self.sut.param_updater.request_param_setvalue.call_args_list]
@@ -22,6 +22,7 @@
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #  MA  02110-1301, USA.
 import sys
+import threading
 import unittest
 
 from edlib.espdrone.swarm import Swarm
@@ -44,6 +45,9 @@ class TestSwarm(unittest.TestCase):
 
         self.sut = Swarm(self.uris, factory=self.factory)
 
+    def tearDown(self):
+        self.sut._stop_workers()
+
     def test_that_instances_are_created(self):
         # Fixture
 
@@ -209,6 +213,85 @@ class TestSwarm(unittest.TestCase):
         with self.assertRaises(Exception):
             self.sut.parallel_safe(func_fail, args_dict=args_dict)
 
+    def test_that_submit_returns_future_with_result(self):
+        # Fixture
+        ed1 = self.factory.mocks[self.URI1]
+
+        # Test
+        future = self.sut.submit(self.URI1, lambda sed, a: (sed, a), 'arg')
+
+        # Assert
+        self.assertEqual((ed1, 'arg'), future.result(1))
+
+    def test_that_steps_for_one_espdrone_are_executed_in_order(self):
+        # Fixture
+        executed = []
+
+        # Test
+        for i in range(10):
+            self.sut.submit(self.URI1, lambda sed, i: executed.append(i), i)
+        self.assertTrue(self.sut.barrier(1))
+
+        # Assert
+        self.assertEqual(list(range(10)), executed)
+
+    def test_that_slow_espdrone_does_not_block_the_others(self):
+        # Fixture
+        release = threading.Event()
+        self.sut.submit(self.URI1, lambda sed: release.wait(1))
+
+        # Test
+        future = self.sut.submit(self.URI2, lambda sed: 'done')
+
+        # Assert
+        self.assertEqual('done', future.result(0.5))
+        self.assertFalse(self.sut.barrier(0.05))
+        release.set()
+        self.assertTrue(self.sut.barrier(1))
+
+    def test_parallel_safe_execution_with_timeout(self):
+        # Fixture
+        release = threading.Event()
+
+        # Test
+        # Assert
+        with self.assertRaises(Exception):
+            self.sut.parallel_safe(lambda sed: release.wait(1), timeout=0.05)
+        release.set()
+
+    def test_that_stats_are_collected_per_espdrone(self):
+        # Fixture
+        func_fail = MagicMock()
+        func_fail.side_effect = Exception()
+
+        # Test
+        self.sut.parallel(func_fail)
+        self.sut.parallel(MagicMock())
+
+        # Assert
+        stats = self.sut.get_stats()
+        self.assertEqual(set(self.uris), set(stats.keys()))
+        for uri in self.uris:
+            self.assertEqual(2, stats[uri].steps)
+            self.assertEqual(1, stats[uri].errors)
+            self.assertEqual(0, stats[uri].queued)
+            self.assertIsNotNone(stats[uri].latency_max)
+
+    def test_that_barriers_are_not_counted_as_steps(self):
+        # Fixture
+        for i in range(3):
+            self.sut.submit(self.URI1, MagicMock())
+
+        # Test
+        self.assertTrue(self.sut.barrier(1))
+        self.assertTrue(self.sut.barrier(1))
+
+        # Assert
+        stats = self.sut.get_stats()
+        self.assertEqual(3, stats[self.URI1].steps)
+        self.assertEqual(0, stats[self.URI2].steps)
+        self.assertIsNone(stats[self.URI2].latency_avg)
+
 
 class MockFactory:
 
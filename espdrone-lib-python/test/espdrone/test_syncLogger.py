@@ -27,6 +27,8 @@ import sys
 import unittest
 from test.support.asyncCallbackCaller import AsyncCallbackCaller
 
+import numpy
+
 from edlib.espdrone import Espdrone
 from edlib.espdrone.log import Log
 from edlib.espdrone.log import LogConfig
@@ -231,3 +233,127 @@ class SyncLoggerTest(unittest.TestCase):
         # Assert
         with self.assertRaises(StopIteration):
             self.sut.__next__()
+
+
+class SyncLoggerBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ed_mock = MagicMock(spec=Espdrone)
+        self.ed_mock.disconnected = Caller()
+        self.ed_mock.log = MagicMock(spec=Log)
+
+        self.log_config_mock = MagicMock(spec=LogConfig)
+        self.log_config_mock.data_received_cb = Caller()
+        self.log_config_mock.sample_received_cb = Caller()
+        self.log_config_mock.get_dtype.return_value = numpy.dtype(
+            [('stabilizer.roll', '<f4'), ('pm.state', '<u1')])
+
+    def test_that_samples_are_returned_in_batches(self):
+        # Fixture
+        sut = self._connected_logger(batch_size=3)
+
+        # Test
+        self._log(range(7))
+        first = next(sut)
+        second = next(sut)
+
+        # Assert
+        self.assertEqual([0, 10, 20], list(first.timestamps))
+        self.assertEqual([0.0, 1.0, 2.0],
+                         list(first.data['stabilizer.roll']))
+        self.assertEqual([3, 4, 5], list(second.data['pm.state']))
+        self.assertEqual(0, first.dropped)
+        self.assertEqual(self.log_config_mock, first.logconf)
+
+    def test_that_host_timestamps_are_stored(self):
+        # Fixture
+        sut = self._connected_logger(batch_size=2)
+
+        # Test
+        self._log(range(1))
+        self._log(range(1, 2), 1000.5)
+        actual = next(sut)
+
+        # Assert
+        self.assertTrue(numpy.isnan(actual.host_timestamps[0]))
+        self.assertEqual(1000.5, actual.host_timestamps[1])
+
+    def test_that_samples_are_returned_per_time_window(self):
+        # Fixture
+        sut = self._connected_logger(batch_period_ms=25)
+
+        # Test
+        self._log(range(6))
+        first = next(sut)
+        second = next(sut)
+
+        # Assert
+        self.assertEqual([0, 10, 20], list(first.timestamps))
+        self.assertEqual([30, 40], list(second.timestamps))
+
+    def test_that_tuple_and_record_samples_are_stored(self):
+        # Fixture
+        sut = self._connected_logger(batch_size=2)
+        record = numpy.zeros(1, self.log_config_mock.get_dtype())[0]
+        record['pm.state'] = 7
+
+        # Test
+        self.log_config_mock.sample_received_cb.call(
+            0, None, (1.5, 3), self.log_config_mock)
+        self.log_config_mock.sample_received_cb.call(
+            10, None, record, self.log_config_mock)
+        actual = next(sut)
+
+        # Assert
+        self.assertEqual([3, 7], list(actual.data['pm.state']))
+
+    def test_that_oldest_samples_are_dropped_when_ring_is_full(self):
+        # Fixture
+        sut = self._connected_logger(batch_size=4, max_samples=5)
+
+        # Test
+        self._log(range(8))
+        actual = next(sut)
+
+        # Assert
+        self.assertEqual([30, 40, 50, 60], list(actual.timestamps))
+        self.assertEqual(3, actual.dropped)
+        self.assertEqual(3, sut.dropped)
+
+    def test_that_remaining_samples_are_returned_after_disconnect(self):
+        # Fixture
+        sut = self._connected_logger(batch_size=10)
+        self._log(range(3))
+
+        # Test
+        AsyncCallbackCaller(cb=self.ed_mock.disconnected,
+                            delay=0.1,
+                            args=['Some uri']
+                            ).trigger()
+        actual = next(sut)
+
+        # Assert
+        self.assertEqual([0, 10, 20], list(actual.timestamps))
+        with self.assertRaises(StopIteration):
+            next(sut)
+
+    def test_that_batch_size_larger_than_ring_raises_exception(self):
+        # Fixture
+
+        # Test
+        # Assert
+        with self.assertRaises(ValueError):
+            SyncLogger(self.ed_mock, self.log_config_mock, batch_size=10,
+                       max_samples=5)
+
+    def _connected_logger(self, **kwargs):
+        sut = SyncLogger(self.ed_mock, self.log_config_mock, **kwargs)
+        sut.connect()
+        return sut
+
+    def _log(self, samples, host_timestamp=None):
+        for i in samples:
+            self.log_config_mock.sample_received_cb.call(
+                i * 10, host_timestamp,
+                {'stabilizer.roll': float(i), 'pm.state': i},
+                self.log_config_mock)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import struct
+import sys
+import unittest
+
+from edlib.crtp.crtpstack import CRTPPacket
+from edlib.espdrone.log import LogTocElement
+from edlib.espdrone.toc import CMD_TOC_INFO_V2
+from edlib.espdrone.toc import CMD_TOC_ITEM_V2
+from edlib.espdrone.toc import Toc
+from edlib.espdrone.toc import Toedetcher
+
+if sys.version_info < (3, 3):
+    from mock import MagicMock
+else:
+    from unittest.mock import MagicMock
+
+
+class ToedetcherTest(unittest.TestCase):
+    PORT = 5
+    CRC = 0x12345678
+
+    def setUp(self):
+        self.ed_mock = MagicMock()
+        self.ed_mock.platform.get_protocol_version.return_value = 4
+        self.toc_cache_mock = MagicMock()
+        self.toc_cache_mock.fetch.return_value = None
+        self.finished_cb = MagicMock()
+        self.toc = Toc()
+
+        self.sut = Toedetcher(self.ed_mock, LogTocElement, self.PORT,
+                              self.toc, self.finished_cb,
+                              self.toc_cache_mock, window=4)
+
+    def test_that_window_of_requests_is_sent_after_toc_info(self):
+        # Fixture
+        self.sut.start()
+        self.ed_mock.send_packet.reset_mock()
+
+        # Test
+        self.sut._new_packet_cb(self._info_packet(10))
+
+        # Assert
+        self.assertEqual([0, 1, 2, 3], self._requested_indexes())
+
+    def test_that_window_is_limited_by_number_of_items(self):
+        # Fixture
+        self.sut.start()
+        self.ed_mock.send_packet.reset_mock()
+
+        # Test
+        self.sut._new_packet_cb(self._info_packet(2))
+
+        # Assert
+        self.assertEqual([0, 1], self._requested_indexes())
+
+    def test_that_each_reply_requests_next_index(self):
+        # Fixture
+        self.sut.start()
+        self.sut._new_packet_cb(self._info_packet(10))
+        self.ed_mock.send_packet.reset_mock()
+
+        # Test
+        self.sut._new_packet_cb(self._item_packet(2))
+        self.sut._new_packet_cb(self._item_packet(0))
+
+        # Assert
+        self.assertEqual([4, 5], self._requested_indexes())
+
+    def test_that_duplicate_replies_are_ignored(self):
+        # Fixture
+        self.sut.start()
+        self.sut._new_packet_cb(self._info_packet(10))
+        self.sut._new_packet_cb(self._item_packet(1))
+        self.ed_mock.send_packet.reset_mock()
+
+        # Test
+        self.sut._new_packet_cb(self._item_packet(1))
+
+        # Assert
+        self.assertEqual([], self._requested_indexes())
+
+    def test_that_out_of_order_replies_complete_the_toc(self):
+        # Fixture
+        nbr_of_items = 6
+        self.sut.start()
+        self.sut._new_packet_cb(self._info_packet(nbr_of_items))
+
+        # Test
+        for ident in [3, 1, 0, 2, 5, 4]:
+            self.finished_cb.assert_not_called()
+            self.sut._new_packet_cb(self._item_packet(ident))
+
+        # Assert
+        self.finished_cb.assert_called_once_with()
+        for ident in range(nbr_of_items):
+            self.assertEqual(
+                'var%d' % ident,
+                self.toc.get_element_by_id(ident).name)
+        self.toc_cache_mock.insert.assert_called_once_with(
+            self.CRC, self.toc.toc)
+        self.assertIsNotNone(self.toc.fetch_time)
+
+    def test_that_toc_from_cache_is_used(self):
+        # Fixture
+        self.toc_cache_mock.fetch.return_value = {'group': {}}
+        self.sut.start()
+        self.ed_mock.send_packet.reset_mock()
+
+        # Test
+        self.sut._new_packet_cb(self._info_packet(10))
+
+        # Assert
+        self.assertEqual({'group': {}}, self.toc.toc)
+        self.finished_cb.assert_called_once_with()
+        self.ed_mock.send_packet.assert_not_called()
+
+    def _info_packet(self, nbr_of_items):
+        pk = CRTPPacket()
+        pk.set_header(self.PORT, 0)
+        pk.data = struct.pack('<BHI', CMD_TOC_INFO_V2, nbr_of_items,
+                              self.CRC)
+        return pk
+
+    def _item_packet(self, ident):
+        pk = CRTPPacket()
+        pk.set_header(self.PORT, 0)
+        pk.data = struct.pack('<BHB', CMD_TOC_ITEM_V2, ident, 0x01) + \
+            b'group\x00var%d\x00' % ident
+        return pk
+
+    def _requested_indexes(self):
+        indexes = []
+        for call in self.ed_mock.send_packet.call_args_list:
+            data = call[0][0].data
+            indexes.append(data[1] | (data[2] << 8))
+        return indexes
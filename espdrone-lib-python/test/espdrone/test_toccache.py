@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import os
+import shutil
+import tempfile
+import unittest
+
+from edlib.espdrone import toccache
+from edlib.espdrone.log import LogTocElement
+from edlib.espdrone.param import ParamTocElement
+from edlib.espdrone.toc import Toc
+from edlib.espdrone.toccache import FORMAT_BINARY
+from edlib.espdrone.toccache import FORMAT_JSON
+from edlib.espdrone.toccache import ParamValueCache
+from edlib.espdrone.toccache import TocCache
+
+
+class TocCacheTest(unittest.TestCase):
+    CRC = 0xCAFE0001
+
+    def setUp(self):
+        toccache._shared_lru.clear()
+        self.rw_dir = tempfile.mkdtemp()
+        self.ro_dir = tempfile.mkdtemp()
+
+        toc = Toc()
+        toc.add_element(LogTocElement(0, b'\x07stabilizer\x00roll\x00'))
+        toc.add_element(LogTocElement(1, b'\x02motor\x00m1\x00'))
+        toc.add_element(ParamTocElement(2, b'\x48system\x00id\x00'))
+        self.toc = toc.toc
+
+    def tearDown(self):
+        shutil.rmtree(self.rw_dir)
+        shutil.rmtree(self.ro_dir)
+        toccache._shared_lru.clear()
+
+    def test_that_binary_toc_is_read_back(self):
+        self._assert_round_trip(FORMAT_BINARY)
+
+    def test_that_json_toc_is_read_back(self):
+        self._assert_round_trip(FORMAT_JSON)
+
+    def test_that_fetch_returns_none_for_unknown_crc(self):
+        # Fixture
+        sut = TocCache(rw_cache=self.rw_dir)
+
+        # Test
+        actual = sut.fetch(self.CRC)
+
+        # Assert
+        self.assertIsNone(actual)
+
+    def test_that_decoded_toc_is_shared_between_instances(self):
+        # Fixture
+        self._write_file(self.rw_dir, FORMAT_BINARY)
+        first = TocCache(rw_cache=self.rw_dir)
+        second = TocCache(rw_cache=self.rw_dir)
+        first.fetch(self.CRC)
+        os.remove(os.path.join(self.rw_dir, '%08X.toc' % self.CRC))
+
+        # Test
+        actual = second.fetch(self.CRC)
+
+        # Assert
+        self.assertEqual('roll', actual['stabilizer']['roll'].name)
+
+    def test_that_fetched_toc_is_a_copy(self):
+        # Fixture
+        self._write_file(self.rw_dir, FORMAT_BINARY)
+        sut = TocCache(rw_cache=self.rw_dir)
+
+        # Test
+        sut.fetch(self.CRC)['motor'].clear()
+        actual = sut.fetch(self.CRC)
+
+        # Assert
+        self.assertIn('m1', actual['motor'])
+
+    def test_that_ro_cache_is_used(self):
+        # Fixture
+        self._write_file(self.ro_dir, FORMAT_JSON)
+        toccache._shared_lru.clear()
+
+        # Test
+        actual = TocCache(ro_cache=self.ro_dir).fetch(self.CRC)
+
+        # Assert
+        self.assertEqual('id', actual['system']['id'].name)
+
+    def test_that_no_temporary_files_are_left(self):
+        # Fixture
+        sut = TocCache(rw_cache=self.rw_dir)
+
+        # Test
+        sut.insert(self.CRC, self.toc)
+
+        # Assert
+        self.assertEqual(['%08X.toc' % self.CRC], os.listdir(self.rw_dir))
+
+    def test_that_cache_is_disabled_without_directories(self):
+        # Fixture
+        self._write_file(self.rw_dir, FORMAT_BINARY)
+
+        # Test
+        actual = TocCache().fetch(self.CRC)
+
+        # Assert
+        self.assertIsNone(actual)
+
+    def _write_file(self, directory, file_format):
+        TocCache(rw_cache=directory,
+                 file_format=file_format).insert(self.CRC, self.toc)
+
+    def _assert_round_trip(self, file_format):
+        # Fixture
+        self._write_file(self.rw_dir, file_format)
+        toccache._shared_lru.clear()
+        sut = TocCache(rw_cache=self.rw_dir)
+
+        # Test
+        actual = sut.fetch(self.CRC)
+
+        # Assert
+        self.assertEqual(sorted(self.toc.keys()), sorted(actual.keys()))
+        for group, elements in self.toc.items():
+            for name, expected in elements.items():
+                elem = actual[group][name]
+                self.assertIsInstance(elem, type(expected))
+                self.assertEqual(
+                    (expected.ident, expected.group, expected.name,
+                     expected.ctype, expected.pytype, expected.access),
+                    (elem.ident, elem.group, elem.name,
+                     elem.ctype, elem.pytype, elem.access))
+
+
+class ParamValueCacheTest(unittest.TestCase):
+    URI = 'udp://192.168.43.42'
+    CRC = 0x1234ABCD
+
+    def setUp(self):
+        self.rw_dir = tempfile.mkdtemp()
+        self.sut = ParamValueCache(self.rw_dir)
+        self.values = {'pid': {'kp': '1.5', 'ki': '0.0'}}
+
+    def tearDown(self):
+        shutil.rmtree(self.rw_dir)
+
+    def test_that_values_are_read_back(self):
+        # Fixture
+        self.sut.insert(self.URI, self.CRC, self.values)
+
+        # Test
+        actual = ParamValueCache(self.rw_dir).fetch(self.URI, self.CRC)
+
+        # Assert
+        self.assertEqual(self.values, actual)
+
+    def test_that_values_are_per_uri_and_crc(self):
+        # Fixture
+        self.sut.insert(self.URI, self.CRC, self.values)
+
+        # Test
+        other_uri = self.sut.fetch('udp://192.168.43.43', self.CRC)
+        other_crc = self.sut.fetch(self.URI, self.CRC + 1)
+
+        # Assert
+        self.assertIsNone(other_uri)
+        self.assertIsNone(other_crc)
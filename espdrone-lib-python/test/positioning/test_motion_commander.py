@@ -28,8 +28,10 @@ import unittest
 from edlib.espdrone import Commander
 from edlib.espdrone import Espdrone
 from edlib.espdrone import Param
-from edlib.positioning.motion_commander import _SetPointThread
+from edlib.espdrone.commander import SetpointStreamer
+from edlib.positioning.motion_commander import _SetPointStreamer
 from edlib.positioning.motion_commander import MotionCommander
+from edlib.utils.callbacks import Caller
 
 if sys.version_info < (3, 3):
     from mock import MagicMock, patch, call
@@ -38,8 +40,8 @@ else:
 
 
 @patch('time.sleep')
-@patch('edlib.positioning.motion_commander._SetPointThread',
-       return_value=MagicMock(spec=_SetPointThread))
+@patch('edlib.positioning.motion_commander._SetPointStreamer',
+       return_value=MagicMock(spec=_SetPointStreamer))
 class TestMotionCommander(unittest.TestCase):
     def setUp(self):
         self.commander_mock = MagicMock(spec=Commander)
@@ -450,24 +452,28 @@ class TestMotionCommander(unittest.TestCase):
             raise e
 
 
-class TestSetpointThread(unittest.TestCase):
+class TestSetpointStreamer(unittest.TestCase):
     def setUp(self):
+        self.streamer_mock = MagicMock(spec=SetpointStreamer)
+        self.streamer_mock.before_send = Caller()
         self.commander_mock = MagicMock(spec=Commander)
+        self.commander_mock.streamer = self.streamer_mock
         self.ed_mock = MagicMock(spec=Espdrone)
         self.ed_mock.commander = self.commander_mock
 
-        self.sut = _SetPointThread(self.ed_mock)
+        self.sut = _SetPointStreamer(self.ed_mock)
 
-    def test_that_thread_stops(self):
+    def test_that_streaming_starts_and_stops(self):
         # Fixture
         self.sut.start()
-        self.sut.stop()
 
         # Test
-        actual = self.sut.is_alive()
+        self.sut.stop()
 
         # Assert
-        self.assertFalse(actual)
+        self.streamer_mock.start.assert_called_once_with()
+        self.streamer_mock.stop.assert_called_once_with()
+        self.assertEqual(0, len(self.streamer_mock.before_send.callbacks))
 
     def test_that_x_y_and_yaw_is_set(self):
         # Fixture
@@ -479,13 +485,30 @@ class TestSetpointThread(unittest.TestCase):
 
         # Test
         self.sut.set_vel_setpoint(x, y, 0, yaw)
+        self.streamer_mock.before_send.call()
 
         # Assert
         self.sut.stop()
 
-        self.commander_mock.send_hover_setpoint.assert_called_once_with(
+        self.streamer_mock.set_hover_setpoint.assert_called_once_with(
             x, y, yaw, 0)
 
+    @patch('time.time')
+    def test_that_height_is_updated_before_each_send(self, time_mock):
+        # Fixture
+        time_mock.return_value = 10.0
+        self.sut.start()
+        self.sut.set_vel_setpoint(0, 0, 0.5, 0)
+
+        # Test
+        time_mock.return_value = 12.0
+        self.streamer_mock.before_send.call()
+
+        # Assert
+        self.streamer_mock.set_hover_setpoint.assert_called_once_with(
+            0, 0, 0, 1.0)
+        self.assertEqual(1.0, self.sut.get_height())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -23,9 +23,13 @@
 #  along with this program; if not, write to the Free Software
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #  MA  02110-1301, USA.
+import gc
+import threading
 import unittest
 
+from edlib.utils.callbacks import CallbackExecutor
 from edlib.utils.callbacks import Caller
+from edlib.utils.callbacks import POLICY_COALESCE
 
 
 class CallerTest(unittest.TestCase):
@@ -87,6 +91,187 @@ class CallerTest(unittest.TestCase):
         # Assert
         self.assertEqual('The token', self.callback_token)
 
+    def test_that_removing_unknown_callback_raises(self):
+        # Fixture
+
+        # Test
+        # Assert
+        with self.assertRaises(ValueError):
+            self.sut.remove_callback(self._callback)
+
+    def test_that_callback_can_be_removed_while_called(self):
+        # Fixture
+        def remove_self():
+            self.sut.remove_callback(remove_self)
+
+        self.sut.add_callback(remove_self)
+        self.sut.add_callback(self._callback)
+
+        # Test
+        self.sut.call()
+        self.sut.call()
+
+        # Assert
+        self.assertEqual(2, self.callback_count)
+        self.assertEqual(1, len(self.sut.callbacks))
+
+    def test_that_weak_callback_is_called(self):
+        # Fixture
+        target = _Target()
+        self.sut.add_callback(target.callback, weak=True)
+
+        # Test
+        self.sut.call('The token')
+
+        # Assert
+        self.assertEqual(['The token'], target.received)
+
+    def test_that_weak_callback_is_removed_when_collected(self):
+        # Fixture
+        target = _Target()
+        self.sut.add_callback(target.callback, weak=True)
+
+        # Test
+        del target
+        gc.collect()
+
+        # Assert
+        self.sut.call('The token')
+        self.assertEqual(0, len(self.sut.callbacks))
+
+    def test_that_weak_callback_is_removed(self):
+        # Fixture
+        target = _Target()
+        self.sut.add_callback(target.callback, weak=True)
+
+        # Test
+        self.sut.remove_callback(target.callback)
+
+        # Assert
+        self.assertEqual(0, len(self.sut.callbacks))
+
+    def test_that_wrapped_callback_is_added_only_one_time(self):
+        # Fixture
+        self.sut.add_callback(self._callback, timed=True)
+
+        # Test
+        self.sut.add_callback(self._callback)
+
+        # Assert
+        self.assertEqual(1, len(self.sut.callbacks))
+
+    def test_that_wrapped_callback_compares_equal_to_callable(self):
+        # Fixture
+        self.sut.add_callback(self._callback, timed=True)
+
+        # Test
+        entry = self.sut.callbacks[0]
+
+        # Assert
+        self.assertEqual(entry, self._callback)
+        self.assertEqual(hash(self._callback), hash(entry))
+        self.assertNotEqual(entry, self._callback2)
+
+    def test_that_dispatched_callback_is_removed(self):
+        # Fixture
+        executor = CallbackExecutor(workers=1)
+        self.sut.add_callback(self._callback, executor=executor)
+
+        # Test
+        self.sut.remove_callback(self._callback)
+
+        # Assert
+        self.assertEqual(0, len(self.sut.callbacks))
+        self.assertRaises(ValueError, self.sut.remove_callback,
+                          self._callback)
+
+    def test_that_timed_callback_has_stats(self):
+        # Fixture
+        self.sut.add_callback(self._callback, timed=True)
+
+        # Test
+        self.sut.call()
+        self.sut.call()
+
+        # Assert
+        stats = self.sut.get_stats()[self._callback]
+        self.assertEqual(2, stats.calls)
+        self.assertEqual(2, self.callback_count)
+
+    def test_that_dispatched_callback_is_called_on_executor(self):
+        # Fixture
+        executor = CallbackExecutor(workers=1)
+        threads = []
+        done = threading.Event()
+
+        def callback(token):
+            threads.append(threading.current_thread())
+            done.set()
+
+        self.sut.add_callback(callback, executor=executor)
+
+        # Test
+        self.sut.call('The token')
+
+        # Assert
+        self.assertTrue(done.wait(1))
+        executor.shutdown()
+        self.assertNotEqual(threading.current_thread(), threads[0])
+        self.assertEqual(1, self.sut.get_stats()[callback].calls)
+
+    def test_that_dispatched_calls_are_dropped_when_full(self):
+        # Fixture
+        executor = CallbackExecutor(workers=1)
+        received, block = self._blocked_callback(executor, max_pending=2)
+
+        # Test
+        for i in range(1, 5):
+            self.sut.call(i)
+        block.set()
+        executor.shutdown()
+
+        # Assert
+        self.assertEqual([0, 1, 2], received)
+        stats = self.sut.get_stats()[self._blocked]
+        self.assertEqual(2, stats.dropped)
+
+    def test_that_dispatched_calls_are_coalesced(self):
+        # Fixture
+        executor = CallbackExecutor(workers=1)
+        received, block = self._blocked_callback(
+            executor, max_pending=1, policy=POLICY_COALESCE)
+
+        # Test
+        for i in range(1, 5):
+            self.sut.call(i)
+        block.set()
+        executor.shutdown()
+
+        # Assert
+        self.assertEqual([0, 4], received)
+        stats = self.sut.get_stats()[self._blocked]
+        self.assertEqual(3, stats.coalesced)
+
+    def _blocked_callback(self, executor, **kwargs):
+        """
+        Add a dispatched callback that blocks on the first call until the
+        returned event is set
+        """
+        received = []
+        block = threading.Event()
+        started = threading.Event()
+
+        def blocked(token):
+            started.set()
+            block.wait(1)
+            received.append(token)
+
+        self._blocked = blocked
+        self.sut.add_callback(blocked, executor=executor, **kwargs)
+        self.sut.call(0)
+        started.wait(1)
+        return received, block
+
     def _callback(self):
         self.callback_count += 1
 
@@ -95,3 +280,12 @@ class CallerTest(unittest.TestCase):
 
     def _callback_with_args(self, token):
         self.callback_token = token
+
+
+class _Target():
+
+    def __init__(self):
+        self.received = []
+
+    def callback(self, token):
+        self.received.append(token)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import unittest
+
+from edlib.utils.clocksync import ClockSync
+from edlib.utils.clocksync import TimestampUnwrapper
+
+
+class TimestampUnwrapperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sut = TimestampUnwrapper(24)
+
+    def test_that_values_are_unchanged_before_wrap(self):
+        # Fixture
+
+        # Test
+        actual = [self.sut.unwrap(v) for v in (0, 100, 0x7FFFFF)]
+
+        # Assert
+        self.assertEqual([0, 100, 0x7FFFFF], actual)
+
+    def test_that_wrap_is_added(self):
+        # Fixture
+        self.sut.unwrap(0xFFFFFE)
+
+        # Test
+        actual = [self.sut.unwrap(v) for v in (1, 0x800000, 0xFFFFFF, 2)]
+
+        # Assert
+        self.assertEqual([0x1000001, 0x1800000, 0x1FFFFFF, 0x2000002],
+                         actual)
+
+    def test_that_reordered_value_from_before_wrap_is_not_wrapped(self):
+        # Fixture
+        self.sut.unwrap(0xFFFFFE)
+        self.sut.unwrap(1)
+
+        # Test
+        actual = self.sut.unwrap(0xFFFFFF)
+
+        # Assert
+        self.assertEqual(0xFFFFFF, actual)
+        self.assertEqual(0x1000002, self.sut.unwrap(2))
+
+
+class ClockSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sut = ClockSync()
+
+    def test_that_nothing_is_known_before_first_packet(self):
+        # Fixture
+
+        # Test
+        actual = self.sut.to_host(1000)
+
+        # Assert
+        self.assertIsNone(actual)
+        self.assertFalse(self.sut.is_synced())
+
+    def test_that_the_fastest_packet_is_used_before_sync(self):
+        # Fixture
+        self.sut.update(1000, 5000.030)
+        self.sut.update(1010, 5000.015)
+
+        # Test
+        actual = self.sut.to_host(1100)
+
+        # Assert
+        self.assertAlmostEqual(5000.105, actual, places=6)
+
+    def test_that_offset_and_skew_are_estimated(self):
+        # Fixture
+        # The drone clock runs 100 ppm slow and packets are delayed by 5 to
+        # 25 ms, the fastest packet in each period is delayed by 5 ms
+        skew = 1.0001
+        for i in range(2000):
+            drone_ms = 10000 + i * 10
+            delay = 0.005 + (i * 7 % 5) * 0.005
+            self.sut.update(drone_ms, 100.0 + drone_ms / 1000.0 * skew +
+                            delay)
+
+        # Test
+        actual = self.sut.to_host(40000)
+
+        # Assert
+        self.assertTrue(self.sut.is_synced())
+        self.assertAlmostEqual(100.0 + 40.0 * skew + 0.005, actual,
+                               delta=0.001)
+        self.assertLess(self.sut.error, 0.001)
+
+    def test_that_delayed_periods_are_rejected(self):
+        # Fixture
+        for i in range(500):
+            self.sut.update(i * 10, 100.0 + i * 0.01)
+
+        # Test
+        # All packets of two seconds are delayed by 200 ms
+        for i in range(500, 700):
+            self.sut.update(i * 10, 100.2 + i * 0.01)
+        for i in range(700, 800):
+            self.sut.update(i * 10, 100.0 + i * 0.01)
+
+        # Assert
+        self.assertAlmostEqual(108.0, self.sut.to_host(8000), delta=0.001)
+
+    def test_that_estimate_is_restarted_when_clock_jumps_back(self):
+        # Fixture
+        for i in range(500):
+            self.sut.update(i * 10, 100.0 + i * 0.01)
+
+        # Test
+        # The drone is restarted and its clock starts over
+        for i in range(500):
+            self.sut.update(i * 10, 110.0 + i * 0.01)
+
+        # Assert
+        self.assertAlmostEqual(111.0, self.sut.to_host(1000), delta=0.001)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2016 Bitcraze AB
+#
+#  Espdrone Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import threading
+import time
+import unittest
+
+from edlib.utils.scheduler import Scheduler
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sut = Scheduler()
+        self.calls = []
+        self.called = threading.Event()
+
+    def test_that_call_is_made_after_delay(self):
+        # Fixture
+        start = time.monotonic()
+
+        # Test
+        self.sut.call_later(0.05, self._callback, 'token')
+
+        # Assert
+        self.assertTrue(self.called.wait(1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(['token'], self.calls)
+
+    def test_that_calls_are_made_in_deadline_order(self):
+        # Fixture
+
+        # Test
+        self.sut.call_later(0.06, self._callback, 3)
+        self.sut.call_later(0.02, self.calls.append, 1)
+        self.sut.call_later(0.04, self.calls.append, 2)
+
+        # Assert
+        self.assertTrue(self.called.wait(1))
+        self.assertEqual([1, 2, 3], self.calls)
+
+    def test_that_cancelled_call_is_not_made(self):
+        # Fixture
+        call = self.sut.call_later(0.02, self.calls.append, 'cancelled')
+        self.sut.call_later(0.04, self._callback, 'made')
+
+        # Test
+        call.cancel()
+
+        # Assert
+        self.assertTrue(self.called.wait(1))
+        self.assertEqual(['made'], self.calls)
+
+    def test_that_pending_calls_are_counted(self):
+        # Fixture
+        call = self.sut.call_later(10, self._callback, 1)
+        self.sut.call_later(10, self._callback, 2)
+
+        # Test
+        call.cancel()
+
+        # Assert
+        self.assertEqual(1, self.sut.pending())
+
+    def test_that_exception_in_callback_does_not_stop_scheduler(self):
+        # Fixture
+        self.sut.call_later(0, self._raise)
+
+        # Test
+        self.sut.call_later(0.02, self._callback, 'after')
+
+        # Assert
+        self.assertTrue(self.called.wait(1))
+        self.assertEqual(['after'], self.calls)
+
+    def test_that_periodic_call_is_made_on_absolute_deadlines(self):
+        # Fixture
+        start = time.monotonic()
+        done = threading.Event()
+
+        def callback():
+            self.calls.append(time.monotonic())
+            time.sleep(0.005)
+            if len(self.calls) == 5:
+                done.set()
+
+        # Test
+        call = self.sut.call_periodic(0.02, callback)
+
+        # Assert
+        self.assertTrue(done.wait(1))
+        call.cancel()
+        # The time spent in the callback must not add up over the calls
+        self.assertLess(self.calls[4] - start, 0.1 + 0.015)
+        self.assertGreaterEqual(self.calls[4] - start, 0.1)
+
+    def test_that_cancelled_periodic_call_is_not_made_again(self):
+        # Fixture
+        call = self.sut.call_periodic(0.01, self._callback, 'periodic')
+        self.assertTrue(self.called.wait(1))
+
+        # Test
+        call.cancel()
+        count = len(self.calls)
+        time.sleep(0.05)
+
+        # Assert
+        self.assertLessEqual(len(self.calls), count + 1)
+        self.assertEqual(0, self.sut.pending())
+
+    def test_that_missed_periods_are_skipped_and_counted(self):
+        # Fixture
+        done = threading.Event()
+
+        def callback():
+            self.calls.append(1)
+            if len(self.calls) == 1:
+                time.sleep(0.055)
+            elif len(self.calls) == 3:
+                done.set()
+
+        # Test
+        call = self.sut.call_periodic(0.02, callback)
+
+        # Assert
+        self.assertTrue(done.wait(1))
+        call.cancel()
+        stats = call.get_stats()
+        self.assertGreaterEqual(stats.calls, 2)
+        self.assertEqual(2, stats.missed)
+        self.assertGreaterEqual(stats.duration_max, 0.055)
+        self.assertGreaterEqual(stats.jitter_max, 0)
+
+    def test_that_non_positive_period_raises(self):
+        # Fixture
+
+        # Test
+        # Assert
+        with self.assertRaises(ValueError):
+            self.sut.call_periodic(0, self._callback, 'never')
+
+    def test_that_thread_exits_when_idle_and_restarts(self):
+        # Fixture
+        self.sut.IDLE_TIMEOUT = 0.02
+        threads = []
+        self.sut.call_later(0, lambda: threads.append(
+            threading.current_thread()))
+        self.sut.call_later(0, self._callback, 'first')
+        self.assertTrue(self.called.wait(1))
+        thread = threads[0]
+        thread.join(1)
+        self.called.clear()
+
+        # Test
+        self.sut.call_later(0, self._callback, 'second')
+
+        # Assert
+        self.assertTrue(self.called.wait(1))
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(['first', 'second'], self.calls)
+
+    def _callback(self, token):
+        self.calls.append(token)
+        self.called.set()
+
+    def _raise(self):
+        raise Exception('Failing callback')